@@ -0,0 +1,75 @@
+"""hot path indexes
+
+Revision ID: 7f3a9c1d2e4b
+Revises: cd2cdb335e90
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3a9c1d2e4b'
+down_revision: Union[str, None] = 'cd2cdb335e90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, table, columns, unique)
+INDEXES = [
+    ('ix_product_brand_id', 'product', ['brand_id'], False),
+    ('ix_product_approved_category_price', 'product', ['approved', 'category', 'price'], False),
+    ('ix_order_items_order_id', 'order_items', ['order_id'], False),
+    ('ix_order_items_product_id', 'order_items', ['product_id'], False),
+    ('ix_bills_order_id', 'bills', ['order_id'], True),
+    ('ix_orders_user_id', 'orders', ['user_id'], False),
+    ('ix_orders_status', 'orders', ['status'], False),
+    ('ix_brand_user_id', 'brand', ['user_id'], False),
+]
+
+# An interrupted CREATE INDEX CONCURRENTLY leaves an INVALID index behind,
+# which IF NOT EXISTS would then keep.
+INVALID_INDEX = text(
+    "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+    "WHERE c.relname = :name AND NOT i.indisvalid"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    CREATE INDEX CONCURRENTLY cannot run inside a transaction, hence the
+    autocommit block. The unique index on bills.order_id fails if an order
+    already has more than one bill; clean those up first. Invalid indexes
+    left by an interrupted earlier run are dropped and built again.
+    """
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        for name, table, columns, unique in INDEXES:
+            if bind.execute(INVALID_INDEX, {'name': name}).first():
+                op.drop_index(
+                    name, table_name=table, postgresql_concurrently=True
+                )
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=unique,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
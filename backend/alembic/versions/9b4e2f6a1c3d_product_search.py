@@ -0,0 +1,76 @@
+"""product search
+
+Revision ID: 9b4e2f6a1c3d
+Revises: 7f3a9c1d2e4b
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b4e2f6a1c3d'
+down_revision: Union[str, None] = '7f3a9c1d2e4b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple', coalesce({row}product_name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({row}category, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce({row}description, '')), 'C')
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column('product', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION product_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {SEARCH_VECTOR.format(row='NEW.')};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER product_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF product_name, category, description ON product
+        FOR EACH ROW EXECUTE FUNCTION product_search_vector_update()
+        """
+    )
+    op.execute(f"UPDATE product SET search_vector = {SEARCH_VECTOR.format(row='')}")
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_product_search_vector', 'product', ['search_vector'],
+            postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_product_name_trgm', 'product', ['product_name'],
+            postgresql_using='gin', postgresql_ops={'product_name': 'gin_trgm_ops'},
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_product_category_trgm', 'product', ['category'],
+            postgresql_using='gin', postgresql_ops={'category': 'gin_trgm_ops'},
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in ('ix_product_category_trgm', 'ix_product_name_trgm', 'ix_product_search_vector'):
+            op.drop_index(name, table_name='product', postgresql_concurrently=True, if_exists=True)
+    op.execute("DROP TRIGGER IF EXISTS product_search_vector_trigger ON product")
+    op.execute("DROP FUNCTION IF EXISTS product_search_vector_update()")
+    op.drop_column('product', 'search_vector')
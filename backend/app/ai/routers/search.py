@@ -1,23 +1,202 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import os
+import time
+from app import metrics
+from app.database import get_async_read_db
+from app.helpers.pagination import (
+    INVALID_CURSOR,
+    decode_rank_cursor,
+    encode_rank_cursor,
+)
 from app.models import Product, Brand
-from app.ai.utils.ai_search import (
-    detect_language,
-    generate_keywords,
-    get_most_similar_products,
+from app.ai.utils.ai_search import get_most_similar_products
+from app.ai.utils.keyword_cache import cached_keywords
+from app.ai.utils.lexicon import get_lexicon
+from app.ai.utils.normalization import detect_language, is_bengali
+from app.ai.utils.query_parser import (
+    QUERY_PARSER_MIN_CONFIDENCE,
+    get_vocabulary,
+    parse_query,
+    parse_time,
+)
+from app.ai.utils import fuzzy_match, product_index, suggestions, tfidf_ranking
+from app.ai.utils.fuzzy_match import FUZZY_CANDIDATES
+from app.ai.utils.suggestions import SUGGEST_LIMIT, SUGGEST_MAX_LIMIT
+from app.ai.utils.pg_search import (
+    SEARCH_LIMIT,
+    fulltext_search,
+    fuzzy_search,
+    keyword_terms,
+)
+
+# "postgres" ranks inside the database; "memory" matches against the
+# in-process product index and "tfidf" scores against an in-process TF-IDF
+# matrix, both only loading the products they return.
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "postgres").lower()
+MAX_SEARCH_LIMIT = 200
+# Results come from the backend's own matching, or, when that finds
+# nothing, from the fuzzy fallback; a cursor remembers which.
+MATCH_STAGE = "match"
+FUZZY_STAGE = "fuzzy"
+
+# Time per search spent waiting for the LLM (through the keyword cache), on
+# database round trips, matching in process (in the database for
+# "postgres", which counts as fetch) and building the JSON response.
+SEARCH_STAGES = ("llm", "fetch", "match", "serialize")
+stage_time = {stage: metrics.Histogram() for stage in SEARCH_STAGES}
+metrics.register(
+    "search_stages",
+    lambda: {stage: histogram.snapshot() for stage, histogram in stage_time.items()},
 )
 
 router = APIRouter()
 
+
+@contextmanager
+def timed_stage(stages: Dict[str, float], stage: str):
+    """Add the time spent in the block to ``stages[stage]``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[stage] = stages.get(stage, 0.0) + time.perf_counter() - started
+
+
+def valid_price_range(price_range) -> Optional[List[float]]:
+    """``[min, max]`` if the parsed range has both bounds, else None."""
+    if (
+        isinstance(price_range, list)
+        and len(price_range) == 2
+        and None not in price_range
+    ):
+        return price_range
+    return None
+
+
+async def hits_in_order(
+    db: AsyncSession, query, ranked: List[Tuple[int, float]], stages: Dict[str, float]
+) -> list:
+    """``(product, score)`` for the ``(product_id, score)`` pairs of
+    ``ranked``, in that order; ids ``query`` no longer matches (unapproved or
+    deleted since) are left out."""
+    if not ranked:
+        return []
+    with timed_stage(stages, "fetch"):
+        products = await db.scalars(
+            query.filter(Product.product_id.in_([i for i, _ in ranked]))
+        )
+    by_id = {p.product_id: p for p in products}
+    return [(by_id[i], score) for i, score in ranked if i in by_id]
+
+
+async def ranked_hits(db, query, rank, limit, after, stages, batch=0) -> list:
+    """``(product, score)`` for the best ``limit`` of the ids ``await
+    rank(count, after)`` ranks that ``query`` still returns, or None when
+    ``rank`` has nothing to rank with. The in-memory rankings keep deleted or
+    unapproved products until they are rebuilt, so ranking goes on past them
+    until ``limit`` hits survive or the ranking runs out."""
+    hits = []
+    while len(hits) < limit:
+        count = max(limit - len(hits), batch)
+        with timed_stage(stages, "match"):
+            ranked = await rank(count, after)
+        if ranked is None:
+            return None
+        hits += await hits_in_order(db, query, ranked, stages)
+        if len(ranked) < count:
+            break
+        after = (ranked[-1][1], ranked[-1][0])
+    return hits[:limit]
+
+
+async def matching_hits(db, query, terms, filters, limit, after, stages) -> list:
+    """The backend's best ``(product, score)`` hits for ``terms``."""
+    if SEARCH_BACKEND == "postgres":
+        with timed_stage(stages, "fetch"):
+            statement = fulltext_search(query, terms, limit, after)
+            return (await db.execute(statement)).all()
+
+    async def rank(count, after):
+        if SEARCH_BACKEND == "tfidf":
+            return tfidf_ranking.rank(terms, *filters, limit=count, after=after)
+        if product_index.index is not None:
+            return product_index.index.search(terms, *filters, count, after)
+        return []
+
+    return await ranked_hits(db, query, rank, limit, after, stages)
+
+
+async def fuzzy_hits(
+    db, query, terms, keywords, synonyms, filters, limit, after, stages
+) -> list:
+    """Misspelling-tolerant ``(product, score)`` hits, for when nothing
+    matches exactly."""
+    if SEARCH_BACKEND == "postgres":
+        with timed_stage(stages, "fetch"):
+            return (await db.execute(fuzzy_search(query, terms, limit, after))).all()
+
+    async def rank(count, after):
+        return await fuzzy_match.match_products(terms, count, after, filters)
+
+    # Match against the catalog cached in the match process, or, until it is
+    # loaded, scan the filtered rows.
+    hits = await ranked_hits(
+        db, query, rank, limit, after, stages, batch=FUZZY_CANDIDATES
+    )
+    if hits is not None:
+        return hits
+    with timed_stage(stages, "fetch"):
+        all_products = (await db.scalars(query.order_by(Product.product_id))).all()
+    print(f"Total products fetched from DB: {len(all_products)}")
+    with timed_stage(stages, "match"):
+        return await run_in_threadpool(
+            get_most_similar_products, all_products, keywords, synonyms, limit, after
+        )
+
+
 @router.get("/")
-def ai_product_search(
+async def ai_product_search(
     q: str = Query(..., description="Search query (Bangla/English)"),
-    db: Session = Depends(get_db),
+    limit: int = Query(SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    db: AsyncSession = Depends(get_async_read_db),
 ):
+    after = decode_rank_cursor(cursor) if cursor is not None else None
+    if after is not None and after.stage not in (MATCH_STAGE, FUZZY_STAGE):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=INVALID_CURSOR)
     lang = detect_language(q)
-    search_data = generate_keywords(q)
+    stages = {}
+    started = time.perf_counter()
+    vocabulary = await get_vocabulary(db)
+    parsed = parse_query(q, vocabulary)
+    translated = None
+    if parsed.confidence < QUERY_PARSER_MIN_CONFIDENCE and is_bengali(q):
+        translated = (await get_lexicon(db)).translate(q, vocabulary.terms)
+    if parsed.confidence >= QUERY_PARSER_MIN_CONFIDENCE:
+        path = "local"
+        search_data = parsed.as_filters()
+    elif translated and translated.keywords and not translated.unknown:
+        path = "lexicon"
+        search_data = translated.as_filters(parsed.price_range)
+    else:
+        path = "llm"
+        if translated and translated.keywords:
+            # Only the words the lexicon could not place go to the LLM.
+            with timed_stage(stages, "llm"):
+                search_data = await cached_keywords(" ".join(translated.unknown))
+            search_data = translated.merge(search_data)
+        else:
+            with timed_stage(stages, "llm"):
+                search_data = await cached_keywords(q)
+        if not search_data.get("price_range"):
+            search_data = {**search_data, "price_range": parsed.price_range}
+    parse_time[path].observe(time.perf_counter() - started)
 
     keywords_original = search_data.get("keywords", [])
     keywords_en = search_data.get("keywords_en", [])
@@ -29,37 +208,83 @@ def ai_product_search(
     print("Extracted AI original keywords:", keywords_original)
     print("Extracted AI English translated keywords:", keywords_en)
 
-    query = db.query(Product).filter(Product.approved == True)
+    query = select(Product).filter(Product.approved == True)
 
     if category:
         query = query.filter(Product.category.ilike(f"%{category}%"))
-    if price_range and isinstance(price_range, list) and len(price_range) == 2:
+    if valid_price_range(price_range):
         min_price, max_price = price_range
-        if min_price is not None and max_price is not None:
-            query = query.filter(Product.price >= min_price, Product.price <= max_price)
+        query = query.filter(Product.price >= min_price, Product.price <= max_price)
     if brand_name:
         query = query.join(Brand).filter(Brand.brand_name.ilike(f"%{brand_name}%"))
 
-    all_products = query.all()
-    print(f"Total products fetched from DB: {len(all_products)}")
-
-    
-    matched_products = get_most_similar_products(all_products, keywords_en, synonyms)
+    terms = keyword_terms(keywords_en, synonyms)
+    filters = (category, valid_price_range(price_range), brand_name)
+    stage = after.stage if after is not None else MATCH_STAGE
+    position = (after.score, after.key) if after is not None else None
+    # One hit more than the page tells whether there is a next one.
+    hits = []
+    if stage == MATCH_STAGE:
+        hits = await matching_hits(
+            db, query, terms, filters, limit + 1, position, stages
+        )
+        if not hits and after is None:
+            stage = FUZZY_STAGE
+    if stage == FUZZY_STAGE:
+        hits = await fuzzy_hits(
+            db,
+            query,
+            terms,
+            keywords_en,
+            synonyms,
+            filters,
+            limit + 1,
+            position,
+            stages,
+        )
+    page = hits[:limit]
+    next_cursor = None
+    if len(hits) > limit:
+        last, score = page[-1]
+        next_cursor = encode_rank_cursor(stage, score, last.product_id)
 
-    return {
-        "language": lang,
-        "keywords_used": keywords_en or keywords_original,
-        "total_found": len(matched_products),
-        "products": [
+    # Encoded here rather than by FastAPI, so the serialize stage covers it.
+    with timed_stage(stages, "serialize"):
+        response = JSONResponse(
             {
-                "product_id": p.product_id,
-                "name": p.product_name,
-                "category": p.category,
-                "price": str(p.price),
-                "description": p.description,
-                "images": p.product_pic,
-                "videos": p.product_video,
+                "language": lang,
+                "keywords_used": keywords_en or keywords_original,
+                # Products on this page; there is no total, next_cursor
+                # says whether more follow.
+                "count": len(page),
+                "products": [
+                    {
+                        "product_id": p.product_id,
+                        "name": p.product_name,
+                        "category": p.category,
+                        "price": str(p.price),
+                        "description": p.description,
+                        "images": p.product_pic,
+                        "videos": p.product_video,
+                        "score": score,
+                    }
+                    for p, score in page
+                ],
+                "next_cursor": next_cursor,
             }
-            for p in matched_products
-        ],
-    }
\ No newline at end of file
+        )
+    for stage, seconds in stages.items():
+        stage_time[stage].observe(seconds)
+    return response
+
+
+@router.get("/suggest")
+async def search_suggestions(
+    q: str = Query(..., min_length=1, description="What has been typed so far"),
+    limit: int = Query(SUGGEST_LIMIT, ge=1, le=SUGGEST_MAX_LIMIT),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    """Typeahead: the most popular product names, categories and brand names
+    with a word starting with ``q``, from memory, without the LLM."""
+    await suggestions.get_suggestions(db)
+    return {"query": q, "suggestions": suggestions.suggest(q, limit)}
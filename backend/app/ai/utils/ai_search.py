@@ -1,13 +1,23 @@
 from openai import AzureOpenAI
-from langdetect import detect
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
-from rapidfuzz import fuzz
 import os
 import json
 import re
 from typing import List, Union, Dict, Any
 
+import numpy as np
+
+from app.ai.utils.fuzzy_match import (
+    Catalog,
+    best_matches,
+    catalog_position,
+    product_text,
+)
+from app.ai.utils.normalization import normalize
+from app.ai.utils.pg_search import keyword_terms
+
+# Same query, same filters: cached keyword sets must not depend on sampling.
+GENERATION_SETTINGS = {"temperature": 0, "seed": 0}
+
 client = AzureOpenAI(
     api_key=os.getenv("AZURE_OPENAI_API_KEY"),
     api_version="2024-12-01-preview",
@@ -15,13 +25,6 @@ client = AzureOpenAI(
 )
 
 
-def detect_language(text: str) -> str:
-    try:
-        return detect(text)
-    except Exception:
-        return "en"
-
-
 def generate_keywords(query: str) -> Dict[str, Any]:
     prompt = f"""Extract product search filters and translate to English clearly from the user's input below.
       
@@ -38,7 +41,7 @@ Respond ONLY in valid JSON format clearly with this structure:
 
     response = client.chat.completions.create(
         model="gpt-4o",
-        temperature=0.5,
+        **GENERATION_SETTINGS,
         messages=[
             {
                 "role": "system",
@@ -62,7 +65,7 @@ Respond ONLY in valid JSON format clearly with this structure:
 
 
 def extract_price_range_from_text(text: str) -> Union[List[float], None]:
-    text = text.lower()
+    text = normalize(text)
 
     match_under = re.search(r"under\s*(\d+)", text)
     if match_under:
@@ -89,49 +92,21 @@ def extract_price_range_from_text(text: str) -> Union[List[float], None]:
     return None
 
 
-def get_most_similar_products(products, keywords, synonyms):
-    keyword_texts = []
-
-    for keyword in keywords:
-        keyword_texts.append(keyword.lower())
-
-        if keyword in synonyms:
-            for synonym in synonyms[keyword]:
-                keyword_texts.append(synonym.lower())
-
+def get_most_similar_products(products, keywords, synonyms, limit=None, after=None):
+    """``(product, similarity 0-1)`` of the best matches among ``products``,
+    which are in id order; ``after`` as for ``match_products``."""
+    keyword_texts = keyword_terms(keywords, synonyms)
     print(f"Enhanced Keywords for Search (including synonyms): {keyword_texts}")
 
-    matched_products = [
-        product
-        for product in products
-        if any(
-            keyword
-            in (
-                f"{product.product_name or ''} {product.category or ''} {product.description or ''}"
-            ).lower()
-            for keyword in keyword_texts
-        )
-    ]
-
-    if matched_products:
-        return matched_products
-
-    fuzzy_threshold = 68
-    fuzzy_matches = [
-        (
-            product,
-            fuzz.partial_ratio(
-                " ".join(keyword_texts),
-                (
-                    f"{product.product_name or ''} {product.category or ''} {product.description or ''}"
-                ).lower(),
-            ),
-        )
+    catalog = Catalog(
+        product_text(product.product_name, product.category, product.description)
         for product in products
-    ]
-    fuzzy_matches = sorted(
-        [(p, score) for p, score in fuzzy_matches if score >= fuzzy_threshold],
-        key=lambda x: x[1],
-        reverse=True,
     )
-    return [p for p, _ in fuzzy_matches]
+    ids = np.array([product.product_id for product in products], dtype=np.int64)
+    matches = best_matches(
+        catalog,
+        keyword_texts,
+        limit or len(products),
+        after=catalog_position(ids, after),
+    )
+    return [(products[i], score / 100) for i, score in matches]
@@ -0,0 +1,320 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import metrics
+from app.database import AsyncSessionLocal
+from app.models import Product
+from app.ai.utils.normalization import normalize
+from app.ai.utils.product_index import load_query
+
+FUZZY_SCORE_CUTOFF = int(os.getenv("FUZZY_SCORE_CUTOFF", "68"))
+# Threads rapidfuzz scores with inside the match process; -1 uses every core.
+FUZZY_WORKERS = int(os.getenv("FUZZY_WORKERS", "-1"))
+# Best fuzzy matches handed back per round. The request's filters apply
+# before this cut; the route asks for more when products changed since the
+# load drop out.
+FUZZY_CANDIDATES = int(os.getenv("FUZZY_CANDIDATES", "1000"))
+FUZZY_REFRESH_SECONDS = float(os.getenv("FUZZY_REFRESH_SECONDS", "300"))
+# Joins the catalog's texts; kept out of the texts and never searched for.
+SEPARATOR = "\0"
+
+
+def product_text(product_name, category, description) -> str:
+    text = normalize(f"{product_name or ''} {category or ''} {description or ''}")
+    return text.replace(SEPARATOR, " ")
+
+
+class Catalog:
+    """Pre-normalized product texts, also joined into one string so a term
+    is found verbatim with a single scan rather than a test per product."""
+
+    def __init__(self, texts: Sequence[str]):
+        self.texts = list(texts)
+        self.corpus = SEPARATOR.join(self.texts)
+        lengths = np.fromiter((len(text) + 1 for text in self.texts), np.int64)
+        self.starts = np.cumsum(lengths) - lengths
+
+    def __len__(self):
+        return len(self.texts)
+
+    def containing(
+        self,
+        term: str,
+        limit: int,
+        start: int = 0,
+        allowed: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Positions of the first ``limit`` texts from ``start`` on that
+        ``term`` occurs in, among the ``allowed`` ones if given."""
+        if start >= len(self.texts):
+            return np.empty(0, np.int64)
+        pattern = re.compile(re.escape(term))
+        offsets = (m.start() for m in pattern.finditer(self.corpus, self.starts[start]))
+        found = np.empty(0, np.int64)
+        while len(found) < limit:
+            # A text can hold the term more than once: read in batches until
+            # there are enough distinct texts.
+            batch = np.fromiter(itertools.islice(offsets, limit), np.int64)
+            if not len(batch):
+                break
+            texts = np.searchsorted(self.starts, batch, side="right") - 1
+            if allowed is not None:
+                texts = texts[allowed[texts]]
+            found = np.union1d(found, texts)
+        return found[:limit]
+
+
+def _containing(catalog: Catalog, terms: List[str], limit: int, start=0, allowed=None):
+    # The first ``limit`` texts of the union are among each term's first.
+    return np.unique(
+        np.concatenate(
+            [catalog.containing(term, limit, start, allowed) for term in terms]
+        )
+    )
+
+
+def _codes(values: List[str]):
+    """Distinct values and, per row, the index of its value."""
+    names, codes = np.unique(np.array(values, dtype=object), return_inverse=True)
+    return names, codes.astype(np.int32)
+
+
+class CatalogFilters:
+    """Lowercased category and brand name and the price of every catalog
+    text, so a search's filters apply before its best matches are cut."""
+
+    def __init__(self, categories: List[str], brands: List[str], prices: List[float]):
+        self.categories, self.category_codes = _codes(categories)
+        self.brands, self.brand_codes = _codes(brands)
+        self.prices = np.array(prices, dtype=np.float64)
+
+    @staticmethod
+    def _containing(names, codes, needle: str) -> np.ndarray:
+        # Each distinct value is checked once rather than once per text.
+        needle = needle.lower()
+        return np.array([needle in name for name in names], dtype=bool)[codes]
+
+    def allowed(
+        self,
+        category: Optional[str] = None,
+        price_range: Optional[List[float]] = None,
+        brand: Optional[str] = None,
+    ) -> Optional[np.ndarray]:
+        """Mask of the texts passing the filters, None if there are none.
+        ``category`` and ``brand`` are case-insensitive substrings, like the
+        SQL filters; a text without a price fails a price range."""
+        if not (category or price_range or brand):
+            return None
+        keep = np.ones(len(self.prices), dtype=bool)
+        if price_range:
+            keep &= (self.prices >= price_range[0]) & (self.prices <= price_range[1])
+        if category:
+            keep &= self._containing(self.categories, self.category_codes, category)
+        if brand:
+            keep &= self._containing(self.brands, self.brand_codes, brand)
+        return keep
+
+
+def best_matches(
+    catalog: Catalog,
+    terms: List[str],
+    limit: int,
+    workers: int = FUZZY_WORKERS,
+    after: Optional[Tuple[int, int]] = None,
+    allowed: Optional[np.ndarray] = None,
+) -> List[Tuple[int, int]]:
+    """``(position in catalog, score)`` of the ``limit`` best matches, best
+    first, then in catalog order, starting past ``after``, the ``(score,
+    position)`` of the previous page's last match. Only the texts ``allowed``
+    (a boolean mask over the catalog) are considered, if it is given.
+
+    Texts containing one of ``terms`` verbatim score 100. Only when there are
+    fewer than ``limit`` of those is every text scored on the ``partial_ratio``
+    of all terms together, in one batch, keeping those above
+    ``FUZZY_SCORE_CUTOFF``.
+    """
+    terms = [term for term in terms if SEPARATOR not in term]
+    if not len(catalog) or not terms or limit <= 0:
+        return []
+    if after is None or after[0] == 100:
+        start = 0 if after is None else after[1] + 1
+        exact = _containing(catalog, terms, limit, start, allowed)
+        if len(exact) >= limit:
+            return [(int(i), 100) for i in exact[:limit]]
+    if after is not None:
+        # All of them, also those before ``after``, to tell them apart from
+        # the fuzzy matches.
+        exact = _containing(catalog, terms, len(catalog), allowed=allowed)
+
+    if allowed is None:
+        positions, texts = None, catalog.texts
+    else:
+        positions = np.flatnonzero(allowed)
+        texts = [catalog.texts[i] for i in positions]
+    scored = process.cdist(
+        [" ".join(terms)],
+        texts,
+        scorer=fuzz.partial_ratio,
+        score_cutoff=FUZZY_SCORE_CUTOFF,
+        dtype=np.uint8,
+        workers=workers,
+    )[0]
+    if positions is None:
+        scores = scored
+    else:
+        scores = np.zeros(len(catalog), dtype=np.uint8)
+        scores[positions] = scored
+    scores[exact] = 100
+    hits = np.flatnonzero(scores)
+    if after is not None:
+        found = scores[hits]
+        hits = hits[(found < after[0]) | ((found == after[0]) & (hits > after[1]))]
+    # One sort key for score, then position, so that the cut at ``limit``
+    # does not pick among tied scores at random.
+    keys = (100 - scores[hits].astype(np.int64)) * len(catalog) + hits
+    if len(keys) > limit:
+        keys = np.partition(keys, limit - 1)[:limit]
+    hits = np.sort(keys) % len(catalog)
+    return [(int(i), int(scores[i])) for i in hits]
+
+
+# The catalog lives in a single match process, so neither the scoring nor
+# the catalog's memory is on the event loop; rapidfuzz spreads each search
+# over FUZZY_WORKERS threads there.
+_pool: Optional[ProcessPoolExecutor] = None
+_catalog_size: Optional[int] = None  # None until the match process has one
+
+match_time = metrics.Histogram()
+catalog_stats = {"loads": 0, "failures": 0}
+metrics.register(
+    "fuzzy_match",
+    lambda: {
+        **catalog_stats,
+        "products": _catalog_size or 0,
+        "match": match_time.snapshot(),
+    },
+)
+
+# Set in the match process only.
+_ids = np.empty(0, dtype=np.int64)
+_catalog = Catalog([])
+_filters = CatalogFilters([], [], [])
+
+
+def _load(ids, texts, filters):
+    global _ids, _catalog, _filters
+    _ids, _catalog, _filters = ids, Catalog(texts), filters
+
+
+def catalog_position(ids: np.ndarray, after: Optional[Tuple[float, int]]):
+    """``after``, a ``(similarity 0-1, product_id)`` pair, as the ``(score,
+    position)`` ``best_matches`` takes, for a catalog sorted by ``ids``."""
+    if after is None:
+        return None
+    score, product_id = after
+    return round(score * 100), int(np.searchsorted(ids, product_id, "right")) - 1
+
+
+def _match(
+    terms: List[str],
+    limit: int,
+    workers: int,
+    after: Optional[Tuple[float, int]],
+    filters: Sequence,
+) -> List[Tuple[int, int]]:
+    after = catalog_position(_ids, after)
+    allowed = _filters.allowed(*filters)
+    return [
+        (int(_ids[i]), score)
+        for i, score in best_matches(_catalog, terms, limit, workers, after, allowed)
+    ]
+
+
+def _reset():
+    global _pool, _catalog_size
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool, _catalog_size = None, None
+
+
+async def set_catalog(rows):
+    """Send the approved products of ``rows`` (as ``load_query`` returns
+    them) to the match process, starting it if needed."""
+    global _pool, _catalog_size
+    # In id order, so ties in catalog order are ties in id order.
+    rows = sorted((row for row in rows if row.approved), key=lambda row: row.product_id)
+    ids = np.array([row.product_id for row in rows], dtype=np.int64)
+    texts = [
+        product_text(row.product_name, row.category, row.description) for row in rows
+    ]
+    filters = CatalogFilters(
+        [(row.category or "").lower() for row in rows],
+        [(row.brand_name or "").lower() for row in rows],
+        [np.nan if row.price is None else float(row.price) for row in rows],
+    )
+    if _pool is None:
+        # spawn: forking a process that runs an event loop and threads is unsafe.
+        _pool = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"))
+    await asyncio.get_running_loop().run_in_executor(_pool, _load, ids, texts, filters)
+    _catalog_size = len(ids)
+    catalog_stats["loads"] += 1
+
+
+async def match_products(
+    terms: List[str],
+    limit: int,
+    after: Optional[Tuple[float, int]] = None,
+    filters: Sequence = (),
+) -> Optional[List[Tuple[int, float]]]:
+    """``(product_id, similarity 0-1)`` of the best fuzzy matches for
+    ``terms`` among the products passing ``filters`` (``category,
+    price_range, brand``), best first, then by id, starting past ``after``
+    (the last pair of the previous page), or None while there is no catalog
+    to match against."""
+    if _catalog_size is None:
+        return None
+    started = time.perf_counter()
+    try:
+        matches = await asyncio.get_running_loop().run_in_executor(
+            _pool, _match, terms, limit, FUZZY_WORKERS, after, tuple(filters)
+        )
+    except BrokenProcessPool as e:
+        print(f"Fuzzy match process died: {e}")
+        catalog_stats["failures"] += 1
+        _reset()
+        return None
+    finally:
+        match_time.observe(time.perf_counter() - started)
+    return [(product_id, score / 100) for product_id, score in matches]
+
+
+async def maintain_catalog():
+    """Load the catalog into the match process, then reload it every
+    ``FUZZY_REFRESH_SECONDS``; a dead match process is replaced then."""
+    try:
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    result = await db.stream(
+                        load_query().filter(Product.approved == True)
+                    )
+                    rows = [row async for row in result]
+                await set_catalog(rows)
+            except (SQLAlchemyError, BrokenProcessPool) as e:
+                print(f"Fuzzy match catalog load failed: {e}")
+                catalog_stats["failures"] += 1
+                _reset()
+            await asyncio.sleep(FUZZY_REFRESH_SECONDS)
+    finally:
+        _reset()
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict
+
+from fastapi.concurrency import run_in_threadpool
+from redis.exceptions import RedisError
+
+from app import cache, metrics
+from app.ai.utils import lexicon
+from app.ai.utils.ai_search import generate_keywords
+from app.ai.utils.normalization import normalize
+
+KEYWORD_CACHE_TTL_SECONDS = int(os.getenv("KEYWORD_CACHE_TTL_SECONDS", "86400"))
+KEYWORD_CACHE_L1_SIZE = int(os.getenv("KEYWORD_CACHE_L1_SIZE", "4096"))
+KEYWORD_CACHE_L1_TTL_SECONDS = float(os.getenv("KEYWORD_CACHE_L1_TTL_SECONDS", "300"))
+# An entry hit this many times in a worker is refreshed in the background
+# once less than KEYWORD_REFRESH_AHEAD of its TTL remains.
+KEYWORD_REFRESH_MIN_HITS = int(os.getenv("KEYWORD_REFRESH_MIN_HITS", "3"))
+KEYWORD_REFRESH_AHEAD = float(os.getenv("KEYWORD_REFRESH_AHEAD", "0.2"))
+
+# Bump when the prompt, the generation settings or `normalize` change.
+KEY_PREFIX = "keywords:v2:"
+
+
+class Entry:
+    __slots__ = ("data", "expires_at", "hits")
+
+    def __init__(self, data: Dict[str, Any], expires_at: float):
+        self.data = data
+        self.expires_at = expires_at  # wall clock, shared with Redis
+        self.hits = 0
+
+
+l1 = cache.LRUCache(KEYWORD_CACHE_L1_SIZE, KEYWORD_CACHE_L1_TTL_SECONDS)
+# Normalized query -> task generating it, so concurrent misses and refreshes
+# of one query make a single LLM call.
+_in_flight: Dict[str, asyncio.Task] = {}
+
+llm_time = metrics.Histogram()
+keyword_stats = {
+    "l1_hits": 0,
+    "redis_hits": 0,
+    "misses": 0,
+    "refreshes": 0,
+    "not_cached": 0,
+}
+metrics.register(
+    "keyword_cache",
+    lambda: {**keyword_stats, "l1_size": len(l1), "llm": llm_time.snapshot()},
+)
+
+
+def redis_key(normalized: str) -> str:
+    return KEY_PREFIX + hashlib.sha1(normalized.encode()).hexdigest()
+
+
+async def _redis_get(normalized: str):
+    if not cache.redis_available():
+        return None
+    try:
+        value = await cache.redis_client.get(redis_key(normalized))
+    except RedisError as e:
+        cache.redis_failed(e)
+        return None
+    if value is None:
+        return None
+    stored = json.loads(value)
+    return Entry(stored["data"], stored["expires_at"])
+
+
+async def _redis_set(normalized: str, entry: Entry):
+    if not cache.redis_available():
+        return
+    value = json.dumps({"data": entry.data, "expires_at": entry.expires_at})
+    try:
+        await cache.redis_client.set(
+            redis_key(normalized), value, ex=KEYWORD_CACHE_TTL_SECONDS
+        )
+    except RedisError as e:
+        cache.redis_failed(e)
+
+
+async def _generate(normalized: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        data = await run_in_threadpool(generate_keywords, normalized)
+    finally:
+        llm_time.observe(time.perf_counter() - started)
+    # Each answer votes once, however many searches it then serves.
+    lexicon.learn(data)
+    # generate_keywords answers an unparseable reply with empty keywords;
+    # keep those out so the next search asks again.
+    if not data.get("keywords_en") and not data.get("keywords"):
+        keyword_stats["not_cached"] += 1
+        return data
+    entry = Entry(data, time.time() + KEYWORD_CACHE_TTL_SECONDS)
+    l1.set(normalized, entry)
+    await _redis_set(normalized, entry)
+    return data
+
+
+def _generate_once(normalized: str) -> asyncio.Task:
+    task = _in_flight.get(normalized)
+    if task is None:
+        task = asyncio.create_task(_generate(normalized))
+        _in_flight[normalized] = task
+        task.add_done_callback(lambda _: _in_flight.pop(normalized, None))
+    return task
+
+
+def _refresh_ahead(normalized: str, entry: Entry):
+    entry.hits += 1
+    remaining = entry.expires_at - time.time()
+    if (
+        entry.hits >= KEYWORD_REFRESH_MIN_HITS
+        and remaining < KEYWORD_REFRESH_AHEAD * KEYWORD_CACHE_TTL_SECONDS
+        and normalized not in _in_flight
+    ):
+        keyword_stats["refreshes"] += 1
+        _generate_once(normalized).add_done_callback(_log_refresh_failure)
+
+
+def _log_refresh_failure(task: asyncio.Task):
+    # Nobody awaits a refresh, so its error would otherwise be lost.
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Keyword refresh failed: {task.exception()}")
+
+
+async def cached_keywords(query: str) -> Dict[str, Any]:
+    """``generate_keywords(query)`` from this worker's LRU, then Redis, then
+    the LLM. Popular entries are regenerated in the background before they
+    expire, so their searches never wait on the LLM."""
+    normalized = normalize(query)
+    entry = l1.get(normalized)
+    if entry is not None and entry.expires_at > time.time():
+        keyword_stats["l1_hits"] += 1
+        _refresh_ahead(normalized, entry)
+        return entry.data
+
+    entry = await _redis_get(normalized)
+    if entry is not None:
+        keyword_stats["redis_hits"] += 1
+        l1.set(normalized, entry)
+        _refresh_ahead(normalized, entry)
+        return entry.data
+
+    keyword_stats["misses"] += 1
+    return await asyncio.shield(_generate_once(normalized))
@@ -0,0 +1,475 @@
+"""Bangla -> English search terms known without asking the LLM.
+
+The glossary and the catalog's names are seeded at startup. An LLM keyword
+answer only votes for the translations and synonyms it gives
+(``search_lexicon_votes``); a pair becomes a ``search_lexicon`` entry with
+source "llm" once ``LEXICON_MIN_VOTES`` answers agree, and the glossary or a
+catalog name with the same term replaces it on the next seed.
+
+To purge a bad learned entry, delete it with its votes, or the next agreeing
+answers bring it back:
+
+    DELETE FROM search_lexicon WHERE term = 'ঢাকাই' AND source = 'llm';
+    DELETE FROM search_lexicon_votes WHERE term = 'ঢাকাই';
+
+Workers forget it on their next refresh (``LEXICON_REFRESH_SECONDS``). The
+answer that taught it stays in the keyword cache until it expires
+(``KEYWORD_CACHE_TTL_SECONDS``); bump ``keyword_cache.KEY_PREFIX`` to drop
+every cached answer at once.
+"""
+
+import asyncio
+import os
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import literal_column, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app.database import AsyncSessionLocal
+from app.models import Brand, LexiconTerm, LexiconVote, Product
+from app.ai.utils.normalization import WORD, STOPWORDS, is_bengali, normalize, stem
+from app.ai.utils.query_parser import PRICE_PHRASE
+
+LEXICON_REFRESH_SECONDS = float(os.getenv("LEXICON_REFRESH_SECONDS", "300"))
+# LLM answers that must agree on a translation or synonym before it is saved.
+LEXICON_MIN_VOTES = int(os.getenv("LEXICON_MIN_VOTES", "3"))
+LEXICON_SAVE_SECONDS = float(os.getenv("LEXICON_SAVE_SECONDS", "5"))
+MAX_TERM_WORDS = 3
+MAX_ENTRY_LENGTH = 255  # the lexicon's String(255) columns
+MAX_PENDING_VOTES = 10000
+SEED_BATCH_SIZE = 5000
+
+# Handicraft words worth knowing before the first search; the catalog's names
+# and the LLM's answers add the rest.
+GLOSSARY = {
+    "শাড়ি": "saree",
+    "জামদানি": "jamdani",
+    "মসলিন": "muslin",
+    "তাঁত": "tant",
+    "কাতান": "katan",
+    "বেনারসি": "benarasi",
+    "সিল্ক": "silk",
+    "রেশম": "silk",
+    "রেশমি": "silk",
+    "সুতি": "cotton",
+    "নকশি কাঁথা": "nakshi kantha",
+    "কাঁথা": "kantha",
+    "নকশি": "nakshi",
+    "পাট": "jute",
+    "পাটের": "jute",
+    "ঝুড়ি": "basket",
+    "মাটির": "clay",
+    "মাটি": "clay",
+    "পোড়ামাটি": "terracotta",
+    "মৃৎশিল্প": "pottery",
+    "শাল": "shawl",
+    "চাদর": "shawl",
+    "পিতল": "brass",
+    "পিতলের": "brass",
+    "কাঁসা": "bell metal",
+    "বাঁশ": "bamboo",
+    "বাঁশের": "bamboo",
+    "বেত": "cane",
+    "বেতের": "cane",
+    "শীতল পাটি": "shital pati",
+    "পাটি": "mat",
+    "মাদুর": "mat",
+    "কাঠ": "wooden",
+    "কাঠের": "wooden",
+    "খেলনা": "toy",
+    "পুতুল": "doll",
+    "চামড়া": "leather",
+    "চামড়ার": "leather",
+    "ব্যাগ": "bag",
+    "গয়না": "jewellery",
+    "গহনা": "jewellery",
+    "মালা": "necklace",
+    "চুড়ি": "bangle",
+    "কানের দুল": "earrings",
+    "দুল": "earrings",
+    "পাঞ্জাবি": "panjabi",
+    "ফতুয়া": "fatua",
+    "লুঙ্গি": "lungi",
+    "গামছা": "gamchha",
+    "ওড়না": "orna",
+    "হাতে বোনা": "handwoven",
+    "হস্তশিল্প": "handicraft",
+    "শোপিস": "showpiece",
+    "লাল": "red",
+    "নীল": "blue",
+    "সবুজ": "green",
+    "হলুদ": "yellow",
+    "সাদা": "white",
+    "কালো": "black",
+    "সোনালী": "golden",
+}
+
+
+def _words(text: str) -> List[str]:
+    return WORD.findall(PRICE_PHRASE.sub(" ", normalize(text)))
+
+
+@dataclass
+class Translation:
+    keywords: List[str]  # as written in the query
+    keywords_en: List[str]
+    synonyms: Dict[str, List[str]]
+    unknown: List[str]  # words the lexicon could not place
+
+    def as_filters(self, price_range: Optional[List[float]]) -> Dict[str, Any]:
+        """The shape ``generate_keywords`` returns."""
+        return {
+            "keywords": self.keywords,
+            "keywords_en": self.keywords_en,
+            "category": None,
+            "price_range": price_range,
+            "brand": None,
+            "synonyms": self.synonyms,
+        }
+
+    def merge(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """``data``, the LLM's answer for the unknown words, with the words
+        the lexicon did place added in front."""
+        return {
+            **data,
+            "keywords": self.keywords + list(data.get("keywords") or []),
+            "keywords_en": self.keywords_en + list(data.get("keywords_en") or []),
+            "synonyms": {**(data.get("synonyms") or {}), **self.synonyms},
+        }
+
+
+class Lexicon:
+    """Normalized term -> English translation, English term -> synonyms, and
+    the names searched as written. Strings are interned, since the same
+    English words recur across many entries."""
+
+    def __init__(self, rows: Iterable[Tuple[str, Optional[str], list, str]] = ()):
+        """``rows`` of term, translation, synonyms and source, on top of the
+        glossary."""
+        self.translations: Dict[str, str] = {}
+        self.synonyms: Dict[str, Tuple[str, ...]] = {}
+        self.verbatim: Set[str] = set()
+        self.max_words = 1
+        for term, english in GLOSSARY.items():
+            self.add(term, english)
+        for term, translation, synonyms, source in rows:
+            self.add(term, translation, synonyms, verbatim=source == "catalog")
+
+    def __len__(self):
+        return len(self.translations) + len(self.verbatim)
+
+    def add(
+        self,
+        term: str,
+        translation: Optional[str] = None,
+        synonyms: Iterable[str] = (),
+        verbatim: bool = False,
+    ) -> bool:
+        """Record what is new about ``term``; whether anything was."""
+        term = sys.intern(normalize(term))
+        if not term:
+            return False
+        changed = False
+        if translation and term not in self.translations:
+            self.translations[term] = sys.intern(normalize(translation))
+            changed = True
+        if verbatim and term not in self.verbatim:
+            self.verbatim.add(term)
+            changed = True
+        known = self.synonyms.get(term, ())
+        new = [
+            sys.intern(word)
+            for word in dict.fromkeys(map(normalize, synonyms))
+            if word and word != term and word not in known
+        ]
+        if new:
+            self.synonyms[term] = known + tuple(new)
+            changed = True
+        if changed:
+            self.max_words = min(MAX_TERM_WORDS, max(self.max_words, len(term.split())))
+        return changed
+
+    def _place(self, phrase: str, catalog_words: FrozenSet[str]) -> Optional[str]:
+        english = self.translations.get(phrase)
+        if english is None:
+            # শাড়িগুলো, মাটির: the glossary has the stems.
+            english = self.translations.get(" ".join(map(stem, phrase.split())))
+        if english is None and (phrase in self.verbatim or phrase in catalog_words):
+            english = phrase
+        return english
+
+    def translate(
+        self, query: str, catalog_words: FrozenSet[str] = frozenset()
+    ) -> Translation:
+        """Longest known terms of ``query``, left to right. Words the catalog
+        contains (``catalog_words``) count as known and are kept as written."""
+        words = [
+            word
+            for word in _words(query)
+            if word not in STOPWORDS and not word.isdigit()
+        ]
+        keywords, keywords_en, synonyms, unknown = [], [], {}, []
+        i = 0
+        while i < len(words):
+            for size in range(min(self.max_words, len(words) - i), 0, -1):
+                phrase = " ".join(words[i : i + size])
+                english = self._place(phrase, catalog_words)
+                if english is not None:
+                    keywords.append(phrase)
+                    keywords_en.append(english)
+                    alternatives = self.synonyms.get(english) or self.synonyms.get(
+                        phrase
+                    )
+                    if alternatives:
+                        synonyms[english] = list(alternatives)
+                    i += size
+                    break
+            else:
+                unknown.append(words[i])
+                i += 1
+        return Translation(keywords, keywords_en, synonyms, unknown)
+
+    def candidates(self, data: Dict[str, Any]) -> Set[Tuple[str, str, str]]:
+        """The term, kind ("translation" or "synonym") and value of each
+        Bangla -> English pair and synonym an LLM keyword answer adds to what
+        is known. Anything longer than the lexicon's columns is left out."""
+        found = set()
+        answered = {}
+        keywords = data.get("keywords") or []
+        keywords_en = data.get("keywords_en") or []
+        if len(keywords) == len(keywords_en):  # paired only when aligned
+            for term, english in zip(keywords, keywords_en):
+                if (
+                    isinstance(term, str)
+                    and isinstance(english, str)
+                    and is_bengali(term)
+                    and not is_bengali(english)
+                ):
+                    term, english = normalize(term), normalize(english)
+                    answered[term] = english
+                    if (
+                        term
+                        and english
+                        and term not in self.translations
+                        and len(term) <= MAX_ENTRY_LENGTH
+                        and len(english) <= MAX_ENTRY_LENGTH
+                    ):
+                        found.add((term, "translation", english))
+        synonyms = data.get("synonyms")
+        if isinstance(synonyms, dict):
+            for keyword, words in synonyms.items():
+                if not isinstance(keyword, str) or not isinstance(words, list):
+                    continue
+                term = normalize(keyword)
+                term = self.translations.get(term) or answered.get(term, term)
+                if not term or len(term) > MAX_ENTRY_LENGTH:
+                    continue
+                known = self.synonyms.get(term, ())
+                for word in words:
+                    word = normalize(word) if isinstance(word, str) else ""
+                    if (
+                        word
+                        and word != term
+                        and word not in known
+                        and len(word) <= MAX_ENTRY_LENGTH
+                    ):
+                        found.add((term, "synonym", word))
+        return found
+
+
+_lexicon: Optional[Lexicon] = None
+_lexicon_lock = asyncio.Lock()
+
+# (term, kind, value) -> LLM answers for it not yet saved.
+_pending_votes: Dict[Tuple[str, str, str], int] = {}
+
+lexicon_stats = {"votes": 0, "dropped_votes": 0, "learned": 0}
+metrics.register(
+    "lexicon",
+    lambda: {
+        **lexicon_stats,
+        "pending_votes": len(_pending_votes),
+        "translations": len(_lexicon.translations) if _lexicon else 0,
+        "verbatim": len(_lexicon.verbatim) if _lexicon else 0,
+        "synonyms": len(_lexicon.synonyms) if _lexicon else 0,
+    },
+)
+
+
+async def load_lexicon(db: AsyncSession) -> Lexicon:
+    rows = await db.execute(
+        select(
+            LexiconTerm.term,
+            LexiconTerm.translation,
+            LexiconTerm.synonyms,
+            LexiconTerm.source,
+        )
+    )
+    return Lexicon(rows)
+
+
+async def get_lexicon(db: AsyncSession) -> Lexicon:
+    """The worker's lexicon, loaded with ``db`` on first use and then kept
+    fresh by ``refresh_lexicon``."""
+    global _lexicon
+    if _lexicon is None:
+        async with _lexicon_lock:
+            if _lexicon is None:
+                _lexicon = await load_lexicon(db)
+    return _lexicon
+
+
+def _upsert(entries: List[Dict[str, Any]], learned: bool):
+    statement = insert(LexiconTerm).values(entries)
+    if not learned:
+        # The glossary and the catalog replace what the LLM taught.
+        return statement.on_conflict_do_update(
+            index_elements=[LexiconTerm.term],
+            set_={
+                "translation": statement.excluded.translation,
+                "source": statement.excluded.source,
+                "updated_at": literal_column("now()"),
+            },
+            where=LexiconTerm.source == "llm",
+        )
+    # The first agreed translation wins, and only on entries the LLM taught;
+    # synonyms accumulate across workers.
+    return statement.on_conflict_do_update(
+        index_elements=[LexiconTerm.term],
+        set_={
+            "translation": literal_column(
+                "CASE WHEN search_lexicon.source = 'llm' THEN coalesce("
+                "search_lexicon.translation, excluded.translation) "
+                "ELSE search_lexicon.translation END"
+            ),
+            "synonyms": literal_column(
+                "ARRAY(SELECT DISTINCT unnest("
+                "search_lexicon.synonyms || excluded.synonyms))"
+            ),
+            "updated_at": literal_column("now()"),
+        },
+    ).returning(
+        LexiconTerm.term,
+        LexiconTerm.translation,
+        LexiconTerm.synonyms,
+        LexiconTerm.source,
+    )
+
+
+async def seed_lexicon(db: AsyncSession):
+    """Save the glossary and the catalog's category and brand names over any
+    entry the LLM taught, leaving the others alone."""
+    categories = await db.scalars(
+        select(Product.category).filter(Product.approved == True).distinct()
+    )
+    brands = await db.scalars(select(Brand.brand_name))
+    entries = {
+        normalize(term): {"translation": english, "source": "glossary"}
+        for term, english in GLOSSARY.items()
+    }
+    for name in [*categories, *brands]:
+        term = normalize(name or "")
+        if term and len(term) <= MAX_ENTRY_LENGTH:
+            entries.setdefault(term, {"translation": None, "source": "catalog"})
+    rows = [{"term": term, **entry} for term, entry in entries.items()]
+    for start in range(0, len(rows), SEED_BATCH_SIZE):
+        await db.execute(_upsert(rows[start : start + SEED_BATCH_SIZE], False))
+    await db.commit()
+
+
+def learn(data: Dict[str, Any]):
+    """Count an LLM answer's vote for each translation and synonym it adds;
+    ``save_learned`` saves the votes and the entries enough answers agree
+    on. Called once per answer generated, not per search it serves."""
+    if _lexicon is None:
+        return
+    for key in _lexicon.candidates(data):
+        if key not in _pending_votes and len(_pending_votes) >= MAX_PENDING_VOTES:
+            lexicon_stats["dropped_votes"] += 1
+            continue
+        _pending_votes[key] = _pending_votes.get(key, 0) + 1
+        lexicon_stats["votes"] += 1
+
+
+def _vote(rows: List[Dict[str, Any]]):
+    statement = insert(LexiconVote).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=[LexiconVote.term, LexiconVote.kind, LexiconVote.value],
+        set_={
+            "votes": LexiconVote.votes + statement.excluded.votes,
+            "updated_at": literal_column("now()"),
+        },
+    ).returning(
+        LexiconVote.term, LexiconVote.kind, LexiconVote.value, LexiconVote.votes
+    )
+
+
+async def save_learned(db: AsyncSession) -> int:
+    """Save the pending votes, then the entries that now have
+    ``LEXICON_MIN_VOTES`` and add them to this worker's lexicon; other workers
+    pick them up on their next refresh. Returns how many were saved."""
+    global _pending_votes
+    if not _pending_votes:
+        return 0
+    pending, _pending_votes = _pending_votes, {}
+    rows = [
+        {"term": term, "kind": kind, "value": value, "votes": votes}
+        for (term, kind, value), votes in pending.items()
+    ]
+    agreed: Dict[str, Dict[str, Any]] = {}
+    for start in range(0, len(rows), SEED_BATCH_SIZE):
+        voted = await db.execute(_vote(rows[start : start + SEED_BATCH_SIZE]))
+        for term, kind, value, votes in voted:
+            if votes < LEXICON_MIN_VOTES:
+                continue
+            entry = agreed.setdefault(
+                term,
+                {"term": term, "translation": None, "synonyms": [], "source": "llm"},
+            )
+            if kind == "translation":
+                entry["translation"] = entry["translation"] or value
+            else:
+                entry["synonyms"].append(value)
+    saved = []
+    entries = list(agreed.values())
+    for start in range(0, len(entries), SEED_BATCH_SIZE):
+        saved += await db.execute(
+            _upsert(entries[start : start + SEED_BATCH_SIZE], True)
+        )
+    await db.commit()
+    if _lexicon is not None:
+        for term, translation, synonyms, source in saved:
+            _lexicon.add(term, translation, synonyms, verbatim=source == "catalog")
+    lexicon_stats["learned"] += len(saved)
+    return len(saved)
+
+
+async def save_learned_terms():
+    """Save what the LLM's answers taught every ``LEXICON_SAVE_SECONDS``, off
+    the search request."""
+    while True:
+        await asyncio.sleep(LEXICON_SAVE_SECONDS)
+        try:
+            async with AsyncSessionLocal() as db:
+                await save_learned(db)
+        except SQLAlchemyError as e:
+            print(f"Saving learned lexicon entries failed: {e}")
+
+
+async def refresh_lexicon():
+    """Seed the lexicon table, then reload the lexicon every
+    ``LEXICON_REFRESH_SECONDS`` so other workers' entries become known."""
+    global _lexicon
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await seed_lexicon(db)
+                _lexicon = await load_lexicon(db)
+        except SQLAlchemyError as e:
+            print(f"Lexicon refresh failed: {e}")
+        await asyncio.sleep(LEXICON_REFRESH_SECONDS)
@@ -0,0 +1,97 @@
+"""Text normalization shared by the search indexes and the query path, so a
+product and a query that mean the same words produce the same tokens."""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, Optional
+
+BENGALI = re.compile(r"[\u0980-\u09ff]")
+# \w leaves out the Bengali vowel signs, which would split most words.
+WORD = re.compile(r"[\w\u0980-\u09ff]+")
+
+# Bengali digits become ASCII ones so prices parse; zero-width joiners only
+# change how Bengali renders, not what it says.
+TRANSLATION = {
+    **{ord(digit): str(value) for value, digit in enumerate("০১২৩৪৫৬৭৮৯")},
+    0x200C: None,
+    0x200D: None,
+    0xFEFF: None,
+}
+TRANSLATED = re.compile("[%s]" % "".join(map(chr, TRANSLATION)))
+
+ENGLISH_STOPWORDS = frozenset(
+    "a an and any buy cheap for find i in is looking me need of on please "
+    "show some the to want with".split()
+)
+BENGALI_STOPWORDS = frozenset(
+    unicodedata.normalize(
+        "NFKC",
+        "আমি আমার আমাকে চাই লাগবে একটি একটা কিছু কোনো দেখাও দেখান দাও দিন "
+        "জন্য এর ও এবং আর সাথে সহ কম দাম দামে দামের দামী টাকা টাকার টাকায় "
+        "নিচে নিচের মধ্যে থেকে পর্যন্ত ভালো সুন্দর কিনতে কিনব খুঁজছি",
+    ).split()
+)
+STOPWORDS = ENGLISH_STOPWORDS | BENGALI_STOPWORDS
+
+# Plural and case endings, longest first. Short endings such as -টি or -তে
+# are left alone: too many stems end that way (মাটি, হাতে).
+BENGALI_SUFFIXES = ("গুলোতে", "গুলোর", "গুলো", "গুলি", "দের", "ের")
+BENGALI_VOWEL_SIGNS = frozenset("\u09be\u09bf\u09c0\u09c1\u09c2\u09c3\u09cb\u09cc")
+MIN_STEM_LENGTH = 2
+STEM_CACHE_SIZE = 100_000
+
+
+def normalize(text: Optional[str]) -> str:
+    """NFKC, Bengali digits as ASCII, case-folded, whitespace collapsed."""
+    if not text:
+        return ""
+    if not text.isascii():  # ASCII is already NFKC and has no Bengali digits
+        text = unicodedata.normalize("NFKC", text)
+        if TRANSLATED.search(text):  # translate() is slow outside ASCII
+            text = text.translate(TRANSLATION)
+    return " ".join(text.casefold().split())
+
+
+def is_bengali(text: str) -> bool:
+    return BENGALI.search(text) is not None
+
+
+def detect_language(text: str) -> str:
+    """Language code of a query: Bengali script anywhere makes it "bn"."""
+    return "bn" if is_bengali(text) else "en"
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Words of ``normalize(text)``."""
+    return WORD.findall(normalize(text))
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word: str) -> str:
+    """Strip one plural or case ending: Harman's S-stemmer for English, the
+    common plural and genitive endings for Bengali.
+
+    Cached, as catalog and query words repeat heavily."""
+    if not word.isascii() and is_bengali(word):
+        for suffix in BENGALI_SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+                return word[: -len(suffix)]
+        # Genitive -র after a vowel: মাটির -> মাটি, but not চাদর.
+        if word.endswith("র") and len(word) > 2 and word[-2] in BENGALI_VOWEL_SIGNS:
+            return word[:-1]
+        return word
+    if len(word) <= 3 or not word.isascii():
+        return word
+    if word.endswith("ies") and not word.endswith(("eies", "aies")):
+        return word[:-3] + "y"
+    if word.endswith("es") and not word.endswith(("aes", "ees", "oes")):
+        return word[:-1]
+    if word.endswith("s") and not word.endswith(("us", "ss")):
+        return word[:-1]
+    return word
+
+
+def analyze(text: Optional[str]) -> List[str]:
+    """Index and query tokens: normalized words, stop words dropped, stemmed."""
+    return [stem(word) for word in tokenize(text) if word not in STOPWORDS]
@@ -0,0 +1,113 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import REAL, Select, and_, cast, func, literal, literal_column, or_
+
+from app.models import Product
+from app.ai.utils.normalization import normalize
+
+SEARCH_LIMIT = 50
+
+# Text search configuration the product_search_vector_update trigger uses.
+SEARCH_CONFIG = literal_column("'simple'")
+
+# Characters with a meaning in to_tsquery syntax.
+TSQUERY_SPECIAL = re.compile(r"[&|!():*<>'\\]")
+
+
+def keyword_terms(keywords: List[str], synonyms: Dict[str, List[str]]) -> List[str]:
+    """Keywords plus their synonyms, normalized, in the order the AI gave them."""
+    terms = []
+    for keyword in keywords:
+        terms.append(normalize(keyword))
+        terms.extend(normalize(synonym) for synonym in synonyms.get(keyword, []))
+    return [term for term in terms if term]
+
+
+def to_tsquery_text(terms: List[str]) -> str:
+    """``'jamdani':* & 'saree':* | 'sari':*`` -- every word of a term must
+    prefix-match, any term may match."""
+    clauses = []
+    for term in terms:
+        words = TSQUERY_SPECIAL.sub(" ", term).split()
+        if words:
+            clauses.append(" & ".join(f"'{word}':*" for word in words))
+    return " | ".join(f"({clause})" for clause in clauses)
+
+
+def ranked(
+    query: Select, score, limit: int, after: Optional[Tuple[float, int]]
+) -> Select:
+    """``query`` with ``score`` as an extra column, best first, then by id;
+    ``after`` is the ``(score, product_id)`` of the previous page's last row."""
+    if after is not None:
+        # The ranks are ``real``; compared as doubles, a rank read back from
+        # its shortest text form would not equal itself.
+        last = cast(after[0], REAL)
+        query = query.filter(
+            or_(score < last, and_(score == last, Product.product_id > after[1]))
+        )
+    return (
+        query.add_columns(score.label("score"))
+        .order_by(score.desc(), Product.product_id)
+        .limit(limit)
+    )
+
+
+def fulltext_search(
+    query: Select,
+    terms: List[str],
+    limit: int = SEARCH_LIMIT,
+    after: Optional[Tuple[float, int]] = None,
+) -> Select:
+    """Restrict ``query`` (a select of ``Product``) to rows whose
+    ``search_vector`` matches ``terms``, best first, with their rank as a
+    ``score`` column.
+
+    Rank is ``ts_rank`` (name outweighs category outweighs description) plus
+    the trigram word similarity of the name, so closer names win ties.
+    """
+    tsquery_text = to_tsquery_text(terms)
+    if not tsquery_text:
+        return query.filter(literal(False))
+
+    tsquery = func.to_tsquery(SEARCH_CONFIG, tsquery_text)
+    rank = func.ts_rank(Product.search_vector, tsquery) + func.word_similarity(
+        " ".join(terms), Product.product_name
+    )
+    return ranked(
+        query.filter(Product.search_vector.op("@@")(tsquery)), rank, limit, after
+    )
+
+
+def fuzzy_search(
+    query: Select,
+    terms: List[str],
+    limit: int = SEARCH_LIMIT,
+    after: Optional[Tuple[float, int]] = None,
+) -> Select:
+    """Trigram fallback for misspellings: name or category word similarity
+    above ``pg_trgm.word_similarity_threshold``, best first.
+
+    Kept separate from ``fulltext_search`` because the planner cannot tell how
+    many rows an OR of both would touch and falls back to a sequential scan.
+    """
+    phrase = " ".join(terms).strip()
+    if not phrase:
+        return query.filter(literal(False))
+
+    similarity = func.greatest(
+        func.word_similarity(phrase, Product.product_name),
+        func.word_similarity(phrase, Product.category),
+    )
+    return ranked(
+        query.filter(
+            or_(
+                Product.product_name.op("%>")(phrase),
+                Product.category.op("%>")(phrase),
+            )
+        ),
+        similarity,
+        limit,
+        after,
+    )
@@ -0,0 +1,456 @@
+import asyncio
+import bisect
+import heapq
+import os
+import time
+import uuid
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import event, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import cache, metrics
+from app.database import AsyncSessionLocal
+from app.ai.utils.normalization import analyze
+from app.models import Brand, Product
+
+# Full rebuild interval; catches any change another worker's message missed.
+PRODUCT_INDEX_REBUILD_SECONDS = float(
+    os.getenv("PRODUCT_INDEX_REBUILD_SECONDS", "3600")
+)
+PRODUCT_INDEX_CHANNEL = "product-index"
+# Shorter query words match whole tokens only; longer ones also match as a
+# prefix, like the ``:*`` of the Postgres backend.
+MIN_PREFIX_LENGTH = 3
+LOAD_BATCH_SIZE = 10000
+# Growth factor of the id batches ``_ascending`` selects.
+GROWTH = 8
+# Tags this process's announcements so its own listener skips them.
+WORKER_ID = uuid.uuid4().hex[:12]
+
+
+def tokenize(*texts: Optional[str]) -> List[str]:
+    return analyze(" ".join(filter(None, texts)))
+
+
+def _ascending(ids: Set[int], above: Optional[int], batch: int) -> Iterator[int]:
+    """``ids`` greater than ``above``, smallest first.
+
+    Picked ``batch`` at a time with a bounded heap rather than by sorting the
+    whole set, which for a common word is most of the catalog; the batch
+    grows while the caller keeps reading (filters rejecting most ids).
+    """
+    while True:
+        candidates = ids if above is None else (i for i in ids if i > above)
+        if batch * GROWTH >= len(ids):  # about as costly as sorting them all
+            yield from sorted(candidates)
+            return
+        chunk = heapq.nsmallest(batch, candidates)
+        yield from chunk
+        if len(chunk) < batch:
+            return
+        above, batch = chunk[-1], batch * GROWTH
+
+
+class ProductDoc:
+    """What the index keeps per product: its tokens and the filter fields."""
+
+    __slots__ = ("tokens", "brand_id", "category", "price", "approved")
+
+    def __init__(self, tokens, brand_id, category, price, approved):
+        self.tokens = tokens
+        self.brand_id = brand_id
+        self.category = category
+        self.price = price
+        self.approved = approved
+
+    @classmethod
+    def from_row(cls, product_name, category, description, brand_id, price, approved):
+        return cls(
+            frozenset(tokenize(product_name, category, description)),
+            brand_id,
+            (category or "").lower(),
+            float(price) if price is not None else None,
+            bool(approved),
+        )
+
+
+class ProductIndex:
+    """Token -> product id posting sets over name, category, description and
+    brand name, updated one product at a time.
+
+    Only touched from the event loop, so it needs no lock; commits of sync
+    sessions in the threadpool hand their changes over to the loop.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Set[int]] = {}
+        self.docs: Dict[int, ProductDoc] = {}
+        self.brands: Dict[int, str] = {}
+        self._brand_tokens: Dict[int, FrozenSet[str]] = {}
+        self.brand_products: Dict[int, Set[int]] = {}
+        self._vocabulary: List[str] = []  # sorted, for prefix lookups
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _tokens(self, product_id: int) -> Iterable[str]:
+        doc = self.docs[product_id]
+        return doc.tokens | self._brand_tokens.get(doc.brand_id, frozenset())
+
+    def _post(self, product_id: int):
+        for token in self._tokens(product_id):
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = set()
+                bisect.insort(self._vocabulary, token)
+            postings.add(product_id)
+
+    def _unpost(self, product_id: int):
+        for token in self._tokens(product_id):
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(product_id)
+            if not postings:
+                del self.postings[token]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+
+    def set_brand(self, brand_id: int, brand_name: Optional[str]):
+        product_ids = self.brand_products.get(brand_id, ())
+        for product_id in product_ids:
+            self._unpost(product_id)
+        self.brands[brand_id] = brand_name or ""
+        self._brand_tokens[brand_id] = frozenset(tokenize(brand_name))
+        for product_id in product_ids:
+            self._post(product_id)
+
+    def add(self, product_id: int, doc: ProductDoc):
+        """Index ``doc``, replacing whatever ``product_id`` had before."""
+        self.remove(product_id)
+        self.docs[product_id] = doc
+        self.brand_products.setdefault(doc.brand_id, set()).add(product_id)
+        self._post(product_id)
+
+    def remove(self, product_id: int):
+        if product_id not in self.docs:
+            return
+        self._unpost(product_id)
+        doc = self.docs.pop(product_id)
+        self.brand_products[doc.brand_id].discard(product_id)
+
+    def bulk_load(self, rows):
+        """Fill an empty index from ``(product_id, name, category,
+        description, brand_id, price, approved, brand_name)`` rows without
+        keeping the vocabulary sorted until the end."""
+        postings = self.postings
+        for product_id, *fields, brand_name in rows:
+            doc = ProductDoc.from_row(*fields)
+            self.docs[product_id] = doc
+            if doc.brand_id not in self.brands:
+                self.brands[doc.brand_id] = brand_name or ""
+                self._brand_tokens[doc.brand_id] = frozenset(tokenize(brand_name))
+            self.brand_products.setdefault(doc.brand_id, set()).add(product_id)
+            for token in self._tokens(product_id):
+                ids = postings.get(token)
+                if ids is None:
+                    ids = postings[token] = set()
+                ids.add(product_id)
+        self._vocabulary = sorted(self.postings)
+
+    def _word_postings(self, word: str) -> Set[int]:
+        if len(word) < MIN_PREFIX_LENGTH:
+            return self.postings.get(word, set())
+        start = bisect.bisect_left(self._vocabulary, word)
+        matched = []
+        for token in self._vocabulary[start:]:
+            if not token.startswith(word):
+                break
+            matched.append(self.postings[token])
+        if len(matched) == 1:
+            return matched[0]
+        return set().union(*matched)
+
+    def match(self, term: str) -> Set[int]:
+        """Products containing every word of ``term`` (posting intersection)."""
+        postings = sorted(
+            (self._word_postings(word) for word in tokenize(term)), key=len
+        )
+        if not postings:
+            return set()
+        return postings[0].intersection(*postings[1:])
+
+    def _passes(self, doc, category, price_range, brand) -> bool:
+        if not doc.approved:
+            return False
+        if category and category not in doc.category:
+            return False
+        if price_range and not (
+            doc.price is not None and price_range[0] <= doc.price <= price_range[1]
+        ):
+            return False
+        if brand and brand not in self.brands.get(doc.brand_id, "").lower():
+            return False
+        return True
+
+    def search(
+        self,
+        terms: List[str],
+        category: Optional[str] = None,
+        price_range: Optional[List[float]] = None,
+        brand: Optional[str] = None,
+        limit: int = 50,
+        after: Optional[Tuple[float, int]] = None,
+    ) -> List[Tuple[int, float]]:
+        """``(product_id, score)`` of approved products matching any of
+        ``terms`` (posting union); the score is the share of the terms a
+        product matches. Best first, then by id, starting past ``after``, the
+        ``(score, product_id)`` of the previous page's last hit.
+
+        ``category`` and ``brand`` are case-insensitive substrings, like the
+        SQL filters."""
+        matches = [self.match(term) for term in terms]
+        matches = [ids for ids in matches if ids]
+        if not matches or limit <= 0:
+            return []
+        # at_least[n]: products matching n or more of the terms.
+        at_least = [None, set()]
+        for ids in matches:
+            for n in range(len(at_least) - 1, 0, -1):
+                overlap = at_least[n] & ids
+                if overlap:
+                    if n + 1 == len(at_least):
+                        at_least.append(set())
+                    at_least[n + 1] |= overlap
+            at_least[1] |= ids
+
+        category = category.lower() if category else None
+        brand = brand.lower() if brand else None
+        found = []
+        for n in range(len(at_least) - 1, 0, -1):
+            score = n / len(terms)
+            above = None
+            if after is not None:
+                if score > after[0]:
+                    continue
+                if score == after[0]:
+                    above = after[1]
+            ids = (
+                at_least[n] - at_least[n + 1] if n + 1 < len(at_least) else at_least[n]
+            )
+            for product_id in _ascending(ids, above, limit - len(found)):
+                if self._passes(self.docs[product_id], category, price_range, brand):
+                    found.append((product_id, score))
+                    if len(found) == limit:
+                        return found
+        return found
+
+
+index: Optional[ProductIndex] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+# Changes committed while a rebuild was reading the table; replayed on top of
+# the new index before it replaces the old one.
+_missed: Optional[list] = None
+
+build_time = metrics.Histogram()
+index_stats = {"updates": 0, "rebuilds": 0}
+metrics.register(
+    "product_index",
+    lambda: {
+        **index_stats,
+        "products": len(index) if index else 0,
+        "tokens": len(index.postings) if index else 0,
+        "build": build_time.snapshot(),
+    },
+)
+
+
+def load_query():
+    return (
+        select(
+            Product.product_id,
+            Product.product_name,
+            Product.category,
+            Product.description,
+            Product.brand_id,
+            Product.price,
+            Product.approved,
+            Brand.brand_name,
+        )
+        .outerjoin(Brand, Brand.brand_id == Product.brand_id)
+        .execution_options(yield_per=LOAD_BATCH_SIZE)
+    )
+
+
+async def build_index(db: AsyncSession) -> ProductIndex:
+    """Load the whole ``product`` table into a new index and make it current."""
+    global index, _missed
+    started = time.perf_counter()
+    _missed = []
+    try:
+        new_index = ProductIndex()
+        result = await db.stream(load_query())
+        async for rows in result.partitions():
+            new_index.bulk_load(rows)
+            await asyncio.sleep(0)  # let requests run between batches
+        for change in _missed:
+            _apply(new_index, change)
+    finally:
+        _missed = None
+    index = new_index
+    index_stats["rebuilds"] += 1
+    build_time.observe(time.perf_counter() - started)
+    return new_index
+
+
+def _apply(target: ProductIndex, change):
+    kind, key, value = change
+    if kind == "brand":
+        target.set_brand(key, value)
+    elif value is None:
+        target.remove(key)
+    else:
+        target.add(key, value)
+
+
+def _maintained() -> bool:
+    return index is not None or _missed is not None
+
+
+def _record(change):
+    index_stats["updates"] += 1
+    if index is not None:
+        _apply(index, change)
+    if _missed is not None:
+        _missed.append(change)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    """Remember what this flush did to products and brand names; applied to
+    the index only once the transaction commits."""
+    if not _maintained():
+        return
+    changes = session.info.setdefault("index_changes", [])
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            changes.append(("product", obj.product_id, None))
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Product):
+            doc = ProductDoc.from_row(
+                obj.product_name,
+                obj.category,
+                obj.description,
+                obj.brand_id,
+                obj.price,
+                obj.approved is not False,
+            )
+            changes.append(("product", obj.product_id, doc))
+        elif isinstance(obj, Brand):
+            changes.append(("brand", obj.brand_id, obj.brand_name))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_changes(session):
+    changes = session.info.pop("index_changes", None)
+    if not changes:
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        if _loop is not None:
+            _loop.call_soon_threadsafe(_apply_committed, changes)
+            return
+    _apply_committed(changes)
+
+
+def _apply_committed(changes):
+    # Brands first: a product added with its brand is indexed under its name.
+    for change in sorted(changes, key=lambda change: change[0] != "brand"):
+        _record(change)
+    _publish(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_changes(session):
+    session.info.pop("index_changes", None)
+
+
+def _publish(changes):
+    if _loop is None or not cache.redis_available():
+        return
+    messages = {f"{kind}:{key}" for kind, key, _ in changes}
+    _loop.create_task(_send(messages))
+
+
+async def _send(messages):
+    try:
+        async with cache.redis_client.pipeline(transaction=False) as pipe:
+            for message in messages:
+                pipe.publish(PRODUCT_INDEX_CHANNEL, f"{WORKER_ID}:{message}")
+            await pipe.execute()
+    except RedisError as e:
+        cache.redis_failed(e)
+
+
+async def _reload(db: AsyncSession, kind: str, key: int):
+    if kind == "brand":
+        brand_name = await db.scalar(
+            select(Brand.brand_name).filter(Brand.brand_id == key)
+        )
+        _record(("brand", key, brand_name))
+        return
+    row = (await db.execute(load_query().filter(Product.product_id == key))).first()
+    if row is None:
+        _record(("product", key, None))
+        return
+    _record(("brand", row.brand_id, row.brand_name))
+    _record(("product", key, ProductDoc.from_row(*row[1:7])))
+
+
+async def maintain_index():
+    """Build the index, then keep it current: apply other workers' changes
+    as they are announced and rebuild every ``PRODUCT_INDEX_REBUILD_SECONDS``."""
+    global _loop
+    _loop = asyncio.get_running_loop()
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await build_index(db)
+            break
+        except SQLAlchemyError as e:
+            print(f"Product index build failed: {e}")
+            await asyncio.sleep(cache.REDIS_RETRY_SECONDS)
+
+    async def rebuild():
+        while True:
+            await asyncio.sleep(PRODUCT_INDEX_REBUILD_SECONDS)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await build_index(db)
+            except SQLAlchemyError as e:
+                print(f"Product index rebuild failed: {e}")
+
+    rebuilder = asyncio.create_task(rebuild())
+    try:
+        while cache.redis_client is not None:
+            try:
+                async with cache.redis_client.pubsub() as pubsub:
+                    await pubsub.subscribe(PRODUCT_INDEX_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        worker, kind, key = message["data"].decode().split(":")
+                        if worker == WORKER_ID:
+                            continue
+                        async with AsyncSessionLocal() as db:
+                            await _reload(db, kind, int(key))
+            except (RedisError, SQLAlchemyError) as e:
+                print(f"Product index listener failed: {e}")
+                await asyncio.sleep(cache.REDIS_RETRY_SECONDS)
+        await rebuilder
+    finally:
+        rebuilder.cancel()
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app.ai.utils.ai_search import extract_price_range_from_text
+from app.ai.utils.normalization import STOPWORDS, WORD, normalize
+from app.database import AsyncSessionLocal
+from app.models import Brand, Product
+
+# Share of the query's words the catalog must know for the local parse to be
+# trusted; below it the LLM handles the query.
+QUERY_PARSER_MIN_CONFIDENCE = float(os.getenv("QUERY_PARSER_MIN_CONFIDENCE", "0.8"))
+QUERY_VOCABULARY_SIZE = int(os.getenv("QUERY_VOCABULARY_SIZE", "50000"))
+QUERY_VOCABULARY_REFRESH_SECONDS = float(
+    os.getenv("QUERY_VOCABULARY_REFRESH_SECONDS", "300")
+)
+MAX_NAME_WORDS = 3
+
+PRICE_PHRASE = re.compile(
+    r"\b(?:under|below|between|from)\s*\d+(?:\s*(?:and|to)\s*\d+)?"
+    r"|\b(?:tk|taka|bdt)\b|৳"
+)
+
+# Most frequent words of the approved catalog, from the search_vector
+# lexemes; numbers are left out since they are mostly SKUs and sizes.
+VOCABULARY_QUERY = text(
+    "SELECT word FROM ts_stat('SELECT search_vector FROM product WHERE approved') "
+    "WHERE word !~ '^[0-9]' ORDER BY ndoc DESC LIMIT :limit"
+)
+
+
+@dataclass(frozen=True)
+class Vocabulary:
+    """What the local parser can recognize, lowercased."""
+
+    terms: FrozenSet[str] = frozenset()
+    categories: Dict[str, str] = field(default_factory=dict)
+    brands: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class ParsedQuery:
+    keywords: List[str]
+    category: Optional[str]
+    brand: Optional[str]
+    price_range: Optional[List[float]]
+    confidence: float
+
+    def as_filters(self) -> Dict[str, Any]:
+        """The shape ``generate_keywords`` returns."""
+        return {
+            "keywords": self.keywords,
+            "keywords_en": self.keywords,
+            "category": self.category,
+            "price_range": self.price_range,
+            "brand": self.brand,
+            "synonyms": {},
+        }
+
+
+_vocabulary: Optional[Vocabulary] = None
+_vocabulary_lock = asyncio.Lock()
+
+PARSE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005) + metrics.LATENCY_BUCKETS
+# "lexicon": Bangla queries translated by ``app.ai.utils.lexicon`` alone.
+parse_time = {
+    "local": metrics.Histogram(PARSE_BUCKETS),
+    "lexicon": metrics.Histogram(PARSE_BUCKETS),
+    "llm": metrics.Histogram(PARSE_BUCKETS),
+}
+
+
+def _parser_metrics() -> dict:
+    total = sum(histogram.count for histogram in parse_time.values())
+    llm = parse_time["llm"].count
+    return {
+        "local_share": round(1 - llm / total, 4) if total else None,
+        "vocabulary_terms": len(_vocabulary.terms) if _vocabulary else 0,
+        **{path: histogram.snapshot() for path, histogram in parse_time.items()},
+    }
+
+
+metrics.register("query_parser", _parser_metrics)
+
+
+async def load_vocabulary(db: AsyncSession) -> Vocabulary:
+    terms = await db.scalars(VOCABULARY_QUERY, {"limit": QUERY_VOCABULARY_SIZE})
+    categories = await db.scalars(
+        select(Product.category)
+        .filter(Product.approved == True, Product.category.is_not(None))
+        .distinct()
+    )
+    brands = await db.scalars(select(Brand.brand_name))
+    return Vocabulary(
+        terms=frozenset(terms),
+        categories={normalize(c): c for c in categories if normalize(c)},
+        brands={normalize(b): b for b in brands if normalize(b)},
+    )
+
+
+async def get_vocabulary(db: AsyncSession) -> Vocabulary:
+    """The worker's vocabulary, loaded with ``db`` on first use and then kept
+    fresh by ``refresh_vocabulary``."""
+    global _vocabulary
+    if _vocabulary is None:
+        async with _vocabulary_lock:
+            if _vocabulary is None:
+                _vocabulary = await load_vocabulary(db)
+    return _vocabulary
+
+
+async def refresh_vocabulary():
+    """Reload the vocabulary every ``QUERY_VOCABULARY_REFRESH_SECONDS`` so new
+    brands and products become recognizable."""
+    global _vocabulary
+    while True:
+        await asyncio.sleep(QUERY_VOCABULARY_REFRESH_SECONDS)
+        try:
+            async with AsyncSessionLocal() as db:
+                _vocabulary = await load_vocabulary(db)
+        except SQLAlchemyError as e:
+            print(f"Query vocabulary refresh failed: {e}")
+
+
+def _match_names(words: List[str], names: Dict[str, str]):
+    """Longest, then last, run of ``words`` that is one of ``names`` (the head
+    noun of "jamdani saree" comes last); returns the original name and the
+    words left around it."""
+    for size in range(min(MAX_NAME_WORDS, len(words)), 0, -1):
+        for start in reversed(range(len(words) - size + 1)):
+            name = names.get(" ".join(words[start : start + size]))
+            if name is not None:
+                return name, words[:start] + words[start + size :]
+    return None, words
+
+
+def parse_query(query: str, vocabulary: Vocabulary) -> ParsedQuery:
+    """Price range, brand, category and keywords of ``query`` from string
+    matching alone.
+
+    ``confidence`` is the share of the remaining words the catalog knows;
+    a query with no words left to rank by has none.
+    """
+    normalized = normalize(query)
+    price_range = extract_price_range_from_text(normalized)
+    words = [
+        word
+        for word in WORD.findall(PRICE_PHRASE.sub(" ", normalized))
+        if word not in STOPWORDS
+    ]
+    brand, words = _match_names(words, vocabulary.brands)
+    # Category words stay keywords too: they are what ranks the products.
+    category, _ = _match_names(words, vocabulary.categories)
+
+    known = sum(
+        word in vocabulary.terms or word in vocabulary.categories for word in words
+    )
+    confidence = known / len(words) if words else 0.0
+    return ParsedQuery(words, category, brand, price_range, confidence)
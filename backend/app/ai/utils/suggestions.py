@@ -0,0 +1,440 @@
+import asyncio
+import bisect
+import heapq
+import os
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import metrics
+from app.database import AsyncSessionLocal
+from app.ai.utils.normalization import normalize
+from app.models import Brand, OrderItem, Product
+
+# Full rebuild interval: recounts sales and picks up other workers' changes.
+SUGGEST_REBUILD_SECONDS = float(os.getenv("SUGGEST_REBUILD_SECONDS", "300"))
+SUGGEST_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+# A suggestion is found by the start of any of its first few words, so
+# "saree" suggests "Jamdani saree"; keys are cut to KEY_LENGTH characters.
+MAX_KEY_WORDS = 4
+KEY_LENGTH = 32
+# Keys per leaf of the top-k tree; a query scans at most two leaves.
+BLOCK_SIZE = 64
+LOAD_BATCH_SIZE = 10000
+
+
+def prefix_keys(key: str) -> List[str]:
+    """``key`` from each of its first ``MAX_KEY_WORDS`` word starts."""
+    words = key.split()
+    return [
+        " ".join(words[i:])[:KEY_LENGTH] for i in range(min(len(words), MAX_KEY_WORDS))
+    ]
+
+
+def _upper_bound(prefix: str) -> str:
+    """The smallest string above every string starting with ``prefix``."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class ProductState:
+    """What a product adds to the suggestions while it is approved: its name,
+    category and brand, each weighted one plus the units ordered."""
+
+    __slots__ = ("name", "category", "brand_id", "approved", "sold")
+
+    def __init__(self, name, category, brand_id, approved, sold=0):
+        self.name = name
+        self.category = category
+        self.brand_id = brand_id
+        self.approved = approved
+        self.sold = sold
+
+    @property
+    def weight(self) -> int:
+        return 1 + self.sold if self.approved else 0
+
+
+class Suggestions:
+    """Product names, categories and brand names, weighted by popularity,
+    behind a sorted array of their normalized word-start keys.
+
+    A segment tree over blocks of ``BLOCK_SIZE`` keys holds each node's
+    ``SUGGEST_MAX_LIMIT`` most popular entries, so a prefix -- a range of
+    the array -- is answered from two leaves and O(log n) precomputed lists
+    instead of from every key in the range. A popularity change updates the
+    entry's tree paths; texts new since the last build wait in a small
+    sorted list of their own until the next rebuild.
+
+    Only touched from the event loop, like the product index.
+    """
+
+    def __init__(self):
+        self.texts: List[str] = []  # per entry id, as first written
+        self._normalized: List[str] = []
+        self.kinds: List[str] = []
+        self.weights: List[int] = []
+        self._entries: Dict[Tuple[str, str], int] = {}  # (kind, key) -> id
+        self.products: Dict[int, ProductState] = {}
+        self.brand_names: Dict[int, str] = {}
+        self._brand_weights: Dict[int, int] = {}
+        # Built by freeze().
+        self.keys: List[str] = []
+        self._key_entries: List[int] = []
+        self._frozen = 0  # entries ids below this are in ``keys``
+        self._size = 0
+        self._tree: Optional[List[List[int]]] = None
+        self.pending: List[Tuple[str, int]] = []  # sorted (key, entry id)
+
+    def _rank(self, entry: int):
+        return -self.weights[entry], self.texts[entry]
+
+    def _top(self, entries) -> List[int]:
+        live = {entry for entry in entries if self.weights[entry] > 0}
+        return heapq.nsmallest(SUGGEST_MAX_LIMIT, live, key=self._rank)
+
+    def _leaf(self, block: int) -> List[int]:
+        return self._top(
+            self._key_entries[block * BLOCK_SIZE : (block + 1) * BLOCK_SIZE]
+        )
+
+    def freeze(self):
+        """Put every entry into the sorted key array and build the tree."""
+        pairs = sorted(
+            (key, entry)
+            for entry, text in enumerate(self._normalized)
+            for key in prefix_keys(text)
+        )
+        self.keys = [key for key, _ in pairs]
+        self._key_entries = [entry for _, entry in pairs]
+        self._frozen = len(self.texts)
+        self.pending = []
+        blocks = -(-len(pairs) // BLOCK_SIZE)
+        self._size = 1
+        while self._size < blocks:
+            self._size *= 2
+        tree = [[] for _ in range(2 * self._size)]
+        for block in range(blocks):
+            tree[self._size + block] = self._leaf(block)
+        for node in range(self._size - 1, 0, -1):
+            tree[node] = self._top(tree[2 * node] + tree[2 * node + 1])
+        self._tree = tree
+
+    def _touch(self, entries: Set[int]):
+        """Bring the tree in line with new weights of ``entries``, each node
+        recomputed at most once."""
+        entries = {entry for entry in entries if entry < self._frozen}
+        if self._tree is None or not entries:
+            return
+        nodes = set()
+        for entry in entries:
+            for key in prefix_keys(self._normalized[entry]):
+                i = bisect.bisect_left(self.keys, key)
+                while i < len(self.keys) and self.keys[i] == key:
+                    if self._key_entries[i] == entry:
+                        nodes.add(self._size + i // BLOCK_SIZE)
+                    i += 1
+        tree = self._tree
+        while nodes:
+            parents = set()
+            for node in nodes:
+                if node >= self._size:
+                    top = self._leaf(node - self._size)
+                else:
+                    top = self._top(tree[2 * node] + tree[2 * node + 1])
+                # Unchanged and without the entries: nothing above changes.
+                if top == tree[node] and entries.isdisjoint(top):
+                    continue
+                tree[node] = top
+                if node > 1:
+                    parents.add(node // 2)
+            nodes = parents
+
+    def _reweigh(self, changes: List[Tuple[str, Optional[str], int]]):
+        """Apply ``(kind, text, weight)`` changes, netted per entry, so a
+        product keeping its category or brand leaves those alone."""
+        net: Dict[Tuple[str, str], List] = {}
+        for kind, text, weight in changes:
+            key = normalize(text)
+            if key and weight:
+                net.setdefault((kind, key), [text, 0])[1] += weight
+        touched = set()
+        for (kind, key), (text, weight) in net.items():
+            entry = self._entries.get((kind, key))
+            if not weight or (entry is None and weight < 0):
+                continue
+            if entry is None:
+                entry = self._entries[kind, key] = len(self.texts)
+                text = " ".join(text.split())
+                self.texts.append(key if text == key else text)
+                self._normalized.append(key)
+                self.kinds.append(kind)
+                self.weights.append(0)
+                if self._tree is not None:
+                    for prefix in prefix_keys(key):
+                        bisect.insort(self.pending, (prefix, entry))
+            self.weights[entry] += weight
+            touched.add(entry)
+        self._touch(touched)
+
+    def _credit(self, state: ProductState, sign: int):
+        """What ``state`` adds to its entries (``sign`` 1) or takes back
+        (``sign`` -1)."""
+        weight = sign * state.weight
+        self._brand_weights[state.brand_id] = (
+            self._brand_weights.get(state.brand_id, 0) + weight
+        )
+        return [
+            ("product", state.name, weight),
+            ("category", state.category, weight),
+            ("brand", self.brand_names.get(state.brand_id), weight),
+        ]
+
+    def set_product(self, product_id: int, name, category, brand_id, approved):
+        """Add or replace ``product_id``; its sales count carries over."""
+        old = self.products.get(product_id)
+        state = ProductState(
+            name, category, brand_id, bool(approved), old.sold if old else 0
+        )
+        self.products[product_id] = state
+        changes = self._credit(old, -1) if old is not None else []
+        self._reweigh(changes + self._credit(state, 1))
+
+    def remove_product(self, product_id: int):
+        state = self.products.pop(product_id, None)
+        if state is not None:
+            self._reweigh(self._credit(state, -1))
+
+    def set_brand(self, brand_id: int, brand_name: Optional[str]):
+        old = self.brand_names.get(brand_id)
+        if old == brand_name:
+            return
+        weight = self._brand_weights.get(brand_id, 0)
+        self.brand_names[brand_id] = brand_name
+        self._reweigh([("brand", old, -weight), ("brand", brand_name, weight)])
+
+    def _matches(self, entry: int, prefix: str) -> bool:
+        # Only needed past KEY_LENGTH, where the keys are cut short.
+        words = self._normalized[entry].split()
+        return any(
+            " ".join(words[i:]).startswith(prefix)
+            for i in range(min(len(words), MAX_KEY_WORDS))
+        )
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_LIMIT) -> List[dict]:
+        """The ``limit`` most popular entries with a word starting with
+        ``prefix``, most popular first."""
+        prefix = normalize(prefix)
+        if not prefix or self._tree is None:
+            return []
+        cut = prefix[:KEY_LENGTH]
+        lo = bisect.bisect_left(self.keys, cut)
+        hi = bisect.bisect_left(self.keys, _upper_bound(cut), lo)
+        candidates: Set[int] = set()
+        first, last = -(-lo // BLOCK_SIZE), hi // BLOCK_SIZE  # whole blocks
+        if first >= last:
+            candidates.update(self._key_entries[lo:hi])
+        else:
+            candidates.update(self._key_entries[lo : first * BLOCK_SIZE])
+            candidates.update(self._key_entries[last * BLOCK_SIZE : hi])
+            left, right = first + self._size, last + self._size
+            while left < right:
+                if left & 1:
+                    candidates.update(self._tree[left])
+                    left += 1
+                if right & 1:
+                    right -= 1
+                    candidates.update(self._tree[right])
+                left //= 2
+                right //= 2
+        i = bisect.bisect_left(self.pending, (cut,))
+        while i < len(self.pending) and self.pending[i][0].startswith(cut):
+            candidates.add(self.pending[i][1])
+            i += 1
+        if len(prefix) > KEY_LENGTH:
+            candidates = {e for e in candidates if self._matches(e, prefix)}
+        return [
+            {"text": self.texts[entry], "kind": self.kinds[entry]}
+            for entry in heapq.nsmallest(
+                limit,
+                (entry for entry in candidates if self.weights[entry] > 0),
+                key=self._rank,
+            )
+        ]
+
+    @classmethod
+    def from_rows(cls, rows) -> "Suggestions":
+        """Built from ``load_query`` rows."""
+        suggestions = cls()
+        for product_id, name, category, brand_id, approved, brand_name, sold in rows:
+            suggestions.brand_names.setdefault(brand_id, brand_name)
+            state = ProductState(name, category, brand_id, bool(approved), sold)
+            suggestions.products[product_id] = state
+            suggestions._reweigh(suggestions._credit(state, 1))
+        suggestions.freeze()
+        return suggestions
+
+
+_suggestions: Optional[Suggestions] = None
+_lock = asyncio.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+# Changes committed while a rebuild was reading the table; replayed on top of
+# the new suggestions before they replace the old ones.
+_missed: Optional[list] = None
+
+build_time = metrics.Histogram()
+suggest_time = metrics.Histogram()
+metrics.register(
+    "suggestions",
+    lambda: {
+        "entries": len(_suggestions.texts) if _suggestions else 0,
+        "keys": len(_suggestions.keys) if _suggestions else 0,
+        "pending": len(_suggestions.pending) if _suggestions else 0,
+        "build": build_time.snapshot(),
+        "suggest": suggest_time.snapshot(),
+    },
+)
+
+
+def load_query():
+    sold = (
+        select(OrderItem.product_id, func.sum(OrderItem.quantity).label("sold"))
+        .group_by(OrderItem.product_id)
+        .subquery()
+    )
+    return (
+        select(
+            Product.product_id,
+            Product.product_name,
+            Product.category,
+            Product.brand_id,
+            Product.approved,
+            Brand.brand_name,
+            func.coalesce(sold.c.sold, 0),
+        )
+        .outerjoin(Brand, Brand.brand_id == Product.brand_id)
+        .outerjoin(sold, sold.c.product_id == Product.product_id)
+        .execution_options(yield_per=LOAD_BATCH_SIZE)
+    )
+
+
+async def build_suggestions(db: AsyncSession) -> Suggestions:
+    """Load the catalog into new suggestions, off the event loop, and make
+    them current."""
+    global _suggestions, _loop, _missed
+    _loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    _missed = []
+    try:
+        rows = []
+        result = await db.stream(load_query())
+        async for partition in result.partitions():
+            rows.extend(partition)
+        new_suggestions = await asyncio.to_thread(Suggestions.from_rows, rows)
+        for change in _missed:
+            _apply(new_suggestions, change)
+    finally:
+        _missed = None
+    _suggestions = new_suggestions
+    build_time.observe(time.perf_counter() - started)
+    return new_suggestions
+
+
+async def get_suggestions(db: AsyncSession) -> Suggestions:
+    """The worker's suggestions, built with ``db`` on first use and then kept
+    current by the commit hooks and ``maintain_suggestions``."""
+    if _suggestions is None:
+        async with _lock:
+            if _suggestions is None:
+                await build_suggestions(db)
+    return _suggestions
+
+
+def suggest(prefix: str, limit: int = SUGGEST_LIMIT) -> List[dict]:
+    started = time.perf_counter()
+    try:
+        return _suggestions.suggest(prefix, limit) if _suggestions else []
+    finally:
+        suggest_time.observe(time.perf_counter() - started)
+
+
+def _apply(target: Suggestions, change):
+    kind, key, value = change
+    if kind == "brand":
+        target.set_brand(key, value)
+    elif value is None:
+        target.remove_product(key)
+    else:
+        target.set_product(key, *value)
+
+
+def _maintained() -> bool:
+    return _suggestions is not None or _missed is not None
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    """Remember what this flush did to products and brand names; applied
+    once the transaction commits."""
+    if not _maintained():
+        return
+    changes = session.info.setdefault("suggestion_changes", [])
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            changes.append(("product", obj.product_id, None))
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Product):
+            fields = (
+                obj.product_name,
+                obj.category,
+                obj.brand_id,
+                obj.approved is not False,
+            )
+            changes.append(("product", obj.product_id, fields))
+        elif isinstance(obj, Brand):
+            changes.append(("brand", obj.brand_id, obj.brand_name))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_changes(session):
+    changes = session.info.pop("suggestion_changes", None)
+    if not changes:
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        if _loop is not None:
+            _loop.call_soon_threadsafe(_apply_committed, changes)
+            return
+    _apply_committed(changes)
+
+
+def _apply_committed(changes):
+    # Brands first: a product added with its brand counts towards its name.
+    for change in sorted(changes, key=lambda change: change[0] != "brand"):
+        if _suggestions is not None:
+            _apply(_suggestions, change)
+        if _missed is not None:
+            _missed.append(change)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_changes(session):
+    session.info.pop("suggestion_changes", None)
+
+
+async def maintain_suggestions():
+    """Build the suggestions, then rebuild them every
+    ``SUGGEST_REBUILD_SECONDS``: sales counts and other workers' changes
+    only arrive that way."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await build_suggestions(db)
+        except SQLAlchemyError as e:
+            print(f"Suggestion build failed: {e}")
+        await asyncio.sleep(SUGGEST_REBUILD_SECONDS)
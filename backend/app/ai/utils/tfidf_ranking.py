@@ -0,0 +1,192 @@
+import asyncio
+import os
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app.database import AsyncSessionLocal
+from app.ai.utils.normalization import analyze
+from app.models import Product
+from app.ai.utils.product_index import load_query
+
+# New and edited products are ranked once the next rebuild picks them up.
+TFIDF_REBUILD_SECONDS = float(os.getenv("TFIDF_REBUILD_SECONDS", "300"))
+
+
+def document(product_name, category, description, brand_name) -> str:
+    # The name counts twice, as it outweighs the rest in the Postgres rank.
+    return " ".join(
+        filter(None, (product_name, product_name, category, brand_name, description))
+    )
+
+
+def _codes(values: List[str]):
+    """Distinct lowercased ``values`` and, per row, the index of its value."""
+    names, codes = np.unique(np.array(values, dtype=object), return_inverse=True)
+    return names, codes.astype(np.int32)
+
+
+class TfidfRanking:
+    """TF-IDF matrix of the approved catalog, one L2-normalized row per
+    product, with the filter fields as parallel arrays.
+
+    Never modified once built: a rebuild creates a new one and swaps it in.
+    """
+
+    def __init__(self, rows):
+        """``rows`` as ``load_query`` returns them, approved products only."""
+        rows = [row for row in rows if row.approved]
+        self.vectorizer = TfidfVectorizer(
+            analyzer=analyze, sublinear_tf=True, dtype=np.float32
+        )
+        try:
+            self.matrix = self.vectorizer.fit_transform(
+                document(
+                    row.product_name, row.category, row.description, row.brand_name
+                )
+                for row in rows
+            ).tocsc()  # column-major: a query only reads its own words' columns
+        except ValueError:  # no products, or not a single word among them
+            self.matrix = None
+        self.product_ids = np.array([row.product_id for row in rows], dtype=np.int64)
+        self.prices = np.array(
+            [np.nan if row.price is None else float(row.price) for row in rows],
+            dtype=np.float64,
+        )
+        self.categories, self.category_codes = _codes(
+            [(row.category or "").lower() for row in rows]
+        )
+        self.brands, self.brand_codes = _codes(
+            [(row.brand_name or "").lower() for row in rows]
+        )
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    @property
+    def terms(self) -> int:
+        return len(self.vectorizer.vocabulary_) if self.matrix is not None else 0
+
+    @staticmethod
+    def _containing(names, codes, rows, needle: str):
+        """Which of ``rows`` have a value containing ``needle``; checks each
+        distinct value once instead of once per row."""
+        needle = needle.lower()
+        wanted = np.array([needle in name for name in names], dtype=bool)
+        return wanted[codes[rows]]
+
+    def rank(
+        self,
+        terms: List[str],
+        category: Optional[str] = None,
+        price_range: Optional[List[float]] = None,
+        brand: Optional[str] = None,
+        limit: int = 50,
+        after: Optional[Tuple[float, int]] = None,
+    ) -> List[Tuple[int, float]]:
+        """``(product_id, cosine similarity)`` of the ``limit`` products most
+        similar to ``terms``, best first, then by id, starting past ``after``,
+        the ``(score, product_id)`` of the previous page's last hit.
+        ``category`` and ``brand`` are case-insensitive substrings, like the
+        SQL filters."""
+        if self.matrix is None or limit <= 0:
+            return []
+        vector = self.vectorizer.transform([" ".join(terms)])
+        if not vector.nnz:
+            return []
+        scores = (self.matrix @ vector.T).tocoo()
+        # Rounded before comparing, so a score read back from a cursor is
+        # equal to the one it was returned as.
+        rows, values = scores.row, np.round(scores.data.astype(np.float64), 6)
+
+        keep = values > 0
+        if after is not None:
+            keep &= (values < after[0]) | (
+                (values == after[0]) & (self.product_ids[rows] > after[1])
+            )
+        if price_range:
+            prices = self.prices[rows]
+            keep &= (prices >= price_range[0]) & (prices <= price_range[1])
+        if category:
+            keep &= self._containing(
+                self.categories, self.category_codes, rows, category
+            )
+        if brand:
+            keep &= self._containing(self.brands, self.brand_codes, rows, brand)
+        rows, values = rows[keep], values[keep]
+
+        if len(rows) > limit:
+            # Everything scoring at least the limit-th best, ties included,
+            # so the cut below takes the tied ones by id.
+            cut = np.partition(values, len(values) - limit)[len(values) - limit]
+            top = values >= cut
+            rows, values = rows[top], values[top]
+        ids = self.product_ids[rows]
+        order = np.lexsort((ids, -values))[:limit]  # best first, then by id
+        return [(int(ids[i]), float(values[i])) for i in order]
+
+
+ranking: Optional[TfidfRanking] = None
+
+build_time = metrics.Histogram()
+rank_time = metrics.Histogram()
+metrics.register(
+    "tfidf_ranking",
+    lambda: {
+        "products": len(ranking) if ranking else 0,
+        "terms": ranking.terms if ranking else 0,
+        "build": build_time.snapshot(),
+        "rank": rank_time.snapshot(),
+    },
+)
+
+
+def rank(
+    terms: List[str],
+    category: Optional[str] = None,
+    price_range: Optional[List[float]] = None,
+    brand: Optional[str] = None,
+    limit: int = 50,
+    after: Optional[Tuple[float, int]] = None,
+) -> List[Tuple[int, float]]:
+    """``TfidfRanking.rank`` on the current ranking; empty until it is built."""
+    current = ranking
+    if current is None:
+        return []
+    started = time.perf_counter()
+    try:
+        return current.rank(terms, category, price_range, brand, limit, after)
+    finally:
+        rank_time.observe(time.perf_counter() - started)
+
+
+async def build_ranking(db: AsyncSession) -> TfidfRanking:
+    """Fit a new ranking on the approved catalog, off the event loop, and
+    make it current."""
+    global ranking
+    started = time.perf_counter()
+    rows = []
+    result = await db.stream(load_query().filter(Product.approved == True))
+    async for partition in result.partitions():
+        rows.extend(partition)
+    new_ranking = await asyncio.to_thread(TfidfRanking, rows)
+    ranking = new_ranking
+    build_time.observe(time.perf_counter() - started)
+    return new_ranking
+
+
+async def maintain_ranking():
+    """Build the ranking now and again every ``TFIDF_REBUILD_SECONDS``;
+    searches keep using the previous one while a rebuild runs."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await build_ranking(db)
+        except SQLAlchemyError as e:
+            print(f"TF-IDF ranking build failed: {e}")
+        await asyncio.sleep(TFIDF_REBUILD_SECONDS)
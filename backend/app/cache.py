@@ -0,0 +1,199 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app import metrics
+
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "True").lower() == "true"
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "300"))
+# Other workers only see an invalidation once their L1 copy expires, so keep
+# this short.
+CACHE_L1_TTL_SECONDS = float(os.getenv("CACHE_L1_TTL_SECONDS", "5"))
+CACHE_L1_SIZE = int(os.getenv("CACHE_L1_SIZE", "1024"))
+# After a Redis error, serve from L1 and the database for this long.
+REDIS_RETRY_SECONDS = float(os.getenv("REDIS_RETRY_SECONDS", "30"))
+
+KEY_PREFIX = "cache:"
+TAG_PREFIX = "cache:tag:"
+
+redis_client = (
+    aioredis.from_url(REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    if REDIS_URL
+    else None
+)
+_redis_down_until = 0.0
+
+cache_stats = {
+    "l1_hits": 0,
+    "redis_hits": 0,
+    "misses": 0,
+    "invalidations": 0,
+    "redis_errors": 0,
+}
+
+
+class LRUCache:
+    """In-process LRU with a per-entry TTL and optional tags.
+
+    Only touched from the event loop, so it needs no lock.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value, tags: Iterable[str] = ()):
+        self._entries[key] = (time.monotonic() + self.ttl, value, frozenset(tags))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        self._entries.pop(key, None)
+
+    def invalidate(self, tags: Iterable[str]):
+        tags = set(tags)
+        for key in [k for k, entry in self._entries.items() if entry[2] & tags]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+l1 = LRUCache(CACHE_L1_SIZE, CACHE_L1_TTL_SECONDS)
+metrics.register("response_cache", lambda: {**cache_stats, "l1_size": len(l1)})
+
+
+def redis_available() -> bool:
+    return redis_client is not None and time.monotonic() >= _redis_down_until
+
+
+def redis_failed(error: RedisError):
+    global _redis_down_until
+    cache_stats["redis_errors"] += 1
+    _redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+    print(f"Redis unavailable, retrying in {REDIS_RETRY_SECONDS}s: {error}")
+
+
+def cache_key(request: Request) -> str:
+    """Route path plus its query parameters in a stable order."""
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    return f"{KEY_PREFIX}{request.url.path}?{query}"
+
+
+def product_tags(product_id: int, brand_id: Optional[int] = None) -> List[str]:
+    """Tags to invalidate when a product changes."""
+    tags = ["products", f"product:{product_id}"]
+    if brand_id is not None:
+        tags.append(f"brand:{brand_id}")
+    return tags
+
+
+def brand_tags(brand_id: int) -> List[str]:
+    """Tags to invalidate when a brand changes."""
+    return ["brands", f"brand:{brand_id}"]
+
+
+async def _redis_get(key: str) -> Optional[Tuple[bytes, List[str]]]:
+    if not redis_available():
+        return None
+    try:
+        value = await redis_client.get(key)
+    except RedisError as e:
+        redis_failed(e)
+        return None
+    if value is None:
+        return None
+    # Stored as b"<space separated tags>\n<body>" so L1 can keep the tags.
+    tags, _, body = value.partition(b"\n")
+    return body, tags.decode().split()
+
+
+async def _redis_set(key: str, body: bytes, tags: List[str]):
+    if not redis_available():
+        return
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(key, " ".join(tags).encode() + b"\n" + body, ex=CACHE_TTL_SECONDS)
+            for tag in tags:
+                pipe.sadd(f"{TAG_PREFIX}{tag}", key)
+                pipe.expire(f"{TAG_PREFIX}{tag}", CACHE_TTL_SECONDS)
+            await pipe.execute()
+    except RedisError as e:
+        redis_failed(e)
+
+
+async def cached_json(
+    request: Request,
+    render: Callable[[], Awaitable[Tuple[Any, List[str]]]],
+) -> Response:
+    """Serve the JSON for ``request`` from L1, then Redis, then ``render()``.
+
+    ``render`` returns ``(jsonable data, tags)``; the tags are what
+    ``invalidate`` later drops the entry by. Errors raised by ``render`` are
+    not cached. ``render`` must read from the primary: a replica filling the
+    miss right after an invalidation would cache the write's old rows for
+    ``CACHE_TTL_SECONDS``.
+    """
+    if not CACHE_ENABLED:
+        data, _ = await render()
+        return JSONResponse(data)
+
+    key = cache_key(request)
+    body = l1.get(key)
+    if body is not None:
+        cache_stats["l1_hits"] += 1
+        return Response(body, media_type="application/json")
+
+    cached = await _redis_get(key)
+    if cached is not None:
+        body, tags = cached
+        cache_stats["redis_hits"] += 1
+        l1.set(key, body, tags)
+        return Response(body, media_type="application/json")
+
+    cache_stats["misses"] += 1
+    data, tags = await render()
+    response = JSONResponse(data)
+    l1.set(key, response.body, tags)
+    await _redis_set(key, response.body, tags)
+    return response
+
+
+async def invalidate(*tags: str):
+    """Drop every cached response carrying any of ``tags``. Call after commit."""
+    cache_stats["invalidations"] += 1
+    l1.invalidate(tags)
+    if not redis_available():
+        return
+    tag_keys = [f"{TAG_PREFIX}{tag}" for tag in tags]
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for tag_key in tag_keys:
+                pipe.smembers(tag_key)
+            members = await pipe.execute()
+        keys = set().union(*members)
+        await redis_client.delete(*keys, *tag_keys)
+    except RedisError as e:
+        redis_failed(e)
@@ -1,23 +1,347 @@
-from sqlalchemy import create_engine
+from fastapi import Request
+from jose import JWTError, jwt
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.sql.dml import UpdateBase
 from dotenv import load_dotenv
+from redis.exceptions import RedisError
+from typing import Optional
+from uuid import uuid4
+import hashlib
+import itertools
 import os
+import time
+
+from app import cache, metrics
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or make_url(DATABASE_URL).set(
+    drivername="postgresql+asyncpg"
+)
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() == "true"
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "False").lower() == "true"
+
+DATABASE_REPLICA_URLS = [
+    url.strip()
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "2"))
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.getenv("DB_REPLICA_LAG_CHECK_SECONDS", "5"))
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+# PgBouncer in transaction mode hands every transaction a different server
+# connection, so asyncpg must not cache or reuse named prepared statements.
+ASYNC_CONNECT_ARGS = (
+    {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+    }
+    if DB_PGBOUNCER
+    else {}
+)
+
+
+def timed_pool(pool_class):
+    """Subclass ``pool_class`` so checkout wait time and timeouts are recorded.
+
+    The stats live on the class because the pool recreates itself (same class)
+    after invalidation.
+    """
+
+    class TimedPool(pool_class):
+        wait_time = metrics.Histogram()
+        timeouts = 0
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            except exc.TimeoutError:
+                TimedPool.timeouts += 1
+                raise
+            finally:
+                TimedPool.wait_time.observe(time.perf_counter() - started)
+
+    TimedPool.__name__ = f"Timed{pool_class.__name__}"
+    return TimedPool
+
+
+def pool_status(db_engine) -> dict:
+    pool = db_engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "timeouts": pool.timeouts,
+        "wait_time": pool.wait_time.snapshot(),
+    }
+
+
+engine = create_engine(DATABASE_URL, poolclass=timed_pool(QueuePool), **POOL_OPTIONS)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=timed_pool(AsyncAdaptedQueuePool),
+    connect_args=ASYNC_CONNECT_ARGS,
+    **POOL_OPTIONS,
+)
+
+replica_engines = [
+    create_async_engine(
+        make_url(url).set(drivername="postgresql+asyncpg"),
+        poolclass=timed_pool(AsyncAdaptedQueuePool),
+        connect_args=ASYNC_CONNECT_ARGS,
+        **POOL_OPTIONS,
+    )
+    for url in DATABASE_REPLICA_URLS
+]
+_replica_cycle = itertools.cycle(replica_engines)
+_replica_lag = {}  # engine -> (checked_at, lag in seconds)
+# Token subject -> time of the last commit that wrote in this worker, oldest
+# first. Other workers learn of the write through Redis (WRITER_KEY_PREFIX).
+_recent_writers = {}
+WRITER_KEY_PREFIX = "db:wrote:"
+routing_stats = {"replica_reads": 0, "primary_reads": 0, "lagging_replica_skips": 0}
+
+# Zero while the replica has replayed everything it received, so an idle
+# primary does not look like lag.
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "END"
+)
+
+metrics.register(
+    "db_pool",
+    lambda: {
+        "sync": pool_status(engine),
+        "async": pool_status(async_engine.sync_engine),
+        **{
+            f"replica_{i}": pool_status(replica.sync_engine)
+            for i, replica in enumerate(replica_engines)
+        },
+    },
+)
+metrics.register("db_routing", lambda: dict(routing_stats))
+
+
+class TrackedSession(Session):
+    """Session that notes whether it wrote, so a commit can open the
+    principal's read-your-writes window. Flushes and any INSERT, UPDATE or
+    DELETE statement it executes count."""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if isinstance(clause, UpdateBase):
+            self.info["wrote"] = True
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+class RoutingSession(TrackedSession):
+    """Session that reads from ``info["replica"]`` and writes to the primary.
+
+    Flushes, DML and ``FOR UPDATE`` reads always go to the primary, and so does
+    everything after the session's first write.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get("replica")
+        if isinstance(clause, UpdateBase):
+            self.info["wrote"] = True
+        if (
+            replica is None
+            or self._flushing
+            or self.info.get("wrote")
+            or getattr(clause, "_for_update_arg", None) is not None
+        ):
+            return async_engine.sync_engine
+        return replica.sync_engine
+
+
+@event.listens_for(TrackedSession, "after_flush")
+def _flag_write(session, flush_context):
+    session.info["wrote"] = True
+
 
+def _remember_writer(principal: str):
+    now = time.monotonic()
+    # Re-inserted so the dict stays ordered by write time, which lets expired
+    # writers be dropped from the front.
+    _recent_writers.pop(principal, None)
+    _recent_writers[principal] = now
+    expired = []
+    for writer, wrote_at in _recent_writers.items():
+        if now - wrote_at < DB_READ_YOUR_WRITES_SECONDS:
+            break
+        expired.append(writer)
+    for writer in expired:
+        del _recent_writers[writer]
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@event.listens_for(TrackedSession, "after_commit")
+def _committed_write(session):
+    principal = session.info.get("principal")
+    if session.info.get("wrote") and principal:
+        _remember_writer(principal)
+        # Shared with the other workers once the request is done with the
+        # session, see ``share_writes``.
+        session.info["committed_write"] = True
+
+
+def _writer_key(principal: str) -> str:
+    return WRITER_KEY_PREFIX + hashlib.sha1(principal.encode()).hexdigest()
+
+
+async def remember_write(principal: str):
+    """Open ``principal``'s read-your-writes window in every worker, for
+    writes made on their behalf by a request they did not send."""
+    _remember_writer(principal)
+    await _share_write(principal)
+
+
+async def _share_write(principal: str):
+    if DB_READ_YOUR_WRITES_SECONDS <= 0 or not cache.redis_available():
+        return
+    try:
+        await cache.redis_client.set(
+            _writer_key(principal),
+            b"1",
+            px=int(DB_READ_YOUR_WRITES_SECONDS * 1000),
+        )
+    except RedisError as e:
+        cache.redis_failed(e)
+
+
+async def share_writes(session):
+    """Share a committed write of ``session`` with the other workers; the
+    session dependencies call this before the response is sent."""
+    principal = session.info.get("principal")
+    if session.info.pop("committed_write", False) and principal:
+        await _share_write(principal)
+
+
+def request_principal(request: Request) -> Optional[str]:
+    """Token subject used to key the read-your-writes window.
+
+    The signature is not checked here: the value only picks a database, and
+    the routes still authenticate through ``get_current_identity`` or
+    ``get_current_user``.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        return None
+
+
+async def wrote_recently(principal: Optional[str]) -> bool:
+    """Whether ``principal`` committed a write within
+    ``DB_READ_YOUR_WRITES_SECONDS``, in this worker or, through Redis, in
+    another one."""
+    if not principal:
+        return False
+    wrote_at = _recent_writers.get(principal)
+    if wrote_at is not None:
+        if time.monotonic() - wrote_at < DB_READ_YOUR_WRITES_SECONDS:
+            return True
+        del _recent_writers[principal]
+    if not cache.redis_available():
+        return False
+    try:
+        return bool(await cache.redis_client.exists(_writer_key(principal)))
+    except RedisError as e:
+        cache.redis_failed(e)
+        return False
+
+
+async def replica_lag(replica) -> float:
+    now = time.monotonic()
+    checked_at, lag = _replica_lag.get(replica, (None, None))
+    if checked_at is not None and now - checked_at < DB_REPLICA_LAG_CHECK_SECONDS:
+        return lag
+    try:
+        async with replica.connect() as connection:
+            lag = float((await connection.execute(REPLICA_LAG_QUERY)).scalar() or 0)
+    except exc.SQLAlchemyError:
+        lag = float("inf")
+    _replica_lag[replica] = (now, lag)
+    return lag
+
+
+async def choose_replica(principal: Optional[str]):
+    """Next healthy replica, or None when the primary should serve the read."""
+    if not replica_engines or await wrote_recently(principal):
+        return None
+    for _ in replica_engines:
+        replica = next(_replica_cycle)
+        if await replica_lag(replica) <= DB_REPLICA_MAX_LAG_SECONDS:
+            return replica
+        routing_stats["lagging_replica_skips"] += 1
+    return None
+
+
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=engine, class_=TrackedSession
+)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
 
 
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
+async def get_db(request: Request):
+    db = SessionLocal(info={"principal": request_principal(request)})
     try:
         yield db
     finally:
         db.close()
+        await share_writes(db)
+
+
+async def get_async_db(request: Request):
+    async with AsyncSessionLocal(info={"principal": request_principal(request)}) as db:
+        try:
+            yield db
+        finally:
+            await share_writes(db)
+
+
+async def get_async_read_db(request: Request):
+    """Session for read-mostly routes: served by a replica when one is healthy
+    and the caller has not written within ``DB_READ_YOUR_WRITES_SECONDS``."""
+    principal = request_principal(request)
+    replica = await choose_replica(principal)
+    routing_stats["replica_reads" if replica else "primary_reads"] += 1
+    async with AsyncSessionLocal(
+        info={"principal": principal, "replica": replica}
+    ) as db:
+        try:
+            yield db
+        finally:
+            await share_writes(db)
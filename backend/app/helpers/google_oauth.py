@@ -0,0 +1,117 @@
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Mapping
+
+import httpx
+import requests
+from google.auth import exceptions as google_exceptions
+from google.auth import jwt as google_jwt
+from google.auth.transport.requests import Request as GoogleRequest
+from requests.adapters import HTTPAdapter
+
+from app import metrics
+
+GOOGLE_CERTS_URL = os.getenv(
+    "GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs"
+)
+GOOGLE_TOKEN_URL = os.getenv("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token")
+GOOGLE_HTTP_TIMEOUT_SECONDS = float(os.getenv("GOOGLE_HTTP_TIMEOUT_SECONDS", "5"))
+GOOGLE_HTTP_POOL_SIZE = int(os.getenv("GOOGLE_HTTP_POOL_SIZE", "10"))
+# Used when Google's response has no usable Cache-Control max-age.
+GOOGLE_CERTS_DEFAULT_TTL_SECONDS = 300
+# An unknown key id refetches at most this often, so forged key ids cannot
+# make every request call Google.
+GOOGLE_CERTS_MIN_REFRESH_SECONDS = 60
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+MAX_AGE = re.compile(r"max-age=(\d+)")
+
+# One pooled session for every synchronous call to Google, wrapped as the
+# google-auth transport.
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=1, pool_maxsize=GOOGLE_HTTP_POOL_SIZE)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+transport = GoogleRequest(session=session)
+
+# Bound to the event loop it first runs on; closed by the app lifespan.
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(GOOGLE_HTTP_TIMEOUT_SECONDS),
+    limits=httpx.Limits(max_connections=GOOGLE_HTTP_POOL_SIZE),
+)
+
+_certs: Dict[str, str] = {}
+_certs_expire_at = 0.0
+_certs_fetched_at = float("-inf")
+_certs_lock = threading.Lock()
+
+
+class GoogleUnavailable(Exception):
+    """Google could not be reached or did not answer successfully."""
+
+
+google_stats = {"cert_fetches": 0, "cert_hits": 0, "code_exchanges": 0}
+metrics.register("google_oauth", lambda: dict(google_stats))
+
+
+def certs_ttl(headers: Mapping[str, str]) -> float:
+    """Seconds Google lets us keep a response: max-age minus Age."""
+    match = MAX_AGE.search(headers.get("Cache-Control", ""))
+    if not match:
+        return GOOGLE_CERTS_DEFAULT_TTL_SECONDS
+    return max(0, int(match.group(1)) - int(headers.get("Age", "0")))
+
+
+def fetch_certs(force: bool = False) -> Dict[str, str]:
+    """Google's signing certificates by key id, refetched once expired.
+
+    Called from sync routes running in the threadpool, hence the lock; only
+    one thread refreshes, the others wait for its result.
+    """
+    global _certs, _certs_expire_at, _certs_fetched_at
+    with _certs_lock:
+        now = time.monotonic()
+        if force and now - _certs_fetched_at < GOOGLE_CERTS_MIN_REFRESH_SECONDS:
+            force = False
+        if not force and now < _certs_expire_at:
+            google_stats["cert_hits"] += 1
+            return _certs
+        response = transport(
+            GOOGLE_CERTS_URL, method="GET", timeout=GOOGLE_HTTP_TIMEOUT_SECONDS
+        )
+        if response.status != 200:
+            raise GoogleUnavailable(
+                f"Could not fetch Google certificates: {response.status}"
+            )
+        google_stats["cert_fetches"] += 1
+        _certs = json.loads(response.data)
+        _certs_fetched_at = now
+        _certs_expire_at = now + certs_ttl(response.headers)
+        return _certs
+
+
+def verify_id_token(token: str, audience: str) -> dict:
+    """Claims of a Google ID token; raises ``ValueError`` if it is invalid
+    and ``GoogleUnavailable`` if the certificates cannot be fetched.
+
+    An unknown key id refetches the certificates once, since Google may have
+    rotated its keys before our cached copy expired.
+    """
+    key_id = google_jwt.decode_header(token).get("kid")
+    try:
+        certs = fetch_certs()
+        if key_id not in certs:
+            certs = fetch_certs(force=True)
+    except google_exceptions.TransportError as e:
+        raise GoogleUnavailable(f"Could not fetch Google certificates: {e}") from e
+    claims = google_jwt.decode(token, certs=certs, audience=audience)
+    if claims.get("iss") not in GOOGLE_ISSUERS:
+        raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+    return claims
+
+
+async def exchange_code(data: dict) -> httpx.Response:
+    google_stats["code_exchanges"] += 1
+    return await http_client.post(GOOGLE_TOKEN_URL, data=data)
@@ -1,5 +1,6 @@
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import Order, Product, Bill
 from app import models
 
@@ -14,9 +15,9 @@ BASE_URL = "http://127.0.0.1:8000"
 PENDING = "Pending"
 
 
-def get_product_or_404(db: Session, product_id: int):
-    product = (
-        db.query(models.Product).filter(models.Product.product_id == product_id).first()
+async def get_product_or_404(db: AsyncSession, product_id: int):
+    product = await db.scalar(
+        select(models.Product).filter(models.Product.product_id == product_id)
     )
     if not product:
         raise HTTPException(
@@ -25,48 +26,126 @@ def get_product_or_404(db: Session, product_id: int):
     return product
 
 
-def get_order_or_404(db: Session, order_id: int, user_id: int):
-    order = (
-        db.query(models.Order)
-        .filter(models.Order.order_id == order_id, models.Order.user_id == user_id)
-        .first()
+async def get_products_for_update(db: AsyncSession, product_ids) -> dict:
+    """Lock and return ``{product_id: Product}`` for every id, in one query.
+
+    Rows are locked in product_id order so concurrent checkouts sharing
+    products cannot deadlock.
+    """
+    product_ids = sorted(set(product_ids))
+    products = (
+        await db.scalars(
+            select(models.Product)
+            .filter(models.Product.product_id.in_(product_ids))
+            .order_by(models.Product.product_id)
+            .with_for_update()
+        )
+    ).all()
+    found = {product.product_id: product for product in products}
+    for product_id in product_ids:
+        if product_id not in found:
+            raise HTTPException(
+                status.HTTP_404_NOT_FOUND, detail=PRODUCT_NOT_FOUND.format(product_id)
+            )
+    return found
+
+
+async def get_order_or_404(db: AsyncSession, order_id: int, user_id: int):
+    order = await db.scalar(
+        select(models.Order).filter(
+            models.Order.order_id == order_id, models.Order.user_id == user_id
+        )
     )
     if not order:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail=ORDER_NOT_FOUND)
     return order
 
 
-def get_bill_or_404(db: Session, order_id: int):
-    bill = db.query(models.Bill).filter(models.Bill.order_id == order_id).first()
+async def get_bill_or_404(db: AsyncSession, order_id: int):
+    bill = await db.scalar(select(models.Bill).filter(models.Bill.order_id == order_id))
     if not bill:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail=BILL_NOT_FOUND)
     return bill
 
 
-def get_order_items_details(db: Session, order_id: int):
-    items = (
-        db.query(models.OrderItem, models.Product, models.Brand)
+def order_items_query():
+    """OrderItem rows joined with their Product and Brand"""
+    return (
+        select(models.OrderItem, models.Product, models.Brand)
         .join(models.Product, models.OrderItem.product_id == models.Product.product_id)
         .join(models.Brand, models.Product.brand_id == models.Brand.brand_id)
-        .filter(models.OrderItem.order_id == order_id)
-        .all()
     )
-    return [
-        {
-            "product_id": product.product_id,
-            "brand_id": brand.brand_id,
-            "product_name": product.product_name,
-            "brand_name": brand.brand_name,
-            "order_size": order_item.size,
-            "order_quantity": order_item.quantity,
-        }
-        for order_item, product, brand in items
-    ]
-
-
-def get_user_brand_ids(db: Session, user_id: int) -> list:
+
+
+def format_order_item(order_item, product, brand):
+    """Format one order item as an OrderItemDetail payload"""
+    return {
+        "product_id": product.product_id,
+        "brand_id": brand.brand_id,
+        "product_name": product.product_name,
+        "brand_name": brand.brand_name,
+        "order_size": order_item.size,
+        "order_quantity": order_item.quantity,
+    }
+
+
+async def get_order_items_details(db: AsyncSession, order_id: int):
+    items = (
+        await db.execute(
+            order_items_query().filter(models.OrderItem.order_id == order_id)
+        )
+    ).all()
+    return [format_order_item(*row) for row in items]
+
+
+async def load_order_details(db: AsyncSession, orders: list) -> list:
+    """Build OrderDetailOut payloads for ``orders`` with one bill query and one
+    item query, however many orders there are"""
+    order_ids = [order.order_id for order in orders]
+    if not order_ids:
+        return []
+
+    bills = (
+        await db.scalars(
+            select(models.Bill).filter(models.Bill.order_id.in_(order_ids))
+        )
+    ).all()
+    bill_by_order = {bill.order_id: bill for bill in bills}
+
+    rows = (
+        await db.execute(
+            order_items_query()
+            .filter(models.OrderItem.order_id.in_(order_ids))
+            .order_by(models.OrderItem.order_item_id)
+        )
+    ).all()
+    items_by_order = {order_id: [] for order_id in order_ids}
+    for order_item, product, brand in rows:
+        items_by_order[order_item.order_id].append(
+            format_order_item(order_item, product, brand)
+        )
+
+    orders_details = []
+    for order in orders:
+        bill = bill_by_order.get(order.order_id)
+        orders_details.append(
+            {
+                "order_id": order.order_id,
+                "status": order.status,
+                "bill_status": bill.status if bill else None,
+                "created_at": order.created_at,
+                "bill_amount": bill.amount if bill else None,
+                "order_items": items_by_order[order.order_id],
+            }
+        )
+    return orders_details
+
+
+async def get_user_brand_ids(db: AsyncSession, user_id: int) -> list:
     """Get all brand IDs belonging to a user"""
-    user_brands = db.query(models.Brand).filter(models.Brand.user_id == user_id).all()
+    user_brands = (
+        await db.scalars(select(models.Brand).filter(models.Brand.user_id == user_id))
+    ).all()
     if not user_brands:
         raise HTTPException(
             status.HTTP_404_NOT_FOUND, detail="No brands found for this user"
@@ -75,16 +154,15 @@ def get_user_brand_ids(db: Session, user_id: int) -> list:
     return [brand.brand_id for brand in user_brands]
 
 
-def validate_artisan_order_access(
-    db: Session, order_id: int, brand_ids: list
+async def validate_artisan_order_access(
+    db: AsyncSession, order_id: int, brand_ids: list
 ) -> models.Order:
     """Validate that an order contains products from the artisan's brands"""
-    order_has_user_products = (
-        db.query(models.Order)
-        .filter(
+    order_has_user_products = await db.scalar(
+        select(models.Order).filter(
             models.Order.order_id == order_id,
             models.Order.order_id.in_(
-                db.query(models.OrderItem.order_id)
+                select(models.OrderItem.order_id)
                 .join(
                     models.Product,
                     models.OrderItem.product_id == models.Product.product_id,
@@ -92,7 +170,6 @@ def validate_artisan_order_access(
                 .filter(models.Product.brand_id.in_(brand_ids))
             ),
         )
-        .first()
     )
 
     if not order_has_user_products:
@@ -101,37 +178,29 @@ def validate_artisan_order_access(
             detail="Order not found or does not contain your products",
         )
 
-    order = db.query(models.Order).filter(models.Order.order_id == order_id).first()
+    order = await db.scalar(
+        select(models.Order).filter(models.Order.order_id == order_id)
+    )
     if not order:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Order not found")
 
     return order
 
 
-def get_artisan_order_items(db: Session, order_id: int, brand_ids: list) -> list:
+async def get_artisan_order_items(
+    db: AsyncSession, order_id: int, brand_ids: list
+) -> list:
     """Get order items that belong to the artisan's brands"""
     order_items = (
-        db.query(models.OrderItem, models.Product, models.Brand)
-        .join(models.Product, models.OrderItem.product_id == models.Product.product_id)
-        .join(models.Brand, models.Product.brand_id == models.Brand.brand_id)
-        .filter(
-            models.OrderItem.order_id == order_id,
-            models.Product.brand_id.in_(brand_ids),
+        await db.execute(
+            order_items_query().filter(
+                models.OrderItem.order_id == order_id,
+                models.Product.brand_id.in_(brand_ids),
+            )
         )
-        .all()
-    )
+    ).all()
 
-    return [
-        {
-            "product_id": product.product_id,
-            "brand_id": brand.brand_id,
-            "product_name": product.product_name,
-            "brand_name": brand.brand_name,
-            "order_size": order_item.size,
-            "order_quantity": order_item.quantity,
-        }
-        for order_item, product, brand in order_items
-    ]
+    return [format_order_item(*row) for row in order_items]
 
 
 def format_order_response(order):
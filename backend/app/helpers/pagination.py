@@ -0,0 +1,89 @@
+import base64
+import json
+import math
+from typing import NamedTuple, Optional
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+INVALID_CURSOR = "Invalid cursor"
+
+
+class PageParams:
+    """``cursor``/``limit`` query parameters shared by the list endpoints"""
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(
+            None, description="next_cursor of the previous page"
+        ),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+
+
+class RankCursor(NamedTuple):
+    """Position in a ranked result list: the stage that produced the page
+    and the score and id of its last hit."""
+
+    stage: str
+    score: float
+    key: int
+
+
+def _encode(data: dict) -> str:
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> dict:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    data = json.loads(base64.urlsafe_b64decode(padded))
+    if not isinstance(data, dict):
+        raise TypeError("cursor is not an object")
+    return data
+
+
+def encode_cursor(key: int) -> str:
+    return _encode({"k": key})
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(_decode(cursor)["k"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=INVALID_CURSOR)
+
+
+def encode_rank_cursor(stage: str, score: float, key: int) -> str:
+    return _encode({"m": stage, "s": score, "k": key})
+
+
+def decode_rank_cursor(cursor: str) -> RankCursor:
+    try:
+        data = _decode(cursor)
+        score = float(data["s"])
+        if not math.isfinite(score):
+            raise ValueError("score is not finite")
+        return RankCursor(str(data["m"]), score, int(data["k"]))
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=INVALID_CURSOR)
+
+
+async def paginate(db: AsyncSession, query, key_column, page: PageParams) -> dict:
+    """Keyset page of ``query`` ordered by ``key_column`` (an integer primary
+    key); the cursor is the last key returned."""
+    if page.cursor is not None:
+        query = query.filter(key_column > decode_cursor(page.cursor))
+    rows = (await db.scalars(query.order_by(key_column).limit(page.limit + 1))).all()
+    items = rows[: page.limit]
+    has_more = len(rows) > page.limit
+    return {
+        "items": items,
+        "next_cursor": (
+            encode_cursor(getattr(items[-1], key_column.key)) if has_more else None
+        ),
+    }
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app import metrics
+
+# Lower this in development and tests; production should keep >= 12.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+# Calls allowed to wait for a worker before new ones are shed with a 503.
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+HASHING_BUSY = "Too many sign-ins in progress, please retry shortly."
+
+# min == max == default, so a hash made with any other cost "needs update"
+# and is rewritten on the next successful login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# bcrypt releases the GIL, so these threads hash in parallel without
+# touching the event loop.
+_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+)
+_in_flight = 0
+
+hash_time = metrics.Histogram()
+verify_time = metrics.Histogram()
+queue_wait = metrics.Histogram()
+hashing_stats = {"shed": 0, "rehashed": 0}
+metrics.register(
+    "password_hashing",
+    lambda: {
+        **hashing_stats,
+        "in_flight": _in_flight,
+        "workers": PASSWORD_HASH_WORKERS,
+        "hash": hash_time.snapshot(),
+        "verify": verify_time.snapshot(),
+        "queue_wait": queue_wait.snapshot(),
+    },
+)
+
+
+async def _run(histogram: metrics.Histogram, func, *args):
+    global _in_flight
+    if _in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_PENDING:
+        hashing_stats["shed"] += 1
+        raise HTTPException(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=HASHING_BUSY,
+            headers={"Retry-After": "1"},
+        )
+
+    submitted = time.perf_counter()
+
+    def timed():
+        started = time.perf_counter()
+        queue_wait.observe(started - submitted)
+        try:
+            return func(*args)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, timed)
+    finally:
+        _in_flight -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(hash_time, pwd_context.hash, password)
+
+
+async def verify_and_update(
+    password: str, hashed: Optional[str]
+) -> Tuple[bool, Optional[str]]:
+    """``(valid, new_hash)``; ``new_hash`` is set when the stored hash was
+    made with other cost settings and should replace it."""
+    if not hashed:
+        return False, None
+    valid, new_hash = await _run(
+        verify_time, pwd_context.verify_and_update, password, hashed
+    )
+    if new_hash:
+        hashing_stats["rehashed"] += 1
+    return valid, new_hash
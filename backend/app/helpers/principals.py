@@ -0,0 +1,197 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import cache, metrics
+from app.models import User
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+# Upper bound on staleness if an invalidation message is lost.
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+# Revocations reach other workers over pub/sub; this bounds how long one can
+# still honour a revoked token if that message is lost.
+TOKEN_VERSION_TTL_SECONDS = float(os.getenv("TOKEN_VERSION_TTL_SECONDS", "5"))
+TOKEN_VERSION_REDIS_TTL_SECONDS = 3600
+TOKEN_VERSION_KEY = "token-version:{}"
+INVALIDATION_CHANNEL = "principal-invalidations"
+
+principals = cache.LRUCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+token_versions = cache.LRUCache(PRINCIPAL_CACHE_SIZE, TOKEN_VERSION_TTL_SECONDS)
+principal_stats = {
+    "hits": 0,
+    "misses": 0,
+    "invalidations": 0,
+    "version_hits": 0,
+    "version_misses": 0,
+}
+metrics.register(
+    "principal_cache", lambda: {**principal_stats, "size": len(principals)}
+)
+
+# Bumped by every invalidation; a load that raced one is not cached.
+_generation = 0
+
+
+@dataclass(frozen=True, slots=True)
+class CurrentUser:
+    """What routes need from the authenticated user, detached from any session.
+
+    Routes that change the user must load the ``User`` row themselves.
+    """
+
+    user_id: int
+    username: Optional[str]
+    email: str
+    full_name: Optional[str]
+    address: Optional[str]
+    phone: Optional[str]
+    role: str
+    is_verified: Optional[bool]
+
+    @classmethod
+    def from_user(cls, user: User) -> "CurrentUser":
+        return cls(
+            user_id=user.user_id,
+            username=user.username,
+            email=user.email,
+            full_name=user.full_name,
+            address=user.address,
+            phone=user.phone,
+            role=user.role,
+            is_verified=user.is_verified,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Identity:
+    """Caller identity taken from stateless token claims, without a query."""
+
+    user_id: int
+    email: str
+    role: str
+
+
+def get_principal(subject: str) -> Optional[CurrentUser]:
+    principal = principals.get(subject)
+    principal_stats["hits" if principal else "misses"] += 1
+    return principal
+
+
+def generation() -> int:
+    return _generation
+
+
+def remember_principal(subject: str, principal: CurrentUser, loaded_at: int):
+    """Cache ``principal`` unless an invalidation ran since ``loaded_at``."""
+    if loaded_at == _generation:
+        principals.set(subject, principal)
+
+
+def _forget(*subjects: str, user_id: Optional[int] = None):
+    global _generation
+    _generation += 1
+    for subject in subjects:
+        principals.pop(subject)
+    if user_id is not None:
+        token_versions.pop(user_id)
+
+
+async def bump_token_version(db: AsyncSession, user_id: int) -> int:
+    """Revoke every stateless token of ``user_id``. Runs in the caller's
+    transaction; pass the result to ``invalidate_principal`` after commit."""
+    return await db.scalar(
+        update(User)
+        .where(User.user_id == user_id)
+        .values(token_version=User.token_version + 1)
+        .returning(User.token_version)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def token_version(db: AsyncSession, user_id: int) -> Optional[int]:
+    """Current token version of ``user_id`` (None if the user is gone), from
+    this worker's cache, then Redis, then the database."""
+    version = token_versions.get(user_id)
+    principal_stats["version_hits" if version is not None else "version_misses"] += 1
+    if version is not None:
+        return version
+
+    key = TOKEN_VERSION_KEY.format(user_id)
+    if cache.redis_available():
+        try:
+            value = await cache.redis_client.get(key)
+        except RedisError as e:
+            cache.redis_failed(e)
+            value = None
+        if value is not None:
+            token_versions.set(user_id, int(value))
+            return int(value)
+
+    loaded_at = generation()
+    version = await db.scalar(select(User.token_version).where(User.user_id == user_id))
+    if version is None or loaded_at != _generation:
+        return version
+    token_versions.set(user_id, version)
+    if cache.redis_available():
+        try:
+            # nx: a concurrent bump has already written the newer value.
+            await cache.redis_client.set(
+                key, version, ex=TOKEN_VERSION_REDIS_TTL_SECONDS, nx=True
+            )
+        except RedisError as e:
+            cache.redis_failed(e)
+    return version
+
+
+async def invalidate_principal(
+    *subjects: str, user_id: Optional[int] = None, version: Optional[int] = None
+):
+    """Drop ``subjects`` (token subjects, i.e. emails) and, when given, the
+    cached token version of ``user_id`` here and, via Redis pub/sub, in
+    every other worker. Call after commit."""
+    principal_stats["invalidations"] += 1
+    _forget(*subjects, user_id=user_id)
+    if not cache.redis_available():
+        return
+    messages = [f"sub:{subject}" for subject in subjects]
+    try:
+        async with cache.redis_client.pipeline(transaction=False) as pipe:
+            if user_id is not None:
+                key = TOKEN_VERSION_KEY.format(user_id)
+                if version is None:
+                    pipe.delete(key)
+                else:
+                    pipe.set(key, version, ex=TOKEN_VERSION_REDIS_TTL_SECONDS)
+                messages.append(f"ver:{user_id}")
+            for message in messages:
+                pipe.publish(INVALIDATION_CHANNEL, message)
+            await pipe.execute()
+    except RedisError as e:
+        cache.redis_failed(e)
+
+
+async def listen_for_invalidations():
+    """Apply other workers' invalidations until cancelled; reconnects after
+    Redis errors."""
+    while cache.redis_client is not None:
+        try:
+            async with cache.redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    kind, _, value = message["data"].decode().partition(":")
+                    if kind == "sub":
+                        _forget(value)
+                    elif kind == "ver":
+                        _forget(user_id=int(value))
+        except RedisError as e:
+            print(f"Principal invalidation listener lost Redis: {e}")
+            # Anything published meanwhile was missed.
+            principals.clear()
+            await asyncio.sleep(cache.REDIS_RETRY_SECONDS)
@@ -0,0 +1,129 @@
+import math
+import os
+import time
+from typing import List, Tuple
+
+from fastapi import HTTPException, Request, status
+from redis.exceptions import RedisError
+
+from app import cache, metrics
+
+AUTH_RATE_LIMIT_ENABLED = os.getenv("AUTH_RATE_LIMIT_ENABLED", "True").lower() == "true"
+# Each bucket holds up to BURST attempts and refills at PER_MINUTE.
+AUTH_IP_BURST = int(os.getenv("AUTH_IP_BURST", "20"))
+AUTH_IP_PER_MINUTE = float(os.getenv("AUTH_IP_PER_MINUTE", "30"))
+AUTH_ACCOUNT_BURST = int(os.getenv("AUTH_ACCOUNT_BURST", "5"))
+AUTH_ACCOUNT_PER_MINUTE = float(os.getenv("AUTH_ACCOUNT_PER_MINUTE", "5"))
+LOCAL_BUCKETS_SIZE = 10000
+
+KEY_PREFIX = "ratelimit:auth:"
+TOO_MANY_ATTEMPTS = "Too many attempts, please retry later."
+
+# Takes one token from every bucket in KEYS, or from none of them. ARGV holds
+# (capacity, refill per second) for each key. Returns the seconds to wait as
+# a string ("0" when admitted); Redis would truncate a Lua float reply.
+TOKEN_BUCKET = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+    levels[i] = tokens
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - 1), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(capacity / rate))
+end
+return '0'
+"""
+
+token_bucket = (
+    cache.redis_client.register_script(TOKEN_BUCKET) if cache.redis_client else None
+)
+
+# Per-worker buckets used while Redis is unreachable or not configured; the
+# budget is then per worker rather than shared. An entry can go once its
+# bucket would have refilled.
+ip_refill_seconds = 60 * AUTH_IP_BURST / AUTH_IP_PER_MINUTE
+account_refill_seconds = 60 * AUTH_ACCOUNT_BURST / AUTH_ACCOUNT_PER_MINUTE
+local_buckets = cache.LRUCache(
+    LOCAL_BUCKETS_SIZE, max(ip_refill_seconds, account_refill_seconds)
+)
+
+rate_limit_stats = {"admitted": 0, "limited": 0, "local": 0}
+metrics.register("auth_rate_limit", lambda: dict(rate_limit_stats))
+
+Bucket = Tuple[str, int, float]  # key, capacity, refill per second
+
+
+def _take_local(buckets: List[Bucket]) -> float:
+    now = time.monotonic()
+    levels = []
+    wait = 0.0
+    for key, capacity, rate in buckets:
+        tokens, ts = local_buckets.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - ts) * rate)
+        if tokens < 1:
+            wait = max(wait, (1 - tokens) / rate)
+        levels.append(tokens)
+    if wait:
+        return wait
+    for (key, _, _), tokens in zip(buckets, levels):
+        local_buckets.set(key, (tokens - 1, now))
+    return 0.0
+
+
+async def _take(buckets: List[Bucket]) -> float:
+    """Seconds until every bucket has a token; 0 once one was taken from each."""
+    if token_bucket is not None and cache.redis_available():
+        args = []
+        for _, capacity, rate in buckets:
+            args += [capacity, rate]
+        try:
+            return float(
+                await token_bucket(keys=[key for key, _, _ in buckets], args=args)
+            )
+        except RedisError as e:
+            cache.redis_failed(e)
+    rate_limit_stats["local"] += 1
+    return _take_local(buckets)
+
+
+async def admit(request: Request, account: str):
+    """Spend one attempt from the caller's IP and ``account`` budgets, or
+    reject with 429 and ``Retry-After``. Call before any password hashing."""
+    if not AUTH_RATE_LIMIT_ENABLED:
+        return
+    ip = request.client.host if request.client else "unknown"
+    wait = await _take(
+        [
+            (f"{KEY_PREFIX}ip:{ip}", AUTH_IP_BURST, AUTH_IP_PER_MINUTE / 60),
+            (
+                f"{KEY_PREFIX}account:{account.strip().lower()}",
+                AUTH_ACCOUNT_BURST,
+                AUTH_ACCOUNT_PER_MINUTE / 60,
+            ),
+        ]
+    )
+    if wait > 0:
+        rate_limit_stats["limited"] += 1
+        raise HTTPException(
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=TOO_MANY_ATTEMPTS,
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+    rate_limit_stats["admitted"] += 1
@@ -0,0 +1,208 @@
+import asyncio
+import os
+from datetime import timedelta
+
+from fastapi import HTTPException, status
+from sqlalchemy import (
+    Integer,
+    column,
+    delete,
+    func,
+    insert,
+    select,
+    update,
+    values,
+)
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics, models
+from app.database import AsyncSessionLocal
+from app.helpers.orders import INSUFFICIENT_STOCK, PENDING
+
+RESERVATION_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_SECONDS", "900"))
+RESERVATION_SWEEP_SECONDS = float(os.getenv("RESERVATION_SWEEP_SECONDS", "60"))
+
+CONFIRMED = "Confirmed"
+EXPIRED = "Expired"
+# Bill statuses whose order no longer holds any stock.
+RELEASED_STATUSES = ("Failed", "Cancelled", EXPIRED)
+# Paid after the order's stock was released, and the stock could not be taken
+# again: the payment has to be refunded by hand.
+REFUND_DUE = "Refund Due"
+STOCK_RELEASED = "Reserved stock for this order was released; please order again."
+
+reservation_stats = {"reserved": 0, "restocked": 0, "expired": 0, "rejected": 0}
+metrics.register("stock_reservations", lambda: dict(reservation_stats))
+
+
+async def take_stock(db: AsyncSession, quantities: dict) -> set:
+    """Take ``quantities`` (``{product_id: n}``) out of stock with one
+    conditional ``UPDATE ... WHERE order_quantity >= n``; returns the ids it
+    took. A product left out is short, and the caller must roll back."""
+    wanted = values(
+        column("product_id", Integer), column("quantity", Integer), name="wanted"
+    ).data(sorted(quantities.items()))
+    return set(
+        (
+            await db.scalars(
+                update(models.Product)
+                .where(
+                    models.Product.product_id == wanted.c.product_id,
+                    models.Product.order_quantity >= wanted.c.quantity,
+                )
+                .values(
+                    order_quantity=models.Product.order_quantity - wanted.c.quantity
+                )
+                .returning(models.Product.product_id)
+                .execution_options(synchronize_session=False)
+            )
+        ).all()
+    )
+
+
+async def reserve_stock(db: AsyncSession, order_id: int, products: dict, quantities):
+    """Take ``quantities`` (``{product_id: n}``) out of stock for ``order_id``.
+
+    A product ``take_stock`` skipped is out of stock and the caller's
+    transaction is abandoned with a 400. Products without a stock count
+    (``order_quantity`` NULL) are unlimited and are not reserved.
+    """
+    limited = {
+        product_id: quantity
+        for product_id, quantity in quantities.items()
+        if products[product_id].order_quantity is not None
+    }
+    if not limited:
+        return
+
+    reserved = await take_stock(db, limited)
+    for product_id in sorted(limited):
+        if product_id not in reserved:
+            reservation_stats["rejected"] += 1
+            raise HTTPException(
+                status.HTTP_400_BAD_REQUEST,
+                detail=INSUFFICIENT_STOCK.format(products[product_id].product_name),
+            )
+
+    await db.execute(
+        insert(models.StockReservation).values(
+            expires_at=func.now() + timedelta(seconds=RESERVATION_TTL_SECONDS)
+        ),
+        [
+            {"order_id": order_id, "product_id": product_id, "quantity": quantity}
+            for product_id, quantity in limited.items()
+        ],
+    )
+    reservation_stats["reserved"] += len(limited)
+
+
+async def release_reservations(db: AsyncSession, order_ids) -> int:
+    """Put the stock held for ``order_ids`` back, in one statement. Returns
+    the number of products restocked.
+
+    The reservations are deleted in a CTE that feeds the stock update, so a
+    reservation is returned exactly once even if two callers race.
+    """
+    released = (
+        delete(models.StockReservation)
+        .where(models.StockReservation.order_id.in_(order_ids))
+        .returning(models.StockReservation.product_id, models.StockReservation.quantity)
+        .cte("released")
+    )
+    totals = (
+        select(released.c.product_id, func.sum(released.c.quantity).label("quantity"))
+        .group_by(released.c.product_id)
+        .subquery("totals")
+    )
+    result = await db.execute(
+        update(models.Product)
+        .where(models.Product.product_id == totals.c.product_id)
+        .values(order_quantity=models.Product.order_quantity + totals.c.quantity)
+        .add_cte(released)
+        .execution_options(synchronize_session=False)
+    )
+    reservation_stats["restocked"] += result.rowcount
+    return result.rowcount
+
+
+async def confirm_reservations(db: AsyncSession, order_id: int):
+    """The order is paid: its stock stays taken and the holds are dropped."""
+    await db.execute(
+        delete(models.StockReservation).where(
+            models.StockReservation.order_id == order_id
+        )
+    )
+
+
+async def reclaim_stock(db: AsyncSession, order_id: int) -> bool:
+    """Take the stock of a released order's items again, all or nothing;
+    False, with nothing taken, if any product is short."""
+    quantities = dict(
+        (
+            await db.execute(
+                select(models.OrderItem.product_id, func.sum(models.OrderItem.quantity))
+                .join(models.Product)
+                .where(
+                    models.OrderItem.order_id == order_id,
+                    models.Product.order_quantity.is_not(None),
+                )
+                .group_by(models.OrderItem.product_id)
+            )
+        ).all()
+    )
+    if not quantities:
+        return True
+    async with db.begin_nested() as savepoint:
+        if await take_stock(db, quantities) != set(quantities):
+            await savepoint.rollback()
+            return False
+    return True
+
+
+async def release_expired(db: AsyncSession) -> int:
+    """Mark the unpaid bills of orders with a reservation past its TTL as
+    expired and release those orders' stock. Returns the number of orders
+    released.
+
+    The bill is claimed first, with the same row a payment callback claims,
+    so an order is either expired here or confirmed there, never both.
+    """
+    order_ids = (
+        await db.scalars(
+            select(models.StockReservation.order_id)
+            .where(models.StockReservation.expires_at < func.now())
+            .distinct()
+        )
+    ).all()
+    if not order_ids:
+        return 0
+    expired = (
+        await db.scalars(
+            update(models.Bill)
+            .where(models.Bill.order_id.in_(order_ids), models.Bill.status == PENDING)
+            .values(status=EXPIRED)
+            .returning(models.Bill.order_id)
+            .execution_options(synchronize_session=False)
+        )
+    ).all()
+    if expired:
+        await release_reservations(db, expired)
+    await db.commit()
+    reservation_stats["expired"] += len(expired)
+    return len(expired)
+
+
+async def sweep_expired_reservations():
+    """Run ``release_expired`` every ``RESERVATION_SWEEP_SECONDS``.
+
+    Safe to run in every worker: the delete in ``release_reservations`` hands
+    each reservation to only one of them.
+    """
+    while True:
+        await asyncio.sleep(RESERVATION_SWEEP_SECONDS)
+        try:
+            async with AsyncSessionLocal() as db:
+                await release_expired(db)
+        except SQLAlchemyError as e:
+            print(f"Reservation sweep failed: {e}")
@@ -1,4 +1,6 @@
+import asyncio
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -10,14 +12,26 @@ from app.routers import (
     profile,
     paybill,
     admin,
+    metrics,
 )
 from app.minio.routers import upload
 from app.ai.routers import search
+from app.ai.utils.fuzzy_match import maintain_catalog
+from app.ai.utils.lexicon import refresh_lexicon, save_learned_terms
+from app.ai.utils.product_index import maintain_index
+from app.ai.utils.query_parser import refresh_vocabulary
+from app.ai.utils.suggestions import maintain_suggestions
+from app.ai.utils.tfidf_ranking import maintain_ranking
+from app.helpers import google_oauth
+from app.helpers.principals import listen_for_invalidations
+from app.helpers.reservations import (
+    RESERVATION_SWEEP_SECONDS,
+    sweep_expired_reservations,
+)
 
 import dotenv
 import sentry_sdk
 
-
 dotenv.load_dotenv()
 
 sentry_sdk.init(
@@ -27,7 +41,53 @@ sentry_sdk.init(
     instrumenter="otel",
 )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sweeper = (
+        asyncio.create_task(sweep_expired_reservations())
+        if RESERVATION_SWEEP_SECONDS > 0
+        else None
+    )
+    listener = asyncio.create_task(listen_for_invalidations())
+    vocabulary = asyncio.create_task(refresh_vocabulary())
+    lexicon = asyncio.create_task(refresh_lexicon())
+    lexicon_saver = asyncio.create_task(save_learned_terms())
+    suggester = asyncio.create_task(maintain_suggestions())
+    indexer = (
+        asyncio.create_task(maintain_index())
+        if search.SEARCH_BACKEND == "memory"
+        else None
+    )
+    ranker = (
+        asyncio.create_task(maintain_ranking())
+        if search.SEARCH_BACKEND == "tfidf"
+        else None
+    )
+    fuzzy_catalog = (
+        asyncio.create_task(maintain_catalog())
+        if search.SEARCH_BACKEND in ("memory", "tfidf")
+        else None
+    )
+    yield
+    if fuzzy_catalog:
+        fuzzy_catalog.cancel()
+    if ranker:
+        ranker.cancel()
+    if indexer:
+        indexer.cancel()
+    suggester.cancel()
+    lexicon_saver.cancel()
+    lexicon.cancel()
+    vocabulary.cancel()
+    listener.cancel()
+    if sweeper:
+        sweeper.cancel()
+    await google_oauth.http_client.aclose()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Handicrafts API Documentation",
     description="API for the Handicrafts application",
     version="1.0.0",
@@ -41,7 +101,7 @@ origins = [
     "http://localhost:3001",
     "http://localhost:3000",
     "https://handi-craft.xyz",
-    "https://www.handi-craft.xyz/"
+    "https://www.handi-craft.xyz/",
 ]
 
 app.add_middleware(
@@ -62,6 +122,7 @@ app.include_router(upload.router, prefix="", tags=["Upload"])
 app.include_router(order.router, prefix="", tags=["Orders"])
 app.include_router(paybill.router, prefix="", tags=["Paybills"])
 app.include_router(search.router, prefix="/search", tags=["Semantic Search"])
+app.include_router(metrics.router, prefix="", tags=["Metrics"])
 
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000, reload=True)
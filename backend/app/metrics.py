@@ -0,0 +1,52 @@
+import os
+import threading
+from typing import Callable, Dict, Sequence
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_sources: Dict[str, Callable[[], dict]] = {}
+
+
+class Histogram:
+    """Thread-safe histogram of observed durations, in seconds."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.bucket_counts[i] += 1
+                    break
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets, self.bucket_counts):
+                cumulative += count
+                buckets[f"le_{bound}"] = cumulative
+            buckets["le_inf"] = self.count
+            return {
+                "count": self.count,
+                "sum": round(self.sum, 6),
+                "max": round(self.max, 6),
+                "buckets": buckets,
+            }
+
+
+def register(name: str, source: Callable[[], dict]):
+    """Expose ``source()`` under ``name`` in the /metrics payload."""
+    _sources[name] = source
+
+
+def snapshot() -> dict:
+    return {"pid": os.getpid(), **{name: source() for name, source in _sources.items()}}
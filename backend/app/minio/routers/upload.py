@@ -14,8 +14,9 @@ from app.minio.utils import (
     find_product_and_url,
 )
 from app.minio.schemas import ProductPhotoUploadResponse
-from app.utils import get_current_user
-from app.models import User, Product
+from app.helpers.principals import Identity
+from app.utils import get_current_identity
+from app.models import Product
 from app.database import get_db
 from sqlalchemy.orm import Session
 from sqlalchemy import any_
@@ -28,7 +29,7 @@ router = APIRouter()
 async def unified_upload(
     upload_type: str = Form(...),
     files: List[UploadFile] = File(...),
-    user: User = Depends(get_current_user),  # Require user login
+    user: Identity = Depends(get_current_identity),  # Require user login
 ):
     if upload_type.lower() not in VALID_TYPES:
         raise HTTPException(
@@ -60,7 +61,7 @@ async def unified_upload(
 async def update_uploaded_files(
     upload_type: str = Form(...),
     files: List[UploadFile] = File(...),
-    user: User = Depends(get_current_user),
+    user: Identity = Depends(get_current_identity),
 ):
     upload_type = upload_type.lower()
     if upload_type not in VALID_TYPES:
@@ -90,7 +91,7 @@ async def delete_uploaded_file(
     upload_type: str,
     file_name: str,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Identity = Depends(get_current_identity),
 ):
     upload_type = upload_type.lower()
 
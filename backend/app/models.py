@@ -8,9 +8,13 @@ from sqlalchemy import (
     ARRAY,
     ForeignKey,
     TIMESTAMP,
+    Index,
+    DDL,
+    event,
     func,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from app.database import Base
 
 
@@ -29,8 +33,10 @@ class User(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
     is_verified = Column(Boolean, default=False)
+    # Bumped to revoke every stateless access token issued to this user.
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
-    brands = relationship("Brand", back_populates="user")
+    brands = relationship("Brand", back_populates="user", passive_deletes=True)
 
     orders = relationship("Order", back_populates="user")
 
@@ -40,7 +46,10 @@ class Brand(Base):
 
     brand_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(
-        Integer, ForeignKey("user.user_id", ondelete="CASCADE"), nullable=False
+        Integer,
+        ForeignKey("user.user_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
     )
     brand_name = Column(String(255), nullable=False)
     brand_description = Column(Text)
@@ -48,7 +57,7 @@ class Brand(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())
 
     user = relationship("User", back_populates="brands")
-    products = relationship("Product", back_populates="brand")
+    products = relationship("Product", back_populates="brand", passive_deletes=True)
 
 
 class Product(Base):
@@ -56,7 +65,10 @@ class Product(Base):
 
     product_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     brand_id = Column(
-        Integer, ForeignKey("brand.brand_id", ondelete="CASCADE"), nullable=False
+        Integer,
+        ForeignKey("brand.brand_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
     )
     product_name = Column(String(255), nullable=False)
     product_pic = Column(ARRAY(Text))
@@ -70,17 +82,66 @@ class Product(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())
     rating = Column(DECIMAL(3, 2), nullable=True)
     approved = Column(Boolean, default=True)
+    # Maintained by the product_search_vector_update trigger; deferred so the
+    # catalog endpoints never load it.
+    search_vector = deferred(Column(TSVECTOR, nullable=True))
 
     brand = relationship("Brand", back_populates="products")
 
+    __table_args__ = (
+        Index("ix_product_approved_category_price", "approved", "category", "price"),
+        Index("ix_product_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_product_name_trgm",
+            "product_name",
+            postgresql_using="gin",
+            postgresql_ops={"product_name": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_product_category_trgm",
+            "category",
+            postgresql_using="gin",
+            postgresql_ops={"category": "gin_trgm_ops"},
+        ),
+    )
+
+
+# Same objects as migration 9b4e2f6a1c3d, for databases built with create_all.
+# The 'simple' configuration does no stemming, which suits Bangla and English.
+PRODUCT_SEARCH_FUNCTION = """
+CREATE OR REPLACE FUNCTION product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.product_name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.category, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+PRODUCT_SEARCH_TRIGGER = """
+CREATE TRIGGER product_search_vector_trigger
+BEFORE INSERT OR UPDATE OF product_name, category, description ON product
+FOR EACH ROW EXECUTE FUNCTION product_search_vector_update()
+"""
+
+event.listen(
+    Product.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+)
+event.listen(Product.__table__, "after_create", DDL(PRODUCT_SEARCH_FUNCTION))
+event.listen(Product.__table__, "after_create", DDL(PRODUCT_SEARCH_TRIGGER))
+
 
 class Order(Base):
     __tablename__ = "orders"
     order_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(
-        Integer, ForeignKey("user.user_id", ondelete="CASCADE"), nullable=False
+        Integer,
+        ForeignKey("user.user_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
     )
-    status = Column(String(50), nullable=False)
+    status = Column(String(50), nullable=False, index=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
     user = relationship("User", back_populates="orders")
@@ -97,10 +158,16 @@ class OrderItem(Base):
     order_item_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
 
     order_id = Column(
-        Integer, ForeignKey("orders.order_id", ondelete="CASCADE"), nullable=False
+        Integer,
+        ForeignKey("orders.order_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
     )
     product_id = Column(
-        Integer, ForeignKey("product.product_id", ondelete="CASCADE"), nullable=False
+        Integer,
+        ForeignKey("product.product_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
     )
     size = Column(String(50), nullable=True)
     quantity = Column(Integer, nullable=False)
@@ -112,11 +179,39 @@ class OrderItem(Base):
     product = relationship("Product")
 
 
+class StockReservation(Base):
+    """Stock taken out of ``Product.order_quantity`` for an unpaid order.
+
+    Deleted when the order is paid; released back to the product when the
+    payment fails, is cancelled or ``expires_at`` passes.
+    """
+
+    __tablename__ = "stock_reservations"
+    reservation_id = Column(Integer, primary_key=True, autoincrement=True)
+    order_id = Column(
+        Integer,
+        ForeignKey("orders.order_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    product_id = Column(
+        Integer,
+        ForeignKey("product.product_id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(TIMESTAMP, nullable=False, index=True)
+
+
 class Bill(Base):
     __tablename__ = "bills"
     bill_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     order_id = Column(
-        Integer, ForeignKey("orders.order_id", ondelete="CASCADE"), nullable=False
+        Integer,
+        ForeignKey("orders.order_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+        unique=True,
     )
     amount = Column(DECIMAL(10, 2), nullable=False)
     method = Column(String(50), nullable=False)
@@ -125,3 +220,29 @@ class Bill(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())
 
     order = relationship("Order", back_populates="bill")
+
+
+class LexiconTerm(Base):
+    """A search word or phrase and its English meaning: the translation of a
+    Bangla term, the synonyms of an English one. Seeded with a glossary and
+    the catalog's names, then grown from the LLM's keyword answers once
+    enough of them agree (see ``LexiconVote``)."""
+
+    __tablename__ = "search_lexicon"
+    term = Column(String(255), primary_key=True)
+    translation = Column(String(255), nullable=True)
+    synonyms = Column(ARRAY(String(255)), nullable=False, server_default="{}")
+    source = Column(String(20), nullable=False)  # "glossary", "catalog" or "llm"
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+
+class LexiconVote(Base):
+    """How many LLM answers gave ``value`` as the translation or a synonym of
+    ``term``; a pair becomes a ``LexiconTerm`` once enough answers agree."""
+
+    __tablename__ = "search_lexicon_votes"
+    term = Column(String(255), primary_key=True)
+    kind = Column(String(20), primary_key=True)  # "translation" or "synonym"
+    value = Column(String(255), primary_key=True)
+    votes = Column(Integer, nullable=False, server_default="0")
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
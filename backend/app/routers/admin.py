@@ -1,15 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.models import User, Product, Order
-from app.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import cache
+from app.models import User, Brand, Product, Order
+from app.database import get_async_db
+from app.helpers.principals import bump_token_version, invalidate_principal
 from app.utils import get_current_admin
+from app.helpers.pagination import PageParams, paginate
 from app.schemas import UserUpdate, ProductUpdate, OrderUpdate, PromoteUser
 
 router = APIRouter()
 
 
-def get_object_or_404(model, object_id: int, db: Session, field="id", name="Item"):
-    obj = db.query(model).filter(getattr(model, field) == object_id).first()
+async def get_object_or_404(
+    model, object_id: int, db: AsyncSession, field="id", name="Item"
+):
+    obj = await db.scalar(select(model).filter(getattr(model, field) == object_id))
     if not obj:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail=f"{name} not found"
@@ -26,7 +32,7 @@ def update_object_fields(db_obj, update_data):
 async def promote_user(
     user_id: int,
     role_data: PromoteUser,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin),
 ):
     if role_data.role.lower() != "admin":
@@ -35,114 +41,139 @@ async def promote_user(
             detail="Invalid role. Only 'admin' is allowed.",
         )
 
-    user = get_object_or_404(User, user_id, db, field="user_id", name="User")
+    user = await get_object_or_404(User, user_id, db, field="user_id", name="User")
     user.role = "admin"
-    db.commit()
-    db.refresh(user)
+    version = await bump_token_version(db, user_id)
+    await db.commit()
+    await db.refresh(user)
+    await invalidate_principal(user.email, user_id=user_id, version=version)
     return {"detail": f"User {user.username} is now an admin"}
 
 
 @router.get("/users")
 async def get_all_users(
-    db: Session = Depends(get_db),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin),
 ):
-    return db.query(User).all()
+    return await paginate(db, select(User), User.user_id, page)
 
 
 @router.put("/users/{user_id}")
 async def update_user(
     user_id: int,
     user_data: UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin),
 ):
-    user = get_object_or_404(User, user_id, db, field="user_id", name="User")
+    user = await get_object_or_404(User, user_id, db, field="user_id", name="User")
+    old_email = user.email
     update_object_fields(user, user_data)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    await invalidate_principal(old_email, user.email)
     return user
 
 
 @router.delete("/users/{user_id}")
 async def delete_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin),
 ):
-    user = get_object_or_404(User, user_id, db, field="user_id", name="User")
-    db.delete(user)
-    db.commit()
+    user = await get_object_or_404(User, user_id, db, field="user_id", name="User")
+    # Their brands and products go with them through ON DELETE CASCADE.
+    products = (
+        await db.execute(
+            select(Brand.brand_id, Product.product_id)
+            .outerjoin(Product, Product.brand_id == Brand.brand_id)
+            .filter(Brand.user_id == user_id)
+        )
+    ).all()
+    await db.delete(user)
+    await db.commit()
+    await invalidate_principal(user.email, user_id=user_id)
+    tags = set()
+    for brand_id, product_id in products:
+        tags.update(cache.brand_tags(brand_id))
+        if product_id is not None:
+            tags.update(cache.product_tags(product_id, brand_id))
+    if tags:
+        await cache.invalidate(*tags)
     return {"detail": "User deleted successfully"}
 
 
 @router.get("/products")
 async def get_all_products(
-    db: Session = Depends(get_db),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin),
 ):
-    return db.query(Product).all()
+    return await paginate(db, select(Product), Product.product_id, page)
 
 
 @router.put("/products/{product_id}")
 async def update_product(
     product_id: int,
     product_data: ProductUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin),
 ):
-    product = get_object_or_404(
+    product = await get_object_or_404(
         Product, product_id, db, field="product_id", name="Product"
     )
     update_object_fields(product, product_data)
-    db.commit()
-    db.refresh(product)
+    await db.commit()
+    await db.refresh(product)
+    await cache.invalidate(*cache.product_tags(product_id, product.brand_id))
     return product
 
 
 @router.delete("/products/{product_id}")
 async def delete_product(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin),
 ):
-    product = get_object_or_404(
+    product = await get_object_or_404(
         Product, product_id, db, field="product_id", name="Product"
     )
-    db.delete(product)
-    db.commit()
+    await db.delete(product)
+    await db.commit()
+    await cache.invalidate(*cache.product_tags(product_id, product.brand_id))
     return {"detail": "Product deleted successfully"}
 
 
 @router.get("/orders")
 async def get_all_orders(
-    db: Session = Depends(get_db),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin),
 ):
-    return db.query(Order).all()
+    return await paginate(db, select(Order), Order.order_id, page)
 
 
 @router.put("/orders/{order_id}")
 async def update_order(
     order_id: int,
     order_data: OrderUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin),
 ):
-    order = get_object_or_404(Order, order_id, db, field="order_id", name="Order")
+    order = await get_object_or_404(Order, order_id, db, field="order_id", name="Order")
     update_object_fields(order, order_data)
-    db.commit()
-    db.refresh(order)
+    await db.commit()
+    await db.refresh(order)
     return order
 
 
 @router.delete("/orders/{order_id}")
 async def delete_order(
     order_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin),
 ):
-    order = get_object_or_404(Order, order_id, db, field="order_id", name="Order")
-    db.delete(order)
-    db.commit()
+    order = await get_object_or_404(Order, order_id, db, field="order_id", name="Order")
+    await db.delete(order)
+    await db.commit()
     return {"detail": "Order deleted successfully"}
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, status
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, status
 from sqlalchemy.orm import Session
 from datetime import timedelta
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import User
 from app.schemas import (
     UserCreate,
@@ -11,9 +12,12 @@ from app.schemas import (
     ResetPasswordRequest,
     RegistrationResponse,
 )
+from app.helpers import rate_limit
+from app.helpers.principals import Identity, bump_token_version, invalidate_principal
 from app.utils import (
     auth_utils,
-    create_access_token,
+    create_user_token,
+    get_current_identity,
     create_email_verification_token,
     verify_reset_token,
     create_reset_token,
@@ -21,7 +25,7 @@ from app.utils import (
     authenticate_user,
 )
 from app.tasks import send_verification_email
-from app.database import get_db
+from app.database import get_async_db, get_db
 import os
 
 router = APIRouter()
@@ -31,6 +35,7 @@ USER_EXISTS = "User already exists."
 USER_NOT_FOUND = "User not found"
 PASSWORD_RESET_SUCCESS = "Password reset successful."
 PASSWORD_RESET_SENT = "If the email exists, a password reset link has been sent."
+LOGGED_OUT = "Logged out."
 
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 
@@ -45,15 +50,33 @@ def raise_invalid_credentials():
 
 @router.post("/token")
 async def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+    http_request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: Session = Depends(get_db),
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    await rate_limit.admit(http_request, form_data.username)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise_invalid_credentials()
-    token = create_access_token({"sub": user.email}, timedelta(minutes=30))
+    token = create_user_token(user, timedelta(minutes=30))
     return {"access_token": token, "token_type": "bearer"}
 
 
+@router.post("/logout")
+async def logout(
+    db: AsyncSession = Depends(get_async_db),
+    identity: Identity = Depends(get_current_identity),
+):
+    """Revoke every stateless token of the caller. Tokens without the
+    stateless claims stay valid until they expire."""
+    version = await bump_token_version(db, identity.user_id)
+    await db.commit()
+    await invalidate_principal(
+        identity.email, user_id=identity.user_id, version=version
+    )
+    return {"message": LOGGED_OUT}
+
+
 @router.post("/forgot-password")
 async def forgot_password(
     request: ForgotPasswordRequest,
@@ -79,13 +102,16 @@ async def reset_password(data: ResetPasswordRequest, db: Session = Depends(get_d
     user = get_user_by_email(db, email)
     if not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail=USER_NOT_FOUND)
-    user.password = auth_utils.hash_password(data.new_password)
+    user.password = await auth_utils.hash_password(data.new_password)
     db.commit()
     return {"message": PASSWORD_RESET_SUCCESS}
 
 
 @router.post("/register", response_model=RegistrationResponse)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(
+    http_request: Request, user: UserCreate, db: Session = Depends(get_db)
+):
+    await rate_limit.admit(http_request, user.email)
     existing_user = (
         db.query(User)
         .filter((User.email == user.email) | (User.username == user.username))
@@ -96,7 +122,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     new_user = User(
         username=user.username,
         email=user.email,
-        password=auth_utils.hash_password(user.password),
+        password=await auth_utils.hash_password(user.password),
         full_name=user.full_name,
         address=user.address,
         phone=user.phone,
@@ -114,12 +140,15 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=Token)
-async def login(request: LoginRequest, db: Session = Depends(get_db)):
+async def login(
+    http_request: Request, request: LoginRequest, db: Session = Depends(get_db)
+):
+    await rate_limit.admit(http_request, request.email)
     user = get_user_by_email(db, request.email)
-    if not user or not auth_utils.verify_password(request.password, user.password):
+    if not user or not await auth_utils.check_password(db, user, request.password):
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail=USER_NOT_FOUND)
 
-    token = create_access_token({"sub": user.email}, timedelta(days=30))
+    token = create_user_token(user, timedelta(days=30))
     data = {
         "username": user.username,
         "email": user.email,
@@ -139,7 +168,7 @@ def google_signup(id_token: str, db: Session = Depends(get_db)):
 
         existing_user = db.query(User).filter(User.email == user_info["email"]).first()
         if existing_user:
-            access_token = create_access_token({"sub": user_info["email"]})
+            access_token = create_user_token(existing_user)
             return {"access_token": access_token, "token_type": "bearer"}
 
         new_user = User(
@@ -154,8 +183,10 @@ def google_signup(id_token: str, db: Session = Depends(get_db)):
         db.add(new_user)
         db.commit()
         db.refresh(new_user)
-        access_token = create_access_token({"sub": new_user.email})
+        access_token = create_user_token(new_user)
         return {"access_token": access_token, "token_type": "bearer"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
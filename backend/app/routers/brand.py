@@ -1,40 +1,47 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
+from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app import cache
+from app.database import get_async_db
 import app.schemas as schemas
 import app.models as models
-from app.models import User, Brand
+from app.models import Brand
+from app.helpers.pagination import PageParams, paginate
+from app.helpers.principals import Identity
 from app.utils import (
-    get_current_user,
+    get_current_identity,
 )
 from typing import List, Optional
 
 from fastapi import APIRouter
 
-
 router = APIRouter()
 
 
 @router.get("/brands")
 async def get_brands(
-    db: Session = Depends(get_db),
-    skip: int = 0,
-    limit: int = 100,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    page: PageParams = Depends(),
 ):
-    brands = db.query(models.Brand).offset(skip).limit(limit).all()
-    return brands
+    async def render():
+        result = await paginate(db, select(models.Brand), models.Brand.brand_id, page)
+        return jsonable_encoder(result), ["brands"]
 
+    return await cache.cached_json(request, render)
 
 
 @router.post("/brands", response_model=schemas.BrandOut)
 async def create_brand(
     brand: schemas.BrandCreate,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    user: Identity = Depends(get_current_identity),
 ):
 
-    existing_brand = (
-        db.query(models.Brand).filter(models.Brand.user_id == user.user_id).first()
+    existing_brand = await db.scalar(
+        select(models.Brand).filter(models.Brand.user_id == user.user_id)
     )
 
     if existing_brand:
@@ -50,19 +57,19 @@ async def create_brand(
         logo=brand.logo,
     )
     db.add(new_brand)
-    db.commit()
-    db.refresh(new_brand)
+    await db.commit()
+    await db.refresh(new_brand)
+    await cache.invalidate(*cache.brand_tags(new_brand.brand_id))
     return new_brand
 
 
 @router.get("/brands/me", response_model=schemas.BrandOut)
 async def get_my_brand(
-    db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Identity = Depends(get_current_identity),
 ):
-    brand = (
-        db.query(models.Brand)
-        .filter(models.Brand.user_id == current_user.user_id)
-        .first()
+    brand = await db.scalar(
+        select(models.Brand).filter(models.Brand.user_id == current_user.user_id)
     )
 
     if not brand:
@@ -74,13 +81,11 @@ async def get_my_brand(
 @router.patch("/brands/me", response_model=schemas.BrandOut)
 async def update_brand(
     brand: schemas.BrandCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Identity = Depends(get_current_identity),
 ):
-    db_brand = (
-        db.query(models.Brand)
-        .filter(models.Brand.user_id == current_user.user_id)
-        .first()
+    db_brand = await db.scalar(
+        select(models.Brand).filter(models.Brand.user_id == current_user.user_id)
     )
 
     if not db_brand:
@@ -91,24 +96,28 @@ async def update_brand(
     for key, value in update_data.items():
         setattr(db_brand, key, value)
 
-    db.commit()
-    db.refresh(db_brand)
+    await db.commit()
+    await db.refresh(db_brand)
+    await cache.invalidate(*cache.brand_tags(db_brand.brand_id))
     return db_brand
 
 
 @router.get("/brands/{brand_id}")
 async def get_brand(
     brand_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    brand = db.query(models.Brand).filter(models.Brand.brand_id == brand_id).first()
+    async def render():
+        brand = await db.scalar(
+            select(models.Brand)
+            .options(selectinload(models.Brand.products))
+            .filter(models.Brand.brand_id == brand_id)
+        )
 
-    if not brand:
-        raise HTTPException(status_code=404, detail="Brand not found")
+        if not brand:
+            raise HTTPException(status_code=404, detail="Brand not found")
 
-    products = (
-        db.query(models.Product).filter(models.Product.brand_id == brand_id).all()
-    )
-    brand.products = products
+        return jsonable_encoder(brand), [f"brand:{brand_id}"]
 
-    return brand
+    return await cache.cached_json(request, render)
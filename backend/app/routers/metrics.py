@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+
+from app import metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Counters for the worker that serves the request (see ``pid``)."""
+    return metrics.snapshot()
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Form
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from datetime import datetime
 import uuid
@@ -9,15 +10,29 @@ import os
 import secrets
 from dotenv import load_dotenv
 from fastapi_mail import FastMail, MessageSchema
-from app.database import get_db
+from app.database import get_async_db, remember_write
 from app import models, schemas
 from app.utils import get_current_user, conf
+from app.helpers.reservations import (
+    CONFIRMED,
+    REFUND_DUE,
+    RELEASED_STATUSES,
+    STOCK_RELEASED,
+    confirm_reservations,
+    reclaim_stock,
+    release_reservations,
+)
 from sslcommerz_lib import SSLCOMMERZ
 from fastapi.responses import HTMLResponse
 
 load_dotenv()
 router = APIRouter()
 
+PAYMENT_REFUND_DUE = (
+    "Payment arrived after the order's stock was released and sold; "
+    "it will be refunded."
+)
+
 
 def send_sms(to: str, text: str):
     try:
@@ -53,23 +68,23 @@ async def send_email(to: str, subject: str, body: str):
 
 
 @router.post("/initiate-payment")
-def initiate_payment(
+async def initiate_payment(
     request: Request,
     paybill_data: schemas.PayBillRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    bill = (
-        db.query(models.Bill)
-        .filter(models.Bill.order_id == paybill_data.order_id)
-        .first()
+    bill = await db.scalar(
+        select(models.Bill).filter(models.Bill.order_id == paybill_data.order_id)
     )
 
     if not bill:
         raise HTTPException(status_code=404, detail="Bill not found")
 
-    if bill.status == "Confirmed":
+    if bill.status == CONFIRMED:
         return {"message": "Bill payment already cleared."}
+    if bill.status in RELEASED_STATUSES:
+        raise HTTPException(status_code=400, detail=STOCK_RELEASED)
     is_sandbox = os.getenv("SSLCOMMERZ_IS_SANDBOX", "True").lower() == "true"
 
     sslcz = SSLCOMMERZ(
@@ -115,40 +130,66 @@ def initiate_payment(
 
 
 @router.post("/ssl-success")
-async def ssl_success(request: Request, db: Session = Depends(get_db)):
+async def ssl_success(request: Request, db: AsyncSession = Depends(get_async_db)):
     form = await request.form()
     tran_id = form.get("tran_id")
     card_type = form.get("card_type")
 
-    order_id = tran_id.split("_")[1]
+    order_id = int(tran_id.split("_")[1])
 
-    bill = db.query(models.Bill).filter(models.Bill.order_id == order_id).first()
+    bill = await db.scalar(select(models.Bill).filter(models.Bill.order_id == order_id))
     if not bill:
         return {"message": "Bill not found"}
 
-    bill.status = "Confirmed"
-    bill.method = card_type
-    db.commit()
-
-    order = (
-        db.query(models.Order).filter(models.Order.order_id == bill.order_id).first()
+    # Claimed with a conditional UPDATE on the bill row, like the expiry
+    # sweep, so a bill that expired concurrently is not confirmed here.
+    claimed = await db.scalar(
+        update(models.Bill)
+        .where(
+            models.Bill.order_id == order_id,
+            models.Bill.status.not_in(RELEASED_STATUSES + (REFUND_DUE,)),
+        )
+        .values(status=CONFIRMED, method=card_type)
+        .returning(models.Bill.bill_id)
+        .execution_options(synchronize_session=False)
+    )
+    if claimed is not None:
+        await confirm_reservations(db, order_id)
+    else:
+        # Its stock went back on sale: take it again if it is still there.
+        await db.refresh(bill, with_for_update=True)
+        if bill.status in RELEASED_STATUSES and await reclaim_stock(db, order_id):
+            bill.status, bill.method = CONFIRMED, card_type
+        else:
+            bill.status, bill.method = REFUND_DUE, card_type
+            await db.commit()
+            print(f"Payment {tran_id} for released order {order_id} needs a refund")
+            return {"message": PAYMENT_REFUND_DUE}
+    await db.commit()
+
+    order = await db.scalar(
+        select(models.Order).filter(models.Order.order_id == bill.order_id)
     )
     if not order:
         return {"message": "Order not found"}
 
-    user = db.query(models.User).filter(models.User.user_id == order.user_id).first()
+    user = await db.scalar(
+        select(models.User).filter(models.User.user_id == order.user_id)
+    )
     if not user:
         return {"message": "User not found"}
+    # SSLCommerz sent this request, not the payer: their next reads must still
+    # see the confirmation.
+    await remember_write(user.email)
 
-    artisan = (
-        db.query(models.User)
+    artisan = await db.scalar(
+        select(models.User)
         .join(models.Brand)
         .join(models.Product)
         .join(
             models.OrderItem, models.Product.product_id == models.OrderItem.product_id
         )
         .filter(models.OrderItem.order_id == order.order_id)
-        .first()
     )
 
     print(user)
@@ -191,30 +232,28 @@ async def ssl_success(request: Request, db: Session = Depends(get_db)):
 
 
 @router.post("/ssl-fail")
-async def ssl_fail(request: Request, db: Session = Depends(get_db)):
+async def ssl_fail(request: Request, db: AsyncSession = Depends(get_async_db)):
     form = await request.form()
     tran_id = form.get("tran_id")
-    bill = (
-        db.query(models.Bill)
-        .filter(models.Bill.order_id == tran_id.split("_")[1])
-        .first()
+    bill = await db.scalar(
+        select(models.Bill).filter(models.Bill.order_id == int(tran_id.split("_")[1]))
     )
     if bill:
         bill.status = "Failed"
-        db.commit()
+        await release_reservations(db, [bill.order_id])
+        await db.commit()
     return {"message": "Payment failed"}
 
 
 @router.post("/ssl-cancel")
-async def ssl_cancel(request: Request, db: Session = Depends(get_db)):
+async def ssl_cancel(request: Request, db: AsyncSession = Depends(get_async_db)):
     form = await request.form()
     tran_id = form.get("tran_id")
-    bill = (
-        db.query(models.Bill)
-        .filter(models.Bill.order_id == tran_id.split("_")[1])
-        .first()
+    bill = await db.scalar(
+        select(models.Bill).filter(models.Bill.order_id == int(tran_id.split("_")[1]))
     )
     if bill:
         bill.status = "Cancelled"
-        db.commit()
+        await release_reservations(db, [bill.order_id])
+        await db.commit()
     return {"message": "Payment cancelled"}
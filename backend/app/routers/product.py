@@ -1,30 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, Request, UploadFile, File
+from fastapi.encoders import jsonable_encoder
 import app.schemas as schemas
 import app.models as models
-from app.database import get_db  # Database session dependency
-from app.models import User, Brand
-from app.utils import get_current_user
-from sqlalchemy.orm import Session, joinedload
+from app import cache
+from app.database import get_async_db
+from app.models import Brand
+from app.helpers.pagination import PageParams, paginate
+from app.helpers.principals import Identity
+from app.utils import get_current_identity
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from typing import List
 from fastapi import APIRouter
 
-
 router = APIRouter()
 
 
 # Post Product (protected route)
 @router.post("/products", response_model=schemas.ProductCreate)
-def post_product(
+async def post_product(
     product: schemas.ProductCreate,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    user: Identity = Depends(get_current_identity),
+    current_user: Identity = Depends(get_current_identity),
 ):
 
-    brand = (
-        db.query(models.Brand)
-        .filter(models.Brand.user_id == current_user.user_id)
-        .first()
+    brand = await db.scalar(
+        select(models.Brand).filter(models.Brand.user_id == current_user.user_id)
     )
     print(brand.brand_id)
 
@@ -50,35 +53,37 @@ def post_product(
     )
 
     db.add(new_product)
-    db.commit()
-    db.refresh(new_product)
+    await db.commit()
+    await db.refresh(new_product)
+    await cache.invalidate(*cache.product_tags(new_product.product_id, brand.brand_id))
     return new_product
 
 
 @router.get("/products/me", response_model=List[schemas.ProductOut])
-def get_products_me(
-    db: Session = Depends(get_db), user: User = Depends(get_current_user)
+async def get_products_me(
+    db: AsyncSession = Depends(get_async_db), user: Identity = Depends(get_current_identity)
 ):
     products = (
-        db.query(models.Product)
-        .join(models.Brand, models.Product.brand_id == models.Brand.brand_id)
-        .filter(models.Brand.user_id == user.user_id)
-        .all()
-    )
+        await db.scalars(
+            select(models.Product)
+            .join(models.Brand, models.Product.brand_id == models.Brand.brand_id)
+            .filter(models.Brand.user_id == user.user_id)
+        )
+    ).all()
     if not products:
         raise HTTPException(status_code=404, detail="No products found for this user.")
     return products
 
 
 @router.patch("/products/{product_id}", response_model=schemas.ProductCreate)
-def update_product(
+async def update_product(
     product_id: int,
     updated_product: schemas.ProductCreate,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    user: Identity = Depends(get_current_identity),
 ):
-    product = (
-        db.query(models.Product).filter(models.Product.product_id == product_id).first()
+    product = await db.scalar(
+        select(models.Product).filter(models.Product.product_id == product_id)
     )
 
     if not product:
@@ -89,47 +94,65 @@ def update_product(
     for key, value in update_data.items():
         setattr(product, key, value)
 
-    db.commit()
-    db.refresh(product)
+    await db.commit()
+    await db.refresh(product)
+    await cache.invalidate(*cache.product_tags(product_id, product.brand_id))
     return product
 
 
 @router.get("/products/{product_id}")
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    product = (
-        db.query(models.Product)
-        .options(joinedload(models.Product.brand))
-        .filter(models.Product.product_id == product_id)
-        .first()
-    )
+async def get_product(
+    product_id: int, request: Request, db: AsyncSession = Depends(get_async_db)
+):
+    async def render():
+        product = await db.scalar(
+            select(models.Product)
+            .options(joinedload(models.Product.brand))
+            .filter(models.Product.product_id == product_id)
+        )
 
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found.")
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found.")
 
-    return product
+        return jsonable_encoder(product), cache.product_tags(
+            product_id, product.brand_id
+        )
 
+    return await cache.cached_json(request, render)
 
-@router.get("/products", response_model=List[schemas.ProductOut])
-def get_all_products(db: Session = Depends(get_db)):
-    products = db.query(models.Product).all()
-    return products
+
+@router.get("/products", response_model=schemas.ProductPage)
+async def get_all_products(
+    request: Request,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+):
+    async def render():
+        result = await paginate(
+            db, select(models.Product), models.Product.product_id, page
+        )
+        return schemas.ProductPage.model_validate(
+            result, from_attributes=True
+        ).model_dump(mode="json"), ["products"]
+
+    return await cache.cached_json(request, render)
 
 
 @router.delete("/products/{product_id}")
-def delete_product(
+async def delete_product(
     product_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Identity = Depends(get_current_identity),
 ):
 
-    product = (
-        db.query(models.Product).filter(models.Product.product_id == product_id).first()
+    product = await db.scalar(
+        select(models.Product).filter(models.Product.product_id == product_id)
     )
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    brand = (
-        db.query(models.Brand).filter(models.Brand.brand_id == product.brand_id).first()
+    brand = await db.scalar(
+        select(models.Brand).filter(models.Brand.brand_id == product.brand_id)
     )
 
     if not brand or brand.user_id != current_user.user_id:
@@ -137,13 +160,12 @@ def delete_product(
             status_code=403, detail="You do not have permission to delete this product"
         )
 
-    pending_order_item = (
-        db.query(models.OrderItem)
+    pending_order_item = await db.scalar(
+        select(models.OrderItem)
         .join(models.Order, models.OrderItem.order_id == models.Order.order_id)
         .filter(
             models.OrderItem.product_id == product_id, models.Order.status == "Pending"
         )
-        .first()
     )
 
     if pending_order_item:
@@ -151,7 +173,8 @@ def delete_product(
             status_code=400, detail="Complete the order before deleting this product."
         )
 
-    db.delete(product)
-    db.commit()
+    await db.delete(product)
+    await db.commit()
+    await cache.invalidate(*cache.product_tags(product_id, product.brand_id))
 
     return {"detail": "Product deleted successfully."}
@@ -1,15 +1,22 @@
 from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import User
 from app.schemas import UserUpdate
-from app.database import get_db
+from app.database import get_async_db
+from app.helpers.principals import (
+    Identity,
+    bump_token_version,
+    invalidate_principal,
+)
 from app.utils import (
+    create_user_token,
+    get_current_identity,
     get_current_user,
 )
 from typing import List, Optional
 from fastapi import APIRouter
 
-
 router = APIRouter()
 
 
@@ -28,10 +35,10 @@ async def get_profile(user: User = Depends(get_current_user)):
 @router.patch("/profile")
 async def update_profile(
     user_update: UserUpdate,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    user: Identity = Depends(get_current_identity),
 ):
-    db_user = db.query(User).filter(User.user_id == user.user_id).first()
+    db_user = await db.scalar(select(User).filter(User.user_id == user.user_id))
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -40,19 +47,28 @@ async def update_profile(
     for key, value in update_data.items():
         setattr(db_user, key, value)
 
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    await invalidate_principal(user.email, db_user.email)
     return {"message": "Profile updated successfully"}
 
 
 @router.put("/become-artisan")
 async def become_artisan(
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    user: Identity = Depends(get_current_identity),
 ):
     if user.role == "artisan":
         raise HTTPException(status_code=400, detail="You are already an artisan")
-    user.role = "artisan"
-    db.commit()
-    db.refresh(user)
-    return {"message": "You are now an artisan"}
+    db_user = await db.scalar(select(User).filter(User.user_id == user.user_id))
+    db_user.role = "artisan"
+    # Tokens claiming the old role stop working; hand back one with the new.
+    version = await bump_token_version(db, user.user_id)
+    await db.commit()
+    await invalidate_principal(user.email, user_id=user.user_id, version=version)
+    await db.refresh(db_user)
+    return {
+        "message": "You are now an artisan",
+        "access_token": create_user_token(db_user),
+        "token_type": "bearer",
+    }
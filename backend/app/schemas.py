@@ -136,6 +136,11 @@ class ProductOut(BaseModel):
         from_attributes = True
 
 
+class ProductPage(BaseModel):
+    items: List[ProductOut]
+    next_cursor: Optional[str] = None
+
+
 class ProductUpdate(BaseModel):
     product_name: str
     category: str
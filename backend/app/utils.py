@@ -1,16 +1,25 @@
 import os
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, Security, status
+from fastapi.concurrency import run_in_threadpool
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from google.oauth2 import id_token
-from google.auth.transport import requests
-import requests as http_requests
+import httpx
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordBearer
 from app.models import User
-from app.database import get_db
+from app.database import get_async_db
+from app.helpers import google_oauth, passwords
+from app.helpers.principals import (
+    CurrentUser,
+    Identity,
+    generation,
+    get_principal,
+    remember_principal,
+    token_version,
+)
 from app.tasks import celery_app
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
@@ -20,6 +29,9 @@ RESET_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60 * 60
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 REDIRECT_URI = "http://127.0.0.1:8000/auth/callback"
+# Embed user_id, role and the user's token version in access tokens so routes
+# that only need identity and role skip the user lookup.
+STATELESS_TOKENS = os.getenv("STATELESS_TOKENS", "False").lower() == "true"
 
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 
@@ -37,34 +49,29 @@ conf = ConnectionConfig(
     USE_CREDENTIALS=True,
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 INVALID_TOKEN = "Invalid token"
 INVALID_OR_EXPIRED_TOKEN = "Invalid or expired token"
 INVALID_TOKEN_PAYLOAD = "Invalid token payload"
+GOOGLE_UNAVAILABLE = "Google sign-in is unavailable, please retry shortly."
 USER_NOT_FOUND = "User not found"
+TOKEN_REVOKED = "Token has been revoked"
 NOT_ENOUGH_PERMISSIONS = "Not enough permissions"
 
 
 class AuthUtils:
     def verify_google_token(self, token: str):
         try:
-            id_info = id_token.verify_oauth2_token(
-                token, requests.Request(), GOOGLE_CLIENT_ID
-            )
-            if (
-                id_info["iss"]
-                not in ["accounts.google.com", "https://accounts.google.com"]
-                or id_info["aud"] != GOOGLE_CLIENT_ID
-            ):
-                raise ValueError(INVALID_TOKEN)
+            id_info = google_oauth.verify_id_token(token, GOOGLE_CLIENT_ID)
             return {
                 "google_id": id_info["sub"],
                 "email": id_info["email"],
                 "email_verified": id_info.get("email_verified", False),
                 "full_name": id_info.get("name"),
             }
+        except google_oauth.GoogleUnavailable:
+            raise HTTPException(status.HTTP_502_BAD_GATEWAY, detail=GOOGLE_UNAVAILABLE)
         except ValueError:
             raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=INVALID_TOKEN)
 
@@ -75,7 +82,7 @@ class AuthUtils:
             f"&redirect_uri={REDIRECT_URI}&response_type=code&scope={scope}"
         )
 
-    def exchange_code_for_token(self, code: str):
+    async def exchange_code_for_token(self, code: str):
         data = {
             "client_id": GOOGLE_CLIENT_ID,
             "client_secret": GOOGLE_CLIENT_SECRET,
@@ -83,16 +90,26 @@ class AuthUtils:
             "grant_type": "authorization_code",
             "redirect_uri": REDIRECT_URI,
         }
-        response = http_requests.post("https://oauth2.googleapis.com/token", data=data)
+        try:
+            response = await google_oauth.exchange_code(data)
+        except httpx.HTTPError:
+            raise HTTPException(status.HTTP_502_BAD_GATEWAY, detail=GOOGLE_UNAVAILABLE)
         if response.status_code != 200:
             raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=INVALID_TOKEN)
         return response.json()
 
-    def hash_password(self, password: str) -> str:
-        return pwd_context.hash(password)
+    async def hash_password(self, password: str) -> str:
+        return await passwords.hash_password(password)
 
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+    async def check_password(self, db: Session, user: User, password: str) -> bool:
+        """Verify ``password`` off the event loop, upgrading the stored hash
+        when the bcrypt cost has changed since it was made. ``db`` is a sync
+        session, so its commit runs in the threadpool too."""
+        valid, new_hash = await passwords.verify_and_update(password, user.password)
+        if new_hash:
+            user.password = new_hash
+            await run_in_threadpool(db.commit)
+        return valid
 
 
 auth_utils = AuthUtils()
@@ -154,6 +171,15 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return jwt.encode({**data, "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def create_user_token(user: User, expires_delta: timedelta = None):
+    """Access token for ``user``; carries the stateless claims when
+    ``STATELESS_TOKENS`` is on."""
+    data = {"sub": user.email}
+    if STATELESS_TOKENS:
+        data.update(uid=user.user_id, role=user.role, ver=user.token_version)
+    return create_access_token(data, expires_delta)
+
+
 def verify_token(token: str = Security(oauth2_scheme)):
     try:
         return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -165,27 +191,61 @@ def verify_token(token: str = Security(oauth2_scheme)):
         )
 
 
-def authenticate_user(db: Session, username: str, password: str):
+async def authenticate_user(db: Session, username: str, password: str):
     user = db.query(User).filter(User.username == username).first()
-    if user and auth_utils.verify_password(password, user.password):
+    if user and await auth_utils.check_password(db, user, password):
         return user
     return False
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-):
+async def verify_access_token(token: str, db: AsyncSession) -> dict:
+    """Decoded access token; a stateless one must still carry its user's
+    current token version."""
     payload = verify_token(token)
-    user_email = payload.get("sub")
-    if not user_email:
+    if not payload.get("sub"):
         raise HTTPException(status.HTTP_401_UNAUTHORIZED, detail=INVALID_TOKEN_PAYLOAD)
-    user = db.query(User).filter(User.email == user_email).first()
+    if "uid" in payload:
+        version = await token_version(db, payload["uid"])
+        if version is None:
+            raise HTTPException(status.HTTP_401_UNAUTHORIZED, detail=USER_NOT_FOUND)
+        if version != payload.get("ver"):
+            raise HTTPException(status.HTTP_401_UNAUTHORIZED, detail=TOKEN_REVOKED)
+    return payload
+
+
+async def load_principal(user_email: str, db: AsyncSession) -> CurrentUser:
+    principal = get_principal(user_email)
+    if principal:
+        return principal
+    loaded_at = generation()
+    user = await db.scalar(select(User).filter(User.email == user_email))
     if not user:
         raise HTTPException(status.HTTP_401_UNAUTHORIZED, detail=USER_NOT_FOUND)
-    return user
+    principal = CurrentUser.from_user(user)
+    remember_principal(user_email, principal, loaded_at)
+    return principal
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+) -> CurrentUser:
+    payload = await verify_access_token(token, db)
+    return await load_principal(payload["sub"], db)
+
+
+async def get_current_identity(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+) -> Identity:
+    """``user_id``, ``email`` and ``role`` of the caller, from the token
+    claims when it has them and from the cached principal otherwise."""
+    payload = await verify_access_token(token, db)
+    if "uid" in payload:
+        return Identity(payload["uid"], payload["sub"], payload["role"])
+    principal = await load_principal(payload["sub"], db)
+    return Identity(principal.user_id, principal.email, principal.role)
 
 
-def get_current_admin(user: User = Depends(get_current_user)):
+def get_current_admin(user: Identity = Depends(get_current_identity)):
     if user.role != "admin":
         raise HTTPException(status.HTTP_403_FORBIDDEN, detail=NOT_ENOUGH_PERMISSIONS)
     return user
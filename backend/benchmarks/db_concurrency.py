@@ -0,0 +1,75 @@
+"""Requests per second for one worker: sync ``Session`` vs ``AsyncSession``.
+
+Both handlers are ``async def`` (like the routers) and run the same query; the
+sync one blocks the event loop for the whole round trip, the async one yields.
+Keep ``--concurrency`` within the pool size: past that the sync handler starves
+the loop that would return its connections and the pool times out.
+
+    python -m benchmarks.db_concurrency --requests 400 --concurrency 10 --delay 0.01
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.database import get_async_db, get_db
+
+QUERY = text("SELECT pg_sleep(:delay)")
+
+bench_app = FastAPI()
+
+
+@bench_app.get("/sync")
+async def sync_query(delay: float, db: Session = Depends(get_db)):
+    db.execute(QUERY, {"delay": delay})
+    return {"ok": True}
+
+
+@bench_app.get("/async")
+async def async_query(delay: float, db: AsyncSession = Depends(get_async_db)):
+    await db.execute(QUERY, {"delay": delay})
+    return {"ok": True}
+
+
+async def run(path: str, requests: int, concurrency: int, delay: float) -> float:
+    transport = httpx.ASGITransport(app=bench_app)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def one():
+            async with semaphore:
+                response = await client.get(path, params={"delay": delay})
+                response.raise_for_status()
+
+        await one()  # warm up the pool
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.01, help="query time (s)")
+    args = parser.parse_args()
+
+    for label, path in (
+        ("sync Session (before)", "/sync"),
+        ("AsyncSession (after)", "/async"),
+    ):
+        rps = asyncio.run(run(path, args.requests, args.concurrency, args.delay))
+        print(f"{label:<24} {rps:8.1f} req/s per worker")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Capture EXPLAIN ANALYZE plans for the queries the routers run.
+
+Run once before and once after a migration, then compare:
+
+    python -m benchmarks.explain_plans --label before
+    alembic upgrade head
+    python -m benchmarks.explain_plans --label after
+    python -m benchmarks.explain_plans --compare before after
+
+Plans are written to ``<out>/<label>/<query>.txt``. Sample ids are taken from
+the data already in ``DATABASE_URL``, so point it at a realistically sized copy.
+"""
+
+import argparse
+import re
+from pathlib import Path
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql
+
+from app import models
+from app.database import SessionLocal
+from app.ai.utils.pg_search import fulltext_search, fuzzy_search
+from app.helpers.orders import order_items_query
+
+EXECUTION_TIME = re.compile(r"Execution Time: ([\d.]+) ms")
+
+
+def sample_ids(db) -> dict:
+    def first(column):
+        return db.scalar(select(func.min(column))) or 1
+
+    return {
+        "user_id": first(models.Order.user_id),
+        "artisan_id": first(models.Brand.user_id),
+        "brand_id": first(models.Product.brand_id),
+        "order_id": first(models.Order.order_id),
+        "product_id": first(models.OrderItem.product_id),
+        "category": db.scalar(select(models.Product.category).limit(1)) or "saree",
+    }
+
+
+def router_queries(ids: dict) -> dict:
+    """One statement per router query, keyed by a file-friendly name."""
+    order_ids = select(models.Order.order_id).filter(
+        models.Order.user_id == ids["user_id"]
+    )
+    return {
+        "orders_by_user": select(models.Order).filter(
+            models.Order.user_id == ids["user_id"]
+        ),
+        "bill_by_order": select(models.Bill).filter(
+            models.Bill.order_id == ids["order_id"]
+        ),
+        "bills_for_orders": select(models.Bill).filter(
+            models.Bill.order_id.in_(order_ids)
+        ),
+        "items_for_orders": order_items_query().filter(
+            models.OrderItem.order_id.in_(order_ids)
+        ),
+        "brands_by_user": select(models.Brand).filter(
+            models.Brand.user_id == ids["artisan_id"]
+        ),
+        "products_by_brand": select(models.Product).filter(
+            models.Product.brand_id == ids["brand_id"]
+        ),
+        "products_me": select(models.Product)
+        .join(models.Brand, models.Product.brand_id == models.Brand.brand_id)
+        .filter(models.Brand.user_id == ids["artisan_id"]),
+        "artisan_orders": select(models.Order)
+        .join(models.OrderItem, models.Order.order_id == models.OrderItem.order_id)
+        .join(models.Product, models.OrderItem.product_id == models.Product.product_id)
+        .filter(models.Product.brand_id.in_([ids["brand_id"]]))
+        .distinct(),
+        "pending_items_for_product": select(models.OrderItem)
+        .join(models.Order, models.OrderItem.order_id == models.Order.order_id)
+        .filter(
+            models.OrderItem.product_id == ids["product_id"],
+            models.Order.status == "Pending",
+        )
+        .limit(1),
+        "search_filters": select(models.Product).filter(
+            models.Product.approved == True,
+            models.Product.category == ids["category"],
+            models.Product.price.between(0, 5000),
+        ),
+        "product_search": fulltext_search(
+            select(models.Product).filter(models.Product.approved == True),
+            [ids["category"]],
+        ),
+        "product_search_fuzzy": fuzzy_search(
+            select(models.Product).filter(models.Product.approved == True),
+            [ids["category"]],
+        ),
+    }
+
+
+def capture(label: str, out: Path):
+    target = out / label
+    target.mkdir(parents=True, exist_ok=True)
+    with SessionLocal() as db:
+        for name, statement in router_queries(sample_ids(db)).items():
+            sql = statement.compile(
+                dialect=postgresql.dialect(paramstyle="named"),
+                compile_kwargs={"literal_binds": True},
+            )
+            rows = db.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}")).scalars()
+            plan = "\n".join(rows)
+            (target / f"{name}.txt").write_text(f"{sql}\n\n{plan}\n")
+            timing = EXECUTION_TIME.search(plan)
+            print(f"{name:<28} {timing.group(1) if timing else '?':>10} ms")
+        db.rollback()
+
+
+def compare(before: str, after: str, out: Path):
+    def summary(label, name):
+        path = out / label / f"{name}.txt"
+        if not path.exists():
+            return "-"
+        plan = path.read_text()
+        timing = EXECUTION_TIME.search(plan)
+        seq_scan = " (seq scan)" if "Seq Scan" in plan else ""
+        return f"{timing.group(1) if timing else '?'} ms{seq_scan}"
+
+    print(f"{'query':<28} {before:>24} {after:>24}")
+    for path in sorted((out / before).glob("*.txt")):
+        name = path.stem
+        print(f"{name:<28} {summary(before, name):>24} {summary(after, name):>24}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--label", help="directory name for this capture")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--out", type=Path, default=Path("explain_plans"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare, args.out)
+    elif args.label:
+        capture(args.label, args.out)
+    else:
+        parser.error("pass --label or --compare")
+
+
+if __name__ == "__main__":
+    main()
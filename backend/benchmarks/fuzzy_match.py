@@ -0,0 +1,64 @@
+"""Fuzzy fallback latency: the former per-product ``fuzz.partial_ratio``
+loop vs ``best_matches`` (a corpus scan for verbatim terms, then one
+batched ``process.cdist``) over the same pre-normalized strings, on the
+synthetic catalog of ``benchmarks.product_index``.
+
+    python -m benchmarks.fuzzy_match --products 100000 --workers 1 -1
+"""
+
+import argparse
+
+from rapidfuzz import fuzz
+
+from app.ai.utils.fuzzy_match import (
+    FUZZY_SCORE_CUTOFF,
+    Catalog,
+    best_matches,
+    product_text,
+)
+from benchmarks.product_index import synthetic_rows, timed
+
+QUERIES = (["jamdanee shari"], ["nakshi kanta"], ["terakota", "pot"], ["kantha"])
+
+
+def loop(texts, terms):
+    """The fallback before it was batched: score, filter, sort everything."""
+    phrase = " ".join(terms)
+    scored = [(i, fuzz.partial_ratio(phrase, text)) for i, text in enumerate(texts)]
+    return sorted(
+        [(i, score) for i, score in scored if score >= FUZZY_SCORE_CUTOFF],
+        key=lambda x: x[1],
+        reverse=True,
+    )
+
+
+def run(count: int, repeat: int, workers, limit: int):
+    texts = [product_text(*row[1:4]) for row in synthetic_rows(count)]
+    catalog = Catalog(texts)
+    print(f"\n{count:,} products")
+    header = " ".join(f"{f'workers={w} ms':>14}" for w in workers)
+    print(f"{'query':<24} {'loop ms':>10} {header} {'hits':>8}")
+    for terms in QUERIES:
+        looped = timed(lambda: loop(texts, terms), 1)
+        batched = [
+            timed(lambda: best_matches(catalog, terms, limit, w), repeat)
+            for w in workers
+        ]
+        hits = len(best_matches(catalog, terms, count))
+        cells = " ".join(f"{ms:14.1f}" for ms in batched)
+        print(f"{' | '.join(terms):<24} {looped:10.1f} {cells} {hits:8,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, -1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=1000)
+    args = parser.parse_args()
+    for count in args.products:
+        run(count, args.repeat, args.workers, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Cost of each text normalization step, in nanoseconds per token, on
+synthetic English and Bangla product text; the ``lower + \\w+`` baseline is
+what the indexes tokenized with before.
+
+    python -m benchmarks.normalization --tokens 200000
+"""
+
+import argparse
+import random
+import re
+import time
+
+from app.ai.utils.normalization import (
+    STOPWORDS,
+    analyze,
+    detect_language,
+    normalize,
+    stem,
+    tokenize,
+)
+from app.ai.utils.lexicon import GLOSSARY
+from benchmarks.product_index import WORDS
+
+BANGLA_WORDS = [word for term in GLOSSARY for word in term.split()] + [
+    "শাড়িগুলো",
+    "মাটির",
+    "আমি",
+    "চাই",
+    "২০০০",
+]
+BASELINE = re.compile(r"\w+")
+
+
+def corpus(words, tokens: int, seed: int = 7):
+    """Ten-word lines of ``words``, ``tokens`` words in all."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(words, k=10)) for _ in range(tokens // 10)]
+
+
+def per_token(func, lines, tokens: int) -> float:
+    started = time.perf_counter()
+    for line in lines:
+        func(line)
+    return (time.perf_counter() - started) / tokens * 1e9
+
+
+def run(name: str, words, tokens: int):
+    lines = corpus(words, tokens)
+    words = [word for line in lines for word in tokenize(line)]
+    steps = {
+        "lower + \\w+ (baseline)": lambda line: BASELINE.findall(line.lower()),
+        "normalize": normalize,
+        "tokenize": tokenize,
+        "stopwords": lambda line: [w for w in line.split() if w not in STOPWORDS],
+        "stem": lambda line: [stem(w) for w in line.split()],
+        "analyze (all of it)": analyze,
+        "detect_language": detect_language,
+    }
+    print(f"\n{name}: {tokens:,} tokens")
+    normalized = [" ".join(words[i : i + 10]) for i in range(0, len(words), 10)]
+    for step, func in steps.items():
+        # The word-level steps run on already tokenized text, as in analyze.
+        source = normalized if step in ("stopwords", "stem") else lines
+        print(f"{step:<24} {per_token(func, source, tokens):8.0f} ns/token")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=200_000)
+    args = parser.parse_args()
+    run("English", WORDS, args.tokens)
+    run("Bangla", BANGLA_WORDS, args.tokens)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Query latency of the in-memory product index vs the linear keyword scan.
+
+Builds a synthetic catalog (no database needed), indexes it, and times each
+query both ways; the scan is ``get_most_similar_products``, which the memory
+search backend ran over the whole filtered catalog before the index existed.
+
+    python -m benchmarks.product_index --products 100000 1000000
+"""
+
+import argparse
+import random
+import resource
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+from app.ai.utils.ai_search import get_most_similar_products
+from app.ai.utils.product_index import ProductIndex
+
+WORDS = (
+    "jamdani saree silk muslin cotton kantha nakshi quilt jute basket clay "
+    "pottery terracotta shawl tangail katan brass bell metal bamboo cane mat "
+    "shital pati rickshaw art wooden toy doll leather bag hand woven block "
+    "print embroidered red blue green golden"
+).split()
+CATEGORIES = "saree shawl quilt basket pottery jewellery toy bag mat decor".split()
+BRANDS = ["Tant Ghor", "Aarong", "Kumar Para", "Nakshi Ghor", "Jute Works"]
+QUERIES = (
+    ["jamdani saree"],
+    ["nakshi kantha", "quilt"],
+    ["terracotta"],
+    ["tant ghor"],
+    ["golden brass bell"],
+)
+
+
+def synthetic_rows(count: int, seed: int = 7):
+    """``ProductIndex.bulk_load`` rows with a skewed word distribution."""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(WORDS))]
+    for product_id in range(1, count + 1):
+        name = " ".join(rng.choices(WORDS, weights, k=3))
+        description = " ".join(rng.choices(WORDS, weights, k=12))
+        brand_id = rng.randrange(len(BRANDS))
+        yield (
+            product_id,
+            f"{name} {product_id}",
+            rng.choice(CATEGORIES),
+            description,
+            brand_id,
+            Decimal(rng.randrange(100, 20000)),
+            True,
+            BRANDS[brand_id],
+        )
+
+
+def timed(func, repeat: int) -> float:
+    """Best of ``repeat`` runs, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def run(count: int, repeat: int, scan: bool):
+    rows = list(synthetic_rows(count))
+    index = ProductIndex()
+    started = time.perf_counter()
+    index.bulk_load(rows)
+    build = time.perf_counter() - started
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"\n{count:,} products: built in {build:.1f}s, "
+        f"{len(index.postings):,} tokens, peak RSS {rss:,.0f} MB"
+    )
+
+    products = [
+        SimpleNamespace(
+            product_id=row[0],
+            product_name=row[1],
+            category=row[2],
+            description=row[3],
+        )
+        for row in rows
+    ]
+    del rows
+    print(f"{'query':<28} {'index ms':>10} {'scan ms':>10} {'hits':>8}")
+    for terms in QUERIES:
+        indexed = timed(lambda: index.search(terms), repeat)
+        hits = len(index.search(terms, limit=count))
+        scanned = (
+            timed(lambda: get_most_similar_products(products, terms, {}), 1)
+            if scan
+            else float("nan")
+        )
+        print(f"{' | '.join(terms):<28} {indexed:10.2f} {scanned:10.1f} {hits:8,}")
+
+    started = time.perf_counter()
+    for product_id in range(1, 1001):
+        index.add(product_id, index.docs[product_id])
+    update = (time.perf_counter() - started) / 1000 * 1e6
+    print(f"incremental update: {update:.1f} us per product")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--no-scan", action="store_true", help="skip the (slow) linear scan"
+    )
+    args = parser.parse_args()
+    for count in args.products:
+        run(count, args.repeat, not args.no_scan)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""Search latency by stage on a synthetic Bangla/English catalog, with the LLM
+replaced by a local fake.
+
+Seeds each catalog size into ``DATABASE_URL``, then replays a query corpus
+through the search route in-process and reports p50/p95/p99, throughput and
+RSS for every stage the route times (``search.SEARCH_STAGES``) and for the
+whole request.
+
+Point ``DATABASE_URL`` at a scratch database migrated to head: the catalog
+belongs to a ``search-bench`` user whose previous products are deleted
+first, and the fake LLM's answers vote for entries in its lexicon.
+
+    python -m benchmarks.search --products 10000 100000 1000000 \\
+        --backend postgres memory tfidf --llm-latency 0.8
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import re
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+from sqlalchemy import text
+
+from app.database import AsyncSessionLocal, engine
+from app.ai.routers import search
+from app.ai.utils import (
+    ai_search,
+    fuzzy_match,
+    keyword_cache,
+    lexicon,
+    product_index,
+    query_parser,
+    tfidf_ranking,
+)
+from app.ai.utils.ai_search import extract_price_range_from_text
+from app.ai.utils.lexicon import GLOSSARY
+from app.ai.utils.normalization import STOPWORDS, tokenize
+from benchmarks.product_index import BRANDS, CATEGORIES, WORDS
+
+BENCH_EMAIL = "search-bench@example.invalid"
+BANGLA_WORDS = list(GLOSSARY)
+BANGLA_BRANDS = ["তাঁত ঘর", "নকশি ঘর", "মাটির কথা"]
+COPY_BATCH_SIZE = 50_000
+# Free text the local parser and the lexicon cannot place, so it reaches
+# the LLM.
+PEOPLE = ["mother", "father", "wife", "sister", "friend", "teacher", "boss"]
+OCCASIONS = ["wedding", "birthday", "eid", "anniversary", "housewarming"]
+BANGLA_PEOPLE = ["মায়ের", "বাবার", "বোনের", "বন্ধুর", "শিক্ষকের"]
+BANGLA_OCCASIONS = ["বিয়ের", "জন্মদিনের", "ঈদের"]
+
+bench_app = FastAPI()
+bench_app.include_router(search.router, prefix="/search")
+
+
+def catalog_rows(count: int, bangla_share: float, seed: int = 7):
+    """``(brand, product_name, category, description, price)`` rows; a
+    ``bangla_share`` of them named and described in Bangla. Words are
+    Zipf-distributed, like ``benchmarks.product_index``."""
+    rng = random.Random(seed)
+    english = [1 / (rank + 1) for rank in range(len(WORDS))]
+    bangla = [1 / (rank + 1) for rank in range(len(BANGLA_WORDS))]
+    for number in range(1, count + 1):
+        if rng.random() < bangla_share:
+            words, weights, brands = BANGLA_WORDS, bangla, BANGLA_BRANDS
+        else:
+            words, weights, brands = WORDS, english, BRANDS
+        name = " ".join(rng.choices(words, weights, k=3))
+        yield (
+            rng.choice(brands),
+            f"{name} {number}",
+            rng.choice(CATEGORIES),
+            " ".join(rng.choices(words, weights, k=12)),
+            rng.randrange(100, 20000),
+        )
+
+
+def _csv(value) -> str:
+    return '"%s"' % str(value).replace('"', '""')
+
+
+def seed_catalog(count: int, bangla_share: float):
+    """Replace the ``search-bench`` user's catalog with ``count`` products."""
+    with engine.begin() as connection:
+        user_id = connection.scalar(
+            text(
+                'INSERT INTO "user" (username, email, role) '
+                "VALUES ('search-bench', :email, 'artisan') "
+                "ON CONFLICT (email) DO UPDATE SET role = 'artisan' "
+                "RETURNING user_id"
+            ),
+            {"email": BENCH_EMAIL},
+        )
+        connection.execute(
+            text("DELETE FROM brand WHERE user_id = :user_id"), {"user_id": user_id}
+        )
+        brand_ids = {
+            name: connection.scalar(
+                text(
+                    "INSERT INTO brand (user_id, brand_name) "
+                    "VALUES (:user_id, :name) RETURNING brand_id"
+                ),
+                {"user_id": user_id, "name": name},
+            )
+            for name in BRANDS + BANGLA_BRANDS
+        }
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        rows = catalog_rows(count, bangla_share)
+        while True:
+            batch = io.StringIO()
+            for brand, name, category, description, price in itertools.islice(
+                rows, COPY_BATCH_SIZE
+            ):
+                fields = (brand_ids[brand], name, category, description, price)
+                batch.write(",".join(map(_csv, fields)) + ',true,"{}","{}"\n')
+            if not batch.tell():
+                break
+            batch.seek(0)
+            cursor.copy_expert(
+                "COPY product (brand_id, product_name, category, description, "
+                "price, approved, product_pic, product_video) "
+                "FROM STDIN WITH (FORMAT csv)",
+                batch,
+            )
+        cursor.execute("ANALYZE product")
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def query_corpus(size: int, seed: int = 5) -> list:
+    """Distinct queries: catalog words in English and Bangla, some with a
+    price, some misspelled (the fuzzy fallback), some free text (the LLM)."""
+    rng = random.Random(seed)
+    queries = set()
+    while len(queries) < size:
+        kind = rng.random()
+        if kind < 0.35:
+            query = " ".join(rng.sample(WORDS, rng.randint(1, 2)))
+        elif kind < 0.6:
+            query = " ".join(rng.sample(BANGLA_WORDS, rng.randint(1, 2)))
+        elif kind < 0.7:
+            word = rng.choice([word for word in WORDS if len(word) > 4])
+            cut = rng.randrange(1, len(word) - 1)
+            query = word[:cut] + word[cut + 1 :]
+        elif kind < 0.85:
+            query = f"{rng.choice(OCCASIONS)} gift for my {rng.choice(PEOPLE)}"
+        else:
+            query = (
+                f"{rng.choice(BANGLA_PEOPLE)} জন্য {rng.choice(BANGLA_OCCASIONS)} উপহার"
+            )
+        if rng.random() < 0.2:
+            price = rng.randrange(5, 100) * 100
+            query += f" under {price}" if query.isascii() else f" {price} টাকার নিচে"
+        queries.add(query)
+    return sorted(queries)
+
+
+class FakeAzureOpenAI:
+    """Stands in for ``AzureOpenAI``: ``chat.completions.create`` sleeps for a
+    normally distributed latency, then answers with the query's words
+    (Bangla ones translated through the glossary) and its price range."""
+
+    PROMPT_QUERY = re.compile(r'User input: "(.*)"')
+
+    def __init__(self, latency: float, jitter: float, seed: int = 3):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **settings):
+        self.calls += 1
+        time.sleep(max(0.0, self._rng.gauss(self.latency, self.jitter)))
+        query = self.PROMPT_QUERY.search(messages[-1]["content"]).group(1)
+        keywords = [
+            word
+            for word in tokenize(query)
+            if word not in STOPWORDS and not word.isdigit()
+        ]
+        content = json.dumps(
+            {
+                "keywords": keywords,
+                "keywords_en": [GLOSSARY.get(word, word) for word in keywords],
+                "category": None,
+                "price_range": extract_price_range_from_text(query),
+                "brand": None,
+                "synonyms": {},
+            },
+            ensure_ascii=False,
+        )
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def current_rss() -> int:
+    """Resident set size of this process, in bytes."""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def peak_rss(pid: str = "self") -> float:
+    """Peak resident set size of a process, in MB."""
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class StageRecorder:
+    """Keeps every per-request stage time the route observes, and the RSS
+    each stage leaves the process at."""
+
+    def __init__(self):
+        self.seconds = defaultdict(list)
+        self.rss = defaultdict(int)
+        self._patched = []
+
+    def __enter__(self):
+        for stage, histogram in search.stage_time.items():
+            self._patch(histogram, "observe", self._observer(stage, histogram.observe))
+        self._patch(search, "timed_stage", self._timed_stage(search.timed_stage))
+        return self
+
+    def __exit__(self, *exc):
+        for target, name, original in reversed(self._patched):
+            setattr(target, name, original)
+        self._patched = []
+
+    def _patch(self, target, name, replacement):
+        self._patched.append((target, name, getattr(target, name)))
+        setattr(target, name, replacement)
+
+    def _observer(self, stage, observe):
+        def recording_observe(seconds):
+            self.seconds[stage].append(seconds)
+            observe(seconds)
+
+        return recording_observe
+
+    def _timed_stage(self, timed_stage):
+        @contextlib.contextmanager
+        def rss_timed_stage(stages, stage):
+            try:
+                with timed_stage(stages, stage):
+                    yield
+            finally:
+                self.rss[stage] = max(self.rss[stage], current_rss())
+
+        return rss_timed_stage
+
+
+def reset_search_state(backend: str):
+    """Forget everything cached from the previous catalog."""
+    search.SEARCH_BACKEND = backend
+    keyword_cache.l1.clear()
+    query_parser._vocabulary = None
+    lexicon._lexicon = None
+    lexicon._pending_votes = {}
+    product_index.index = None
+    tfidf_ranking.ranking = None
+
+
+async def start_backend(backend: str) -> list:
+    """The lifespan tasks ``backend`` needs, once its indexes are built."""
+    tasks = [asyncio.create_task(lexicon.save_learned_terms())]
+    if backend == "memory":
+        tasks.append(asyncio.create_task(product_index.maintain_index()))
+    if backend == "tfidf":
+        tasks.append(asyncio.create_task(tfidf_ranking.maintain_ranking()))
+    if backend in ("memory", "tfidf"):
+        tasks.append(asyncio.create_task(fuzzy_match.maintain_catalog()))
+
+    def ready():
+        if backend == "memory" and product_index.index is None:
+            return False
+        if backend == "tfidf" and tfidf_ranking.ranking is None:
+            return False
+        return backend == "postgres" or fuzzy_match._catalog_size is not None
+
+    while not ready():
+        await asyncio.sleep(0.1)
+    async with AsyncSessionLocal() as db:
+        await query_parser.get_vocabulary(db)
+        await lexicon.get_lexicon(db)
+    return tasks
+
+
+async def replay(queries: list, requests: int, concurrency: int, limit: int):
+    """End-to-end latencies of ``requests`` searches drawn from ``queries``
+    with Zipf-distributed popularity, and the wall time they took."""
+    rng = random.Random(13)
+    weights = [1 / (rank + 1) for rank in range(len(queries))]
+    replayed = rng.choices(queries, weights, k=requests)
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=bench_app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as client:
+
+        async def one(query):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(
+                    "/search/", params={"q": query, "limit": limit}
+                )
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(query) for query in replayed))
+        return latencies, time.perf_counter() - started
+
+
+def report_line(label: str, seconds: list, throughput: float, rss: str):
+    p50, p95, p99 = np.percentile(np.array(seconds) * 1000, [50, 95, 99])
+    print(
+        f"{label:<10} {len(seconds):>7,} {p50:9.2f} {p95:9.2f} {p99:9.2f} "
+        f"{throughput:11,.1f} {rss:>9}"
+    )
+
+
+async def run(backend: str, queries: list, args, llm: FakeAzureOpenAI):
+    reset_search_state(backend)
+    started = time.perf_counter()
+    tasks = await start_backend(backend)
+    ready = time.perf_counter() - started
+    calls = llm.calls
+    try:
+        # The route prints every parse; keep it out of the report.
+        with StageRecorder() as recorder, open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                latencies, wall = await replay(
+                    queries, args.requests, args.concurrency, args.limit
+                )
+        match_pids = list(getattr(fuzzy_match._pool, "_processes", None) or ())
+        match_rss = max((peak_rss(pid) for pid in match_pids), default=0.0)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    print(
+        f"\n{backend}: ready in {ready:.1f}s, {llm.calls - calls:,} LLM calls, "
+        f"peak RSS {peak_rss():,.0f} MB"
+        + (f", match process {match_rss:,.0f} MB" if match_rss else "")
+    )
+    print(
+        f"{'stage':<10} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+        f"{'per second':>11} {'RSS MB':>9}"
+    )
+    for stage in search.SEARCH_STAGES:
+        seconds = recorder.seconds.get(stage)
+        if not seconds:
+            continue
+        # What one worker could sustain if every request spent this long here.
+        throughput = len(seconds) / sum(seconds) if sum(seconds) else float("inf")
+        report_line(stage, seconds, throughput, f"{recorder.rss[stage] / 2**20:,.0f}")
+    report_line("request", latencies, len(latencies) / wall, "")
+
+
+async def bench(args, queries: list, llm: FakeAzureOpenAI):
+    # One event loop throughout: pooled connections belong to the loop that
+    # opened them.
+    for count in args.products:
+        if not args.skip_seed:
+            started = time.perf_counter()
+            seed_catalog(count, args.bangla)
+            print(
+                f"\n{count:,} products ({args.bangla:.0%} Bangla) seeded in "
+                f"{time.perf_counter() - started:.1f}s"
+            )
+        for backend in args.backend:
+            await run(backend, queries, args, llm)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, nargs="+", default=[10_000])
+    parser.add_argument(
+        "--backend",
+        nargs="+",
+        default=[search.SEARCH_BACKEND],
+        choices=["postgres", "memory", "tfidf"],
+    )
+    parser.add_argument("--bangla", type=float, default=0.3, help="share of products")
+    parser.add_argument("--queries", help="file with one query per line to replay")
+    parser.add_argument("--corpus", type=int, default=300, help="distinct queries")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=search.SEARCH_LIMIT)
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="seconds")
+    parser.add_argument(
+        "--skip-seed", action="store_true", help="replay against the current data"
+    )
+    args = parser.parse_args()
+
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as lines:
+            queries = [line.strip() for line in lines if line.strip()]
+    else:
+        queries = query_corpus(args.corpus)
+    llm = FakeAzureOpenAI(args.llm_latency, args.llm_jitter)
+    ai_search.client = llm
+    asyncio.run(bench(args, queries, llm))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Typeahead latency of the suggestion index vs scanning every key in the
+prefix's range of the sorted array.
+
+Uses the same synthetic catalog as ``benchmarks.product_index``, with a
+skewed number of units sold per product.
+
+    python -m benchmarks.suggestions --products 100000 1000000
+"""
+
+import argparse
+import bisect
+import heapq
+import random
+import resource
+import time
+
+from app.ai.utils.normalization import normalize
+from app.ai.utils.suggestions import Suggestions, _upper_bound
+from benchmarks.product_index import synthetic_rows, timed
+
+PREFIXES = ["j", "ja", "jamd", "jamdani s", "sa", "tant", "terracotta b", "gold"]
+
+
+def rows(count: int, seed: int = 11):
+    """``Suggestions.from_rows`` rows."""
+    rng = random.Random(seed)
+    for (
+        product_id,
+        name,
+        category,
+        _,
+        brand_id,
+        _,
+        approved,
+        brand_name,
+    ) in synthetic_rows(count):
+        sold = int(rng.paretovariate(1.5)) - 1
+        yield product_id, name, category, brand_id, approved, brand_name, sold
+
+
+def range_scan(index: Suggestions, prefix: str, limit: int):
+    """What a query would cost without the tree: rank every key in range."""
+    prefix = normalize(prefix)
+    lo = bisect.bisect_left(index.keys, prefix)
+    hi = bisect.bisect_left(index.keys, _upper_bound(prefix), lo)
+    entries = set(index._key_entries[lo:hi])
+    return heapq.nsmallest(limit, entries, key=index._rank), hi - lo
+
+
+def run(count: int, repeat: int, limit: int):
+    started = time.perf_counter()
+    index = Suggestions.from_rows(rows(count))
+    build = time.perf_counter() - started
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"\n{count:,} products: built in {build:.1f}s, {len(index.texts):,} "
+        f"entries, {len(index.keys):,} keys, peak RSS {rss:,.0f} MB"
+    )
+    print(f"{'prefix':<16} {'index us':>10} {'scan us':>10} {'keys':>10}")
+    for prefix in PREFIXES:
+        indexed = timed(lambda: index.suggest(prefix, limit), repeat) * 1000
+        scanned = timed(lambda: range_scan(index, prefix, limit), repeat) * 1000
+        keys = range_scan(index, prefix, limit)[1]
+        print(f"{prefix:<16} {indexed:10.1f} {scanned:10.1f} {keys:10,}")
+
+    started = time.perf_counter()
+    for product_id in range(1, 1001):
+        state = index.products[product_id]
+        index.set_product(
+            product_id, f"{state.name} x", state.category, state.brand_id, True
+        )
+    update = (time.perf_counter() - started) / 1000 * 1e6
+    print(f"incremental update: {update:.1f} us per product")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=8)
+    args = parser.parse_args()
+    for count in args.products:
+        run(count, args.repeat, args.limit)
+
+
+if __name__ == "__main__":
+    main()
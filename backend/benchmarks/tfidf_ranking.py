@@ -0,0 +1,63 @@
+"""Build time and query latency of the TF-IDF ranking, with the top-k chosen
+by ``argpartition`` vs a full ``argsort`` of every matching product.
+
+Uses the same synthetic catalog as ``benchmarks.product_index``.
+
+    python -m benchmarks.tfidf_ranking --products 100000 1000000
+"""
+
+import argparse
+import resource
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from app.ai.utils.tfidf_ranking import TfidfRanking
+from benchmarks.product_index import QUERIES, synthetic_rows, timed
+
+Row = namedtuple(
+    "Row",
+    "product_id product_name category description brand_id price approved brand_name",
+)
+
+
+def full_sort(ranking: TfidfRanking, terms, limit: int):
+    """What ``TfidfRanking.rank`` would cost with a sort instead of a partition."""
+    vector = ranking.vectorizer.transform([" ".join(terms)])
+    scores = (ranking.matrix @ vector.T).tocoo()
+    order = np.argsort(-scores.data, kind="stable")[:limit]
+    return ranking.product_ids[scores.row[order]]
+
+
+def run(count: int, repeat: int, limit: int):
+    rows = [Row(*row) for row in synthetic_rows(count)]
+    started = time.perf_counter()
+    ranking = TfidfRanking(rows)
+    build = time.perf_counter() - started
+    del rows
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"\n{count:,} products: built in {build:.1f}s, {ranking.terms:,} terms, "
+        f"{ranking.matrix.nnz:,} non-zeros, peak RSS {rss:,.0f} MB"
+    )
+    print(f"{'query':<28} {'top-k ms':>10} {'sort ms':>10} {'hits':>8}")
+    for terms in QUERIES:
+        ranked = timed(lambda: ranking.rank(terms, limit=limit), repeat)
+        sorted_ = timed(lambda: full_sort(ranking, terms, limit), repeat)
+        hits = len(ranking.rank(terms, limit=count))
+        print(f"{' | '.join(terms):<28} {ranked:10.2f} {sorted_:10.2f} {hits:8,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+    for count in args.products:
+        run(count, args.repeat, args.limit)
+
+
+if __name__ == "__main__":
+    main()
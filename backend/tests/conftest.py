@@ -1,18 +1,37 @@
 import os
 import pytest
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from app.database import Base, get_db
+from sqlalchemy.pool import NullPool
+from app import cache
+from app.helpers.principals import principals, token_versions
+from app.helpers.rate_limit import local_buckets
+from app.database import Base, get_db, get_async_db, get_async_read_db
 from app.main import app
 from fastapi.testclient import TestClient
 from app.models import User, Product, Order
 from dotenv import load_dotenv
 load_dotenv()
 TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+TEST_ASYNC_DATABASE_URL = make_url(TEST_DATABASE_URL).set(
+    drivername="postgresql+asyncpg"
+)
 
 engine = create_engine(TEST_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# NullPool: TestClient runs every request on its own event loop, and asyncpg
+# connections cannot be shared between loops.
+async_engine = create_async_engine(TEST_ASYNC_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+# Same reason for the response cache: its Redis pool is bound to one loop, so
+# the tests exercise the in-process tier only.
+cache.redis_client = None
+
 @pytest.fixture(scope="session", autouse=True)
 def setup_test_db():
     Base.metadata.drop_all(bind=engine)
@@ -33,10 +52,28 @@ def db_session():
         connection.close()
 
 @pytest.fixture
-def client(db_session):
+def clean_tables():
+    yield
+    # Async sessions commit for real, so wipe whatever the requests wrote.
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+@pytest.fixture
+def client(clean_tables, db_session):
     def override_get_db():
         yield db_session
 
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as session:
+            yield session
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_read_db] = override_get_async_db
     yield TestClient(app)
     app.dependency_overrides.clear()
+    cache.l1.clear()
+    principals.clear()
+    token_versions.clear()
+    local_buckets.clear()
@@ -0,0 +1,115 @@
+import time
+
+from app import cache, models
+from app.utils import create_access_token, create_user_token
+from tests.conftest import TestingSessionLocal
+
+
+def test_lru_cache_expires_evicts_and_invalidates_by_tag():
+    lru = cache.LRUCache(size=2, ttl=60)
+    lru.set("a", 1, ["products"])
+    lru.set("b", 2, ["brands"])
+    lru.get("a")
+    lru.set("c", 3)
+    assert lru.get("b") is None  # least recently used
+    assert lru.get("a") == 1
+
+    lru.invalidate(["products"])
+    assert lru.get("a") is None
+    assert lru.get("c") == 3
+
+    short = cache.LRUCache(size=2, ttl=0.01)
+    short.set("a", 1)
+    time.sleep(0.02)
+    assert short.get("a") is None
+
+
+def seed_product():
+    db = TestingSessionLocal()
+    artisan = models.User(username="maker", email="maker@example.com", role="artisan")
+    db.add(artisan)
+    db.flush()
+    brand = models.Brand(user_id=artisan.user_id, brand_name="Nakshi Ghor")
+    db.add(brand)
+    db.flush()
+    product = models.Product(
+        brand_id=brand.brand_id,
+        product_name="Nakshi kantha",
+        product_pic=[],
+        product_video=[],
+        category="kantha",
+        price=500,
+    )
+    db.add(product)
+    db.commit()
+    ids = product.product_id, brand.brand_id
+    db.close()
+    return ids
+
+
+def test_catalog_reads_are_cached_until_a_write_invalidates_them(client):
+    product_id, brand_id = seed_product()
+    auth = {
+        "Authorization": f"Bearer {create_access_token({'sub': 'maker@example.com'})}"
+    }
+    urls = ["/products", f"/products/{product_id}", "/brands", f"/brands/{brand_id}"]
+    for url in urls:
+        client.get(url)
+
+    hits = cache.cache_stats["l1_hits"]
+    for url in urls:
+        client.get(url)
+    assert cache.cache_stats["l1_hits"] == hits + len(urls)
+
+    response = client.patch(
+        f"/products/{product_id}",
+        json={
+            "product_name": "Nakshi kantha quilt",
+            "product_pic": [],
+            "product_video": [],
+            "category": "kantha",
+            "order_size": None,
+            "quantity_unit": None,
+            "price": 500,
+        },
+        headers=auth,
+    )
+    assert response.status_code == 200, response.text
+    assert client.get("/products").json()["items"][0]["product_name"] == (
+        "Nakshi kantha quilt"
+    )
+    assert client.get(f"/products/{product_id}").json()["product_name"] == (
+        "Nakshi kantha quilt"
+    )
+    brand = client.get(f"/brands/{brand_id}").json()
+    assert brand["products"][0]["product_name"] == "Nakshi kantha quilt"
+
+    response = client.patch(
+        "/brands/me",
+        json={"brand_name": "Kantha Ghor", "brand_description": None, "logo": None},
+        headers=auth,
+    )
+    assert response.status_code == 200, response.text
+    assert client.get("/brands").json()["items"][0]["brand_name"] == "Kantha Ghor"
+
+
+def test_deleting_a_user_drops_their_cached_catalog(client):
+    product_id, brand_id = seed_product()
+    db = TestingSessionLocal()
+    admin = models.User(username="admin", email="admin@example.com", role="admin")
+    maker = db.query(models.User).filter_by(email="maker@example.com").one()
+    db.add(admin)
+    db.commit()
+    maker_id = maker.user_id
+    auth = {"Authorization": f"Bearer {create_user_token(admin)}"}
+    db.close()
+    urls = ["/products", f"/products/{product_id}", "/brands", f"/brands/{brand_id}"]
+    for url in urls:
+        assert client.get(url).status_code == 200
+
+    response = client.delete(f"/admin/users/{maker_id}", headers=auth)
+    assert response.status_code == 200, response.text
+    assert client.get("/products").json()["items"] == []
+    assert client.get(f"/products/{product_id}").status_code == 404
+    assert client.get("/brands").json()["items"] == []
+    assert client.get(f"/brands/{brand_id}").status_code == 404
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import cache, database
+from app.models import Product
+
+
+def make_routing_session(replica):
+    return database.RoutingSession(info={"principal": "a@b.c", "replica": replica})
+
+
+def test_routing_session_reads_from_replica_and_writes_to_primary():
+    replica = create_async_engine("postgresql+asyncpg://replica/db")
+    session = make_routing_session(replica)
+    primary = database.async_engine.sync_engine
+
+    assert session.get_bind(clause=select(Product)) is replica.sync_engine
+    assert session.get_bind(clause=select(Product).with_for_update()) is primary
+    assert session.get_bind(clause=update(Product).values(price=1)) is primary
+
+    session.info["wrote"] = True
+    assert session.get_bind(clause=select(Product)) is primary
+
+
+class SharedRedis:
+    """The two Redis calls the read-your-writes window makes, in a dict."""
+
+    def __init__(self):
+        self.keys = {}
+
+    async def set(self, key, value, px):
+        self.keys[key] = value
+
+    async def exists(self, key):
+        return int(key in self.keys)
+
+
+def test_read_your_writes_window(monkeypatch):
+    monkeypatch.setattr(database, "DB_READ_YOUR_WRITES_SECONDS", 5)
+    session = make_routing_session(None)
+    session.info["wrote"] = True
+    database._committed_write(session)
+
+    assert asyncio.run(database.wrote_recently("a@b.c"))
+    assert not asyncio.run(database.wrote_recently("someone@else.c"))
+
+    monkeypatch.setattr(database, "DB_READ_YOUR_WRITES_SECONDS", 0)
+    assert not asyncio.run(database.wrote_recently("a@b.c"))
+
+
+def test_statements_open_the_window_in_every_worker(monkeypatch, clean_tables):
+    """Core UPDATEs count as writes, sync sessions track them too, and the
+    window reaches the other workers through Redis."""
+    monkeypatch.setattr(database, "_recent_writers", {})
+    monkeypatch.setattr(cache, "redis_client", SharedRedis())
+    session = database.SessionLocal(info={"principal": "a@b.c"})
+    session.execute(update(Product).where(Product.product_id == -1).values(price=1))
+    session.commit()
+    session.close()
+    assert "a@b.c" in database._recent_writers
+    asyncio.run(database.share_writes(session))
+
+    database._recent_writers.clear()  # as seen from another worker
+    assert asyncio.run(database.wrote_recently("a@b.c"))
+    assert not asyncio.run(database.wrote_recently("someone@else.c"))
+
+    replica = create_async_engine("postgresql+asyncpg://replica/db")
+    session = make_routing_session(replica)
+    session.get_bind(clause=update(Product).values(price=1))
+    assert session.get_bind(clause=select(Product)) is database.async_engine.sync_engine
+
+
+def test_expired_writers_are_pruned_on_write(monkeypatch):
+    """Writers that never read again do not accumulate."""
+    monkeypatch.setattr(
+        database, "_recent_writers", {"gone@b.c": time.monotonic() - 10}
+    )
+    monkeypatch.setattr(database, "DB_READ_YOUR_WRITES_SECONDS", 5)
+    session = make_routing_session(None)
+    session.info["wrote"] = True
+    database._committed_write(session)
+
+    assert list(database._recent_writers) == ["a@b.c"]
@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.ai.utils import fuzzy_match
+from app.ai.utils.ai_search import get_most_similar_products
+from app.ai.utils.fuzzy_match import Catalog, CatalogFilters, best_matches
+
+TEXTS = [
+    "clay pot pottery",
+    "nakshi kantha quilt",
+    "silk saree saree jamdani weave",
+    "jamdani saree saree",
+]
+CATALOG = Catalog(TEXTS)
+
+
+def test_best_matches_ranks_and_limits():
+    # Verbatim terms score 100 and come first, in catalog order.
+    assert best_matches(CATALOG, ["jamdani"], 10) == [(2, 100), (3, 100)]
+    assert best_matches(CATALOG, ["jamdani"], 1) == [(2, 100)]
+    # A misspelling still matches, below 100; unrelated texts are cut off.
+    matches = best_matches(CATALOG, ["nakshi kanta"], 10)
+    assert matches[0][0] == 1 and 68 <= matches[0][1] < 100
+    assert 0 not in dict(matches)
+    # Fewer verbatim matches than asked for: fuzzy ones fill up the rest.
+    matches = best_matches(CATALOG, ["pot", "nakshi kanta"], 10)
+    assert [i for i, _ in matches] == [0, 1]
+    assert best_matches(CATALOG, [], 10) == []
+
+    products = [
+        SimpleNamespace(
+            product_id=product_id, product_name=text, category=None, description=None
+        )
+        for product_id, text in enumerate(TEXTS)
+    ]
+    found = get_most_similar_products(products, ["Saree"], {"Saree": ["pot"]}, 2)
+    assert found == [(products[0], 1.0), (products[2], 1.0)]
+
+
+def test_best_matches_pages_past_the_last_match():
+    terms = ["pot", "nakshi kanta"]
+    everything = best_matches(CATALOG, terms, 10)
+    pages, after = [], None
+    while True:
+        page = best_matches(CATALOG, terms, 1, after=after)
+        if not page:
+            break
+        pages += page
+        after = page[-1][::-1]
+    assert pages == everything
+    assert best_matches(CATALOG, ["jamdani"], 10, after=(100, 2)) == [(3, 100)]
+
+
+def test_filters_apply_before_the_cut():
+    filters = CatalogFilters(
+        ["pottery", "quilt", "saree", "saree"],
+        ["kumar para", "nakshi ghor", "tant ghor", "aarong"],
+        [500, 2000, 9000, 3000],
+    )
+    assert filters.allowed() is None
+    allowed = filters.allowed("Saree", [0, 5000], None)
+    assert allowed.tolist() == [False, False, False, True]
+    # The best match overall is filtered out, not returned in place of one.
+    assert best_matches(CATALOG, ["jamdani"], 1, allowed=allowed) == [(3, 100)]
+    allowed = filters.allowed(None, None, "GHOR")
+    assert [i for i, _ in best_matches(CATALOG, ["saree"], 10, allowed=allowed)] == [2]
+
+
+def test_match_process_serves_the_catalog():
+    rows = [
+        SimpleNamespace(
+            product_id=product_id,
+            product_name=text,
+            category="Saree" if "saree" in text else None,
+            description=None,
+            price=1000 * product_id,
+            brand_name="Tant Ghor",
+            approved=product_id != 40,
+        )
+        for product_id, text in zip((10, 20, 30, 40), TEXTS)
+    ]
+
+    async def search():
+        assert await fuzzy_match.match_products(["jamdani"], 10) is None
+        await fuzzy_match.set_catalog(rows)
+        return (
+            await fuzzy_match.match_products(["jamdani"], 10),
+            await fuzzy_match.match_products(
+                ["saree"], 10, None, ("saree", None, None)
+            ),
+            await fuzzy_match.match_products(
+                ["saree"], 10, None, (None, [0, 20000], None)
+            ),
+        )
+
+    try:
+        assert asyncio.run(search()) == ([(30, 1.0)], [(30, 1.0)], [])
+    finally:
+        fuzzy_match._reset()
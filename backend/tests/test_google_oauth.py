@@ -0,0 +1,174 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from fastapi import HTTPException
+from google.auth import crypt
+from google.auth import jwt as google_jwt
+
+from app import utils
+from app.helpers import google_oauth
+
+CLIENT_ID = "client.apps.googleusercontent.com"
+
+
+def make_key(key_id):
+    """Private key PEM and its self-signed certificate PEM."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, key_id)])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    return key_pem, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+KEYS = {key_id: make_key(key_id) for key_id in ("k1", "k2")}
+
+
+def id_token(key_id="k1", audience=CLIENT_ID):
+    signer = crypt.RSASigner.from_string(KEYS[key_id][0], key_id=key_id)
+    now = int(time.time())
+    return google_jwt.encode(
+        signer,
+        {
+            "iss": "https://accounts.google.com",
+            "aud": audience,
+            "sub": "google-1",
+            "email": "buyer@example.com",
+            "email_verified": True,
+            "iat": now,
+            "exp": now + 300,
+        },
+    ).decode()
+
+
+class StubGoogle(BaseHTTPRequestHandler):
+    """Google's certificate and token endpoints, as far as we use them."""
+
+    def do_GET(self):
+        self.server.cert_fetches += 1
+        if self.server.certs_down:
+            self.reply(503, {"error": "unavailable"})
+            return
+        certs = {key_id: KEYS[key_id][1] for key_id in self.server.key_ids}
+        self.reply(200, certs, self.server.cache_headers)
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        form = parse_qs(self.rfile.read(length).decode())
+        if form["code"] == ["good"] and form["client_id"] == [CLIENT_ID]:
+            self.reply(200, {"access_token": "ya29", "id_token": "jwt"})
+        else:
+            self.reply(400, {"error": "invalid_grant"})
+
+    def reply(self, code, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def google(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGoogle)
+    server.cert_fetches = 0
+    server.certs_down = False
+    server.key_ids = ["k1"]
+    server.cache_headers = {"Cache-Control": "public, max-age=3600"}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setattr(google_oauth, "GOOGLE_CERTS_URL", f"{url}/certs")
+    monkeypatch.setattr(google_oauth, "GOOGLE_TOKEN_URL", f"{url}/token")
+    monkeypatch.setattr(google_oauth, "_certs_expire_at", 0.0)
+    monkeypatch.setattr(google_oauth, "_certs_fetched_at", float("-inf"))
+    monkeypatch.setattr(utils, "GOOGLE_CLIENT_ID", CLIENT_ID)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_certificates_are_cached_until_max_age(google):
+    for _ in range(3):
+        info = utils.auth_utils.verify_google_token(id_token())
+        assert info["email"] == "buyer@example.com"
+    assert google.cert_fetches == 1
+
+
+def test_age_header_shortens_the_cache(google):
+    google.cache_headers = {"Cache-Control": "max-age=600", "Age": "600"}
+    utils.auth_utils.verify_google_token(id_token())
+    utils.auth_utils.verify_google_token(id_token())
+    assert google.cert_fetches == 2
+
+
+def test_unknown_key_id_refetches_certificates(google, monkeypatch):
+    monkeypatch.setattr(google_oauth, "GOOGLE_CERTS_MIN_REFRESH_SECONDS", 0)
+    utils.auth_utils.verify_google_token(id_token("k1"))
+    google.key_ids = ["k1", "k2"]
+    info = utils.auth_utils.verify_google_token(id_token("k2"))
+    assert info["google_id"] == "google-1"
+    assert google.cert_fetches == 2
+
+
+def test_wrong_audience_is_rejected(google):
+    with pytest.raises(HTTPException) as error:
+        utils.auth_utils.verify_google_token(id_token(audience="someone-else"))
+    assert error.value.status_code == 400
+
+
+def test_certificate_outage_is_a_bad_gateway(google):
+    google.certs_down = True
+    with pytest.raises(HTTPException) as error:
+        utils.auth_utils.verify_google_token(id_token())
+    assert error.value.status_code == 502
+    assert error.value.detail == utils.GOOGLE_UNAVAILABLE
+
+
+def test_code_exchange(google, monkeypatch):
+    async def exchange():
+        async with httpx.AsyncClient(timeout=1) as client:
+            monkeypatch.setattr(google_oauth, "http_client", client)
+            tokens = await utils.auth_utils.exchange_code_for_token("good")
+            with pytest.raises(HTTPException) as rejected:
+                await utils.auth_utils.exchange_code_for_token("bad")
+            monkeypatch.setattr(
+                google_oauth, "GOOGLE_TOKEN_URL", "http://127.0.0.1:1/token"
+            )
+            with pytest.raises(HTTPException) as unreachable:
+                await utils.auth_utils.exchange_code_for_token("good")
+        return tokens, rejected.value, unreachable.value
+
+    tokens, rejected, unreachable = asyncio.run(exchange())
+    assert tokens["access_token"] == "ya29"
+    assert rejected.status_code == 400
+    assert unreachable.status_code == 502
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import pytest
+
+from app.ai.utils import keyword_cache
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    calls = []
+
+    def generate_keywords(query):
+        calls.append(query)
+        time.sleep(0.01)
+        if query == "???":
+            return {"keywords": [], "keywords_en": [], "synonyms": {}}
+        return {"keywords": [query], "keywords_en": [query], "synonyms": {}}
+
+    monkeypatch.setattr(keyword_cache, "generate_keywords", generate_keywords)
+    keyword_cache.l1.clear()
+    yield calls
+    keyword_cache.l1.clear()
+
+
+def test_normalized_repeats_skip_the_llm(llm):
+    async def run():
+        first = await keyword_cache.cached_keywords("Jamdani  Saree")
+        again = await keyword_cache.cached_keywords(" jamdani saree ")
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert first == again == {
+        "keywords": ["jamdani saree"],
+        "keywords_en": ["jamdani saree"],
+        "synonyms": {},
+    }
+    assert llm == ["jamdani saree"]
+
+
+def test_concurrent_misses_share_one_call(llm):
+    async def run():
+        return await asyncio.gather(
+            *(keyword_cache.cached_keywords("nakshi kantha") for _ in range(5))
+        )
+
+    assert len(asyncio.run(run())) == 5
+    assert llm == ["nakshi kantha"]
+
+
+def test_empty_answers_are_not_cached(llm):
+    async def run():
+        await keyword_cache.cached_keywords("???")
+        await keyword_cache.cached_keywords("???")
+
+    asyncio.run(run())
+    assert llm == ["???", "???"]
+
+
+def test_popular_entries_refresh_before_expiry(llm, monkeypatch):
+    async def run():
+        await keyword_cache.cached_keywords("clay pot")
+        # Age the entry into the refresh-ahead window.
+        entry = keyword_cache.l1.get("clay pot")
+        entry.expires_at = time.time() + 60
+        for _ in range(keyword_cache.KEYWORD_REFRESH_MIN_HITS):
+            assert (await keyword_cache.cached_keywords("clay pot"))["keywords"]
+        assert len(llm) == 1  # hits never waited on the refresh
+        await asyncio.gather(*keyword_cache._in_flight.values())
+        return keyword_cache.l1.get("clay pot")
+
+    refreshed = asyncio.run(run())
+    assert llm == ["clay pot", "clay pot"]
+    assert refreshed.expires_at > time.time() + 3600
@@ -0,0 +1,152 @@
+import asyncio
+
+from app import models
+from app.ai.utils import keyword_cache, lexicon, query_parser
+from app.ai.utils.lexicon import Lexicon, seed_lexicon
+from tests.conftest import TestingAsyncSessionLocal, TestingSessionLocal
+
+
+def test_translate_places_known_terms():
+    known = Lexicon([("aarong", None, [], "catalog")])
+    translated = known.translate("আমি নকশি কাঁথা আর শাড়ি চাই ২০০০ টাকার নিচে")
+    assert translated.keywords_en == ["nakshi kantha", "saree"]
+    assert translated.unknown == []
+
+    translated = known.translate("Aarong ঢাকাই জামদানি", frozenset({"muslin"}))
+    assert translated.keywords_en == ["aarong", "jamdani"]
+    assert translated.unknown == ["ঢাকাই"]
+    assert known.translate("মসলিন muslin").unknown == ["muslin"]
+
+
+def test_llm_answers_are_vote_candidates():
+    known = Lexicon()
+    answer = {
+        "keywords": ["ঢাকাই", "শাড়ি", "টাঙ্গাইল" * 40],
+        "keywords_en": ["Dhakai", "sari", "tangail"],
+        "synonyms": {"ঢাকাই": ["dhakai jamdani", "x" * 256], "saree": ["sari"]},
+    }
+    assert known.candidates(answer) == {
+        ("ঢাকাই", "translation", "dhakai"),
+        ("dhakai", "synonym", "dhakai jamdani"),
+        ("saree", "synonym", "sari"),
+    }  # the glossary's শাড়ি stays "saree"; over-long entries are left out
+
+    known.add("ঢাকাই", "dhakai")
+    known.add("dhakai", synonyms=["dhakai jamdani"])
+    known.add("saree", synonyms=["sari"])
+    assert known.candidates(answer) == set()
+    translated = known.translate("ঢাকাই শাড়ি")
+    assert translated.keywords_en == ["dhakai", "saree"]
+    assert translated.synonyms == {"dhakai": ["dhakai jamdani"], "saree": ["sari"]}
+
+
+def add_catalog():
+    db = TestingSessionLocal()
+    artisan = models.User(username="maker", email="maker@example.com", role="artisan")
+    db.add(artisan)
+    db.flush()
+    brand = models.Brand(user_id=artisan.user_id, brand_name="Tant Ghor", logo="")
+    db.add(brand)
+    db.flush()
+    for name in ("Jamdani saree", "Dhakai jamdani saree"):
+        db.add(
+            models.Product(
+                brand_id=brand.brand_id,
+                product_name=name,
+                category="Saree",
+                product_pic=[],
+                product_video=[],
+                price=1500,
+                approved=True,
+            )
+        )
+    db.commit()
+    db.close()
+
+
+def test_seed_saves_glossary_and_catalog_names(clean_tables):
+    add_catalog()
+
+    async def seed():
+        async with TestingAsyncSessionLocal() as db:
+            await seed_lexicon(db)
+            await seed_lexicon(db)  # idempotent
+            return await lexicon.load_lexicon(db)
+
+    loaded = asyncio.run(seed())
+    assert loaded.translations["শাড়ি"] == "saree"
+    assert {"saree", "tant ghor"} <= loaded.verbatim
+
+
+def test_glossary_and_catalog_replace_llm_entries(clean_tables, monkeypatch):
+    add_catalog()
+    db = TestingSessionLocal()
+    for term, translation in (("শাড়ি", "sari"), ("tant ghor", "loom house")):
+        db.add(models.LexiconTerm(term=term, translation=translation, source="llm"))
+    db.commit()
+    db.close()
+    monkeypatch.setattr(lexicon, "_lexicon", Lexicon())
+    monkeypatch.setattr(lexicon, "_pending_votes", {})
+    monkeypatch.setattr(lexicon, "LEXICON_MIN_VOTES", 1)
+
+    async def seed_then_learn():
+        async with TestingAsyncSessionLocal() as db:
+            await seed_lexicon(db)
+            lexicon._pending_votes[("শাড়ি", "translation", "sari")] = 1
+            await lexicon.save_learned(db)
+            return await lexicon.load_lexicon(db)
+
+    loaded = asyncio.run(seed_then_learn())
+    assert loaded.translations["শাড়ি"] == "saree"
+    assert "tant ghor" in loaded.verbatim
+    assert "tant ghor" not in loaded.translations
+
+
+def test_bangla_queries_skip_or_narrow_the_llm(client, clean_tables, monkeypatch):
+    add_catalog()
+    asked = []
+
+    def llm(query):
+        asked.append(query)
+        return {"keywords": ["ঢাকাই"], "keywords_en": ["dhakai"], "synonyms": {}}
+
+    monkeypatch.setattr(keyword_cache, "generate_keywords", llm)
+    monkeypatch.setattr(query_parser, "_vocabulary", None)
+    monkeypatch.setattr(lexicon, "_lexicon", None)
+    monkeypatch.setattr(lexicon, "_pending_votes", {})
+    monkeypatch.setattr(lexicon, "LEXICON_MIN_VOTES", 2)
+    keyword_cache.l1.clear()
+    translated = query_parser.parse_time["lexicon"].count
+
+    response = client.get("/search/", params={"q": "জামদানি শাড়ি"})
+    assert response.status_code == 200
+    assert len(response.json()["products"]) == 2
+    assert asked == []
+    assert query_parser.parse_time["lexicon"].count == translated + 1
+
+    response = client.get("/search/", params={"q": "ঢাকাই জামদানি শাড়ি"})
+    assert asked == ["ঢাকাই"]
+    assert response.json()["keywords_used"] == ["jamdani", "saree", "dhakai"]
+
+    async def save():
+        async with TestingAsyncSessionLocal() as db:
+            return await lexicon.save_learned(db)
+
+    # A cached answer serves the search again without voting again.
+    client.get("/search/", params={"q": "ঢাকাই জামদানি"})
+    assert asked == ["ঢাকাই"]
+    assert asyncio.run(save()) == 0
+    db = TestingSessionLocal()
+    assert db.get(models.LexiconTerm, "ঢাকাই") is None
+
+    keyword_cache.l1.clear()  # as if the answer expired
+    client.get("/search/", params={"q": "ঢাকাই জামদানি"})
+    assert asked == ["ঢাকাই", "ঢাকাই"]
+    assert asyncio.run(save()) == 1
+    learned = db.get(models.LexiconTerm, "ঢাকাই")
+    assert (learned.translation, learned.source) == ("dhakai", "llm")
+    db.close()
+
+    client.get("/search/", params={"q": "ঢাকাই জামদানি"})
+    assert asked == ["ঢাকাই", "ঢাকাই"]
+    keyword_cache.l1.clear()
@@ -0,0 +1,29 @@
+from app.metrics import Histogram
+
+
+def test_histogram_buckets_are_cumulative():
+    """Each observation lands in its own bucket and every wider one."""
+    histogram = Histogram(buckets=(0.01, 0.1, 1))
+    for value in (0.005, 0.05, 0.5, 5):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 4
+    assert snapshot["max"] == 5
+    assert snapshot["buckets"] == {
+        "le_0.01": 1,
+        "le_0.1": 2,
+        "le_1": 3,
+        "le_inf": 4,
+    }
+
+
+def test_metrics_reports_pool_usage(client):
+    """/metrics exposes checked-out, idle, overflow and wait numbers per pool."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.json()
+    assert "pid" in body
+    for pool in ("sync", "async"):
+        stats = body["db_pool"][pool]
+        assert {"checked_out", "idle", "overflow", "wait_time"} <= stats.keys()
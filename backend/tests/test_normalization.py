@@ -0,0 +1,36 @@
+from app.ai.utils.normalization import analyze, detect_language, normalize, stem
+from app.ai.utils.product_index import ProductDoc, ProductIndex
+
+
+def test_normalize():
+    assert normalize("  Jamdani\tSAREE  ২০০০ ") == "jamdani saree 2000"
+    assert normalize("র‌্যাব") == normalize("র্যাব")  # zero-width non-joiner
+    assert normalize("ﬁne") == "fine"  # NFKC
+    assert normalize(None) == ""
+
+
+def test_detect_language():
+    assert detect_language("জামদানি শাড়ি") == "bn"
+    assert detect_language("Aarong শাড়ি") == "bn"
+    assert detect_language("jamdani saree") == "en"
+
+
+def test_analyze_drops_stopwords_and_stems():
+    assert analyze("Show me the Baskets for babies") == ["basket", "baby"]
+    assert analyze("আমি শাড়িগুলো চাই") == [normalize("শাড়ি")]
+    # Short words and stems that only look inflected are left alone.
+    assert [stem(w) for w in ("bus", "glass", "sarees", "মাটির", "চাদর")] == [
+        "bus",
+        "glass",
+        "saree",
+        "মাটি",
+        "চাদর",
+    ]
+
+
+def test_index_and_query_share_tokens():
+    index = ProductIndex()
+    doc = ProductDoc.from_row("নকশি কাঁথা", "Quilts", None, 1, 1000, True)
+    index.add(1, doc)
+    assert index.search(["কাঁথাগুলো"]) == [(1, 1.0)]
+    assert index.search(["quilt"]) == [(1, 1.0)]
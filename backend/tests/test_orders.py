@@ -0,0 +1,151 @@
+import pytest
+from sqlalchemy import event, func, select, update
+
+from app import models
+from app.utils import create_access_token
+from tests.conftest import TestingSessionLocal, async_engine
+
+
+def seed_orders(count: int):
+    """Customer with ``count`` two-item orders from one artisan's brand."""
+    db = TestingSessionLocal()
+    customer = models.User(username="buyer", email="buyer@example.com", role="customer")
+    artisan = models.User(username="maker", email="maker@example.com", role="artisan")
+    db.add_all([customer, artisan])
+    db.flush()
+    brand = models.Brand(user_id=artisan.user_id, brand_name="Kantha House")
+    db.add(brand)
+    db.flush()
+    products = [
+        models.Product(
+            brand_id=brand.brand_id, product_name=name, category="kantha", price=500
+        )
+        for name in ("Nakshi kantha", "Kantha stole")
+    ]
+    db.add_all(products)
+    db.flush()
+    for _ in range(count):
+        order = models.Order(user_id=customer.user_id, status="Pending")
+        order.order_items = [
+            models.OrderItem(product_id=product.product_id, size="M", quantity=1)
+            for product in products
+        ]
+        order.bill = models.Bill(
+            amount=1000, method="Pending", trx_id="1234", status="Pending"
+        )
+        db.add(order)
+    db.commit()
+    db.close()
+
+
+def count_queries(client, url, token, method="get", **kwargs):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = client.request(
+            method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs
+        )
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    assert response.status_code == 200, response.text
+    return len(statements), response.json()
+
+
+@pytest.mark.parametrize("order_count", [1, 25])
+def test_my_orders_details_query_count_is_constant(client, order_count):
+    """Listing order details costs the same number of queries for 1 or 25 orders."""
+    seed_orders(order_count)
+    token = create_access_token({"sub": "buyer@example.com"})
+    queries, orders = count_queries(client, "/orders/me/details", token)
+
+    assert len(orders) == order_count
+    assert all(len(order["order_items"]) == 2 for order in orders)
+    assert all(order["bill_status"] == "Pending" for order in orders)
+    # user lookup, orders, bills, items
+    assert queries == 4
+
+
+@pytest.mark.parametrize("order_count", [1, 25])
+def test_artisan_orders_query_count_is_constant(client, order_count):
+    """The artisan listing shares the bulk loader and stays flat too."""
+    seed_orders(order_count)
+    token = create_access_token({"sub": "maker@example.com"})
+    queries, orders = count_queries(client, "/orders/artisan", token)
+
+    assert len(orders) == order_count
+    # user lookup, brand ids, orders, bills, items
+    assert queries == 5
+
+
+def seeded_product_ids():
+    db = TestingSessionLocal()
+    ids = db.scalars(
+        select(models.Product.product_id).order_by(models.Product.product_id)
+    ).all()
+    db.close()
+    return ids
+
+
+def order_count():
+    db = TestingSessionLocal()
+    count = db.scalar(select(func.count()).select_from(models.Order))
+    db.close()
+    return count
+
+
+@pytest.mark.parametrize("line_count", [1, 20])
+def test_create_order_is_one_batched_transaction(client, line_count):
+    """Products are locked in one query and items inserted in one batch."""
+    seed_orders(0)
+    product_ids = seeded_product_ids()
+    token = create_access_token({"sub": "buyer@example.com"})
+    payload = {
+        "phone": "01700000000",
+        "order_items": [
+            {"product_id": product_ids[i % 2], "size": "M", "quantity": 1}
+            for i in range(line_count)
+        ],
+    }
+    queries, order = count_queries(client, "/orders", token, "post", json=payload)
+
+    db = TestingSessionLocal()
+    bill = db.scalar(select(models.Bill).filter_by(order_id=order["order_id"]))
+    items = db.scalars(
+        select(models.OrderItem).filter_by(order_id=order["order_id"])
+    ).all()
+    db.close()
+    assert len(items) == line_count
+    assert bill.amount == 500 * line_count
+    # user lookup, locked products, order, items, bill
+    assert queries == 5
+
+
+@pytest.mark.parametrize(
+    "line, status_code",
+    [({"product_id": 0, "quantity": 1}, 404), ({"quantity": 6}, 400)],
+)
+def test_failed_order_leaves_nothing_behind(client, line, status_code):
+    seed_orders(0)
+    db = TestingSessionLocal()
+    db.execute(update(models.Product).values(order_quantity=5))
+    db.commit()
+    db.close()
+    product_id = seeded_product_ids()[0]
+    token = create_access_token({"sub": "buyer@example.com"})
+    payload = {
+        "phone": "01700000000",
+        "order_items": [
+            {"product_id": product_id, "size": "M", "quantity": 1},
+            {"product_id": product_id, "size": "M", **line},
+        ],
+    }
+    response = client.post(
+        "/orders", json=payload, headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == status_code, response.text
+    assert order_count() == 0
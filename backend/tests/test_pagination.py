@@ -0,0 +1,52 @@
+from app import models
+from app.helpers.pagination import decode_cursor, encode_cursor
+from tests.conftest import TestingSessionLocal
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(12345)) == 12345
+
+
+def test_products_are_paged_by_cursor(client):
+    """Walking next_cursor returns every product exactly once, in id order."""
+    db = TestingSessionLocal()
+    artisan = models.User(username="maker", email="maker@example.com", role="artisan")
+    db.add(artisan)
+    db.flush()
+    brand = models.Brand(user_id=artisan.user_id, brand_name="Jamdani Ghar")
+    db.add(brand)
+    db.flush()
+    db.add_all(
+        models.Product(
+            brand_id=brand.brand_id,
+            product_name=f"Jamdani saree {i}",
+            product_pic=[],
+            product_video=[],
+            category="saree",
+            price=1000 + i,
+        )
+        for i in range(7)
+    )
+    db.commit()
+    db.close()
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/products", params=params).json()
+        assert len(page["items"]) <= 3
+        seen += [product["product_id"] for product in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 7
+    assert seen == sorted(seen)
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get("/products", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_page_size_is_capped(client):
+    assert client.get("/products", params={"limit": 1000}).status_code == 422
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from app import models
+from app.helpers import passwords
+
+
+def test_hashing_does_not_block_the_event_loop():
+    async def run():
+        gaps, last = [], time.perf_counter()
+
+        async def tick():
+            nonlocal last
+            while not hashing.done():
+                await asyncio.sleep(0.005)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        hashing = asyncio.ensure_future(passwords.hash_password("s3cret-pass"))
+        await asyncio.gather(hashing, tick())
+        return hashing.result(), max(gaps)
+
+    hashed, longest_gap = asyncio.run(run())
+    assert passwords.pwd_context.verify("s3cret-pass", hashed)
+    assert longest_gap < 0.1
+
+
+def test_saturated_executor_sheds_with_503(monkeypatch):
+    monkeypatch.setattr(
+        passwords,
+        "_in_flight",
+        passwords.PASSWORD_HASH_WORKERS + passwords.PASSWORD_HASH_MAX_PENDING,
+    )
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(passwords.hash_password("s3cret-pass"))
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == "1"
+
+
+def test_login_rehashes_when_the_cost_changes(client, db_session):
+    cheap = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+    user = models.User(
+        username="buyer",
+        email="buyer@example.com",
+        password=cheap.hash("s3cret-pass"),
+        role="customer",
+    )
+    db_session.add(user)
+    db_session.commit()
+
+    response = client.post(
+        "/login", json={"email": "buyer@example.com", "password": "s3cret-pass"}
+    )
+    assert response.status_code == 200, response.text
+    db_session.refresh(user)
+    assert user.password.startswith(f"$2b${passwords.BCRYPT_ROUNDS:02d}$")
+    assert passwords.pwd_context.verify("s3cret-pass", user.password)
@@ -0,0 +1,59 @@
+from sqlalchemy import event
+
+from app import models
+from app.helpers import principals
+from app.utils import create_access_token
+from tests.conftest import TestingSessionLocal, async_engine
+
+
+def seed_user():
+    db = TestingSessionLocal()
+    db.add(models.User(username="buyer", email="buyer@example.com", role="customer"))
+    db.commit()
+    db.close()
+    return {
+        "Authorization": f"Bearer {create_access_token({'sub': 'buyer@example.com'})}"
+    }
+
+
+def count_queries(client, method, url, headers):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = client.request(method, url, headers=headers)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    return response, len(statements)
+
+
+def test_principal_is_loaded_once(client):
+    auth = seed_user()
+    response, queries = count_queries(client, "get", "/profile", auth)
+    assert response.json()["email"] == "buyer@example.com"
+    assert queries == 1
+
+    response, queries = count_queries(client, "get", "/profile", auth)
+    assert response.json()["email"] == "buyer@example.com"
+    assert queries == 0
+
+
+def test_role_change_invalidates_the_principal(client):
+    auth = seed_user()
+    assert client.put("/become-artisan", headers=auth).status_code == 200
+    response = client.put("/become-artisan", headers=auth)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "You are already an artisan"
+
+
+def test_load_racing_an_invalidation_is_not_cached():
+    user = models.User(user_id=1, email="buyer@example.com", role="customer")
+    loaded_at = principals.generation()
+    principals._forget("someone@example.com")
+    principals.remember_principal(
+        "buyer@example.com", principals.CurrentUser.from_user(user), loaded_at
+    )
+    assert principals.principals.get("buyer@example.com") is None
@@ -0,0 +1,88 @@
+import pytest
+
+from app import models
+from app.ai.utils import product_index
+from app.ai.utils.product_index import ProductDoc, ProductIndex
+from tests.conftest import TestingSessionLocal
+
+
+def doc(name, category="saree", description=None, brand_id=1, price=1000):
+    return ProductDoc.from_row(name, category, description, brand_id, price, True)
+
+
+def found(index, *args, **kwargs):
+    return [product_id for product_id, _ in index.search(*args, **kwargs)]
+
+
+def test_search_intersects_words_and_unions_terms():
+    index = ProductIndex()
+    index.set_brand(1, "Tant Ghor")
+    index.add(1, doc("Jamdani saree"))
+    index.add(2, doc("Silk saree", description="jamdani weave"))
+    index.add(3, doc("Clay pot", category="pottery", price=300))
+
+    assert found(index, ["jamdani saree"]) == [1, 2]
+    assert found(index, ["jamd"]) == [1, 2]  # prefix
+    assert found(index, ["silk", "jamdani"]) == [2, 1]  # more terms first
+    assert found(index, ["tant ghor"]) == [1, 2, 3]
+    assert found(index, ["saree", "pot"], category="Pottery") == [3]
+    assert found(index, ["saree", "pot"], price_range=[0, 500]) == [3]
+    assert found(index, ["saree"], limit=1) == [1]
+    # Scored by the share of terms matched, and paged past the last hit.
+    ranked = index.search(["silk", "jamdani", "weave"])
+    assert ranked == [(2, 1.0), (1, 1 / 3)]
+    assert index.search(["silk", "jamdani", "weave"], after=ranked[0][::-1]) == [
+        (1, 1 / 3)
+    ]
+    assert found(index, ["saree"], after=(1.0, 1)) == [2]
+
+    index.add(1, doc("Muslin saree"))
+    index.remove(2)
+    assert found(index, ["jamdani"]) == []
+    assert "jamdani" not in index.postings
+
+    index.set_brand(1, "Nakshi Ghor")
+    assert found(index, ["tant"]) == []
+    assert found(index, ["nakshi"]) == [1, 3]
+
+
+@pytest.fixture
+def live_index(monkeypatch):
+    monkeypatch.setattr(product_index, "index", ProductIndex())
+    return product_index.index
+
+
+def test_committed_changes_reach_the_index(clean_tables, live_index):
+    db = TestingSessionLocal()
+    artisan = models.User(username="maker", email="maker@example.com", role="artisan")
+    db.add(artisan)
+    db.flush()
+    brand = models.Brand(user_id=artisan.user_id, brand_name="Tant Ghor")
+    db.add(brand)
+    db.flush()
+    product = models.Product(
+        brand_id=brand.brand_id,
+        product_name="Jamdani saree",
+        category="saree",
+        price=1500,
+    )
+    db.add(product)
+    db.flush()
+    assert found(live_index, ["jamdani"]) == []  # not committed yet
+    db.commit()
+    assert found(live_index, ["tant jamdani"]) == [product.product_id]
+
+    product.product_name = "Muslin saree"
+    db.commit()
+    assert found(live_index, ["jamdani"]) == []
+    assert found(live_index, ["muslin"]) == [product.product_id]
+
+    product.product_name = "Nakshi kantha"
+    db.flush()
+    db.rollback()
+    assert found(live_index, ["nakshi"]) == []
+
+    db.delete(product)
+    db.commit()
+    assert len(live_index) == 0
+    db.close()
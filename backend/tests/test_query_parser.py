@@ -0,0 +1,66 @@
+from app import models
+from app.ai.routers import search
+from app.ai.utils import query_parser
+from app.ai.utils.query_parser import Vocabulary, parse_query
+from tests.conftest import TestingSessionLocal
+
+VOCABULARY = Vocabulary(
+    terms=frozenset({"jamdani", "saree", "silk", "nakshi", "kantha"}),
+    categories={"saree": "Saree", "quilt": "Quilt"},
+    brands={"tant ghor": "Tant Ghor"},
+)
+
+
+def test_simple_queries_parse_locally():
+    parsed = parse_query("Jamdani saree under 2000 tk", VOCABULARY)
+    assert parsed.keywords == ["jamdani", "saree"]
+    assert parsed.category == "Saree"
+    assert parsed.price_range == [0, 2000.0]
+    assert parsed.confidence == 1.0
+
+    parsed = parse_query("show me Tant Ghor silk between 500 and 900", VOCABULARY)
+    assert parsed.brand == "Tant Ghor"
+    assert parsed.keywords == ["silk"]
+    assert parsed.price_range == [500.0, 900.0]
+
+
+def test_unknown_words_lower_confidence():
+    assert parse_query("jamdani sharee", VOCABULARY).confidence == 0.5
+    assert parse_query("জামদানি শাড়ি", VOCABULARY).confidence == 0.0
+    assert parse_query("under 2000", VOCABULARY).confidence == 0.0
+
+
+def test_confident_queries_skip_the_llm(client, monkeypatch):
+    db = TestingSessionLocal()
+    artisan = models.User(username="maker", email="maker@example.com", role="artisan")
+    db.add(artisan)
+    db.flush()
+    brand = models.Brand(user_id=artisan.user_id, brand_name="Tant Ghor", logo="")
+    db.add(brand)
+    db.flush()
+    for name, price in (("Jamdani saree", 1500), ("Jamdani saree deluxe", 5000)):
+        db.add(
+            models.Product(
+                brand_id=brand.brand_id,
+                product_name=name,
+                category="saree",
+                product_pic=[],
+                product_video=[],
+                price=price,
+                approved=True,
+            )
+        )
+    db.commit()
+    db.close()
+
+    async def no_llm(query):
+        raise AssertionError(f"LLM called for {query!r}")
+
+    monkeypatch.setattr(search, "cached_keywords", no_llm)
+    monkeypatch.setattr(query_parser, "_vocabulary", None)
+    local = query_parser.parse_time["local"].count
+
+    response = client.get("/search/", params={"q": "jamdani saree under 2000"})
+    assert response.status_code == 200
+    assert [p["name"] for p in response.json()["products"]] == ["Jamdani saree"]
+    assert query_parser.parse_time["local"].count == local + 1
@@ -0,0 +1,39 @@
+from app.helpers import passwords, rate_limit
+
+
+def login(client, email):
+    return client.post("/login", json={"email": email, "password": "wrong-pass"})
+
+
+def test_account_budget_rejects_before_hashing(client):
+    for _ in range(rate_limit.AUTH_ACCOUNT_BURST):
+        assert login(client, "victim@example.com").status_code == 404
+
+    hashed = passwords.verify_time.snapshot()["count"]
+    response = login(client, "Victim@Example.com ")
+    assert response.status_code == 429
+    assert response.json()["detail"] == rate_limit.TOO_MANY_ATTEMPTS
+    assert int(response.headers["Retry-After"]) >= 1
+    assert passwords.verify_time.snapshot()["count"] == hashed
+
+    # Other accounts still have budget.
+    assert login(client, "someone@example.com").status_code == 404
+
+
+def test_ip_budget_covers_every_account(client, monkeypatch):
+    monkeypatch.setattr(rate_limit, "AUTH_IP_BURST", 3)
+    for n in range(3):
+        assert login(client, f"user{n}@example.com").status_code == 404
+    response = client.post(
+        "/token", data={"username": "user9@example.com", "password": "wrong-pass"}
+    )
+    assert response.status_code == 429
+
+
+def test_rejected_attempts_spend_nothing():
+    buckets = [("a", 1, 1.0), ("b", 5, 1.0)]
+    assert rate_limit._take_local(buckets) == 0
+    assert rate_limit._take_local(buckets) > 0
+    # "b" kept its tokens while "a" was empty.
+    tokens, _ = rate_limit.local_buckets.get("b")
+    assert 3.9 < tokens < 4.1
@@ -0,0 +1,187 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+
+from app import models
+from app.helpers.reservations import release_expired, reserve_stock
+from app.routers import paybill
+from app.routers.paybill import PAYMENT_REFUND_DUE
+from app.utils import create_access_token
+from tests.conftest import TestingAsyncSessionLocal, TestingSessionLocal
+from tests.test_orders import seed_orders, seeded_product_ids
+
+AUTH = {"Authorization": f"Bearer {create_access_token({'sub': 'buyer@example.com'})}"}
+
+
+def stock_product(quantity: int) -> int:
+    seed_orders(0)
+    product_id = seeded_product_ids()[0]
+    db = TestingSessionLocal()
+    db.execute(
+        update(models.Product)
+        .filter_by(product_id=product_id)
+        .values(order_quantity=quantity)
+    )
+    db.commit()
+    db.close()
+    return product_id
+
+
+def stock_of(product_id: int) -> int:
+    db = TestingSessionLocal()
+    quantity = db.scalar(
+        select(models.Product.order_quantity).filter_by(product_id=product_id)
+    )
+    db.close()
+    return quantity
+
+
+def place_order(client, product_id: int, quantity: int) -> int:
+    payload = {
+        "phone": "01700000000",
+        "order_items": [{"product_id": product_id, "size": "M", "quantity": quantity}],
+    }
+    response = client.post("/orders", json=payload, headers=AUTH)
+    assert response.status_code == 200, response.text
+    return response.json()["order_id"]
+
+
+def bill_status(order_id: int) -> str:
+    db = TestingSessionLocal()
+    status = db.scalar(select(models.Bill.status).filter_by(order_id=order_id))
+    db.close()
+    return status
+
+
+@pytest.mark.parametrize(
+    "callback, status", [("fail", "Failed"), ("cancel", "Cancelled")]
+)
+def test_failed_payment_releases_stock(client, callback, status):
+    product_id = stock_product(5)
+    order_id = place_order(client, product_id, 3)
+    assert stock_of(product_id) == 2
+
+    client.post(f"/ssl-{callback}", data={"tran_id": f"ORDER_{order_id}_1"})
+    assert stock_of(product_id) == 5
+    assert bill_status(order_id) == status
+
+    # A second callback finds nothing left to release.
+    client.post(f"/ssl-{callback}", data={"tran_id": f"ORDER_{order_id}_1"})
+    assert stock_of(product_id) == 5
+
+    response = client.post(
+        "/initiate-payment", json={"order_id": order_id}, headers=AUTH
+    )
+    assert response.status_code == 400
+
+
+def test_expired_reservations_are_swept(client):
+    product_id = stock_product(5)
+    expired = place_order(client, product_id, 2)
+    live = place_order(client, product_id, 1)
+    db = TestingSessionLocal()
+    db.execute(
+        update(models.StockReservation)
+        .filter_by(order_id=expired)
+        .values(expires_at=func.now() - timedelta(seconds=1))
+    )
+    db.commit()
+    db.close()
+
+    async def sweep():
+        async with TestingAsyncSessionLocal() as db:
+            return await release_expired(db)
+
+    assert asyncio.run(sweep()) == 1
+    assert stock_of(product_id) == 4
+    assert bill_status(expired) == "Expired"
+    assert bill_status(live) == "Pending"
+
+
+def expire(order_id: int):
+    db = TestingSessionLocal()
+    db.execute(
+        update(models.StockReservation)
+        .filter_by(order_id=order_id)
+        .values(expires_at=func.now() - timedelta(seconds=1))
+    )
+    db.commit()
+    db.close()
+
+    async def sweep():
+        async with TestingAsyncSessionLocal() as db:
+            return await release_expired(db)
+
+    assert asyncio.run(sweep()) == 1
+
+
+def paid(order_id: int) -> dict:
+    return {"tran_id": f"ORDER_{order_id}_1", "card_type": "VISA-Dutch Bangla"}
+
+
+def test_late_payment_retakes_released_stock(client, monkeypatch):
+    notified = []
+
+    async def send_email(to, subject, body):
+        notified.append(to)
+
+    monkeypatch.setattr(paybill, "send_email", send_email)
+    monkeypatch.setattr(paybill, "send_sms", lambda to, text: notified.append(to))
+    product_id = stock_product(5)
+    order_id = place_order(client, product_id, 3)
+    expire(order_id)
+    assert stock_of(product_id) == 5
+
+    # The stock is still there, so the late payment takes it again.
+    client.post("/ssl-success", data=paid(order_id))
+    assert bill_status(order_id) == "Confirmed"
+    assert stock_of(product_id) == 2
+    assert notified
+
+
+def test_late_payment_for_sold_stock_is_flagged_for_refund(client):
+    product_id = stock_product(5)
+    late = place_order(client, product_id, 3)
+    expire(late)
+    place_order(client, product_id, 4)  # the released units sell again
+    assert stock_of(product_id) == 1
+
+    response = client.post("/ssl-success", data=paid(late))
+    assert response.json() == {"message": PAYMENT_REFUND_DUE}
+    assert bill_status(late) == "Refund Due"
+    assert stock_of(product_id) == 1
+    # A repeated callback does not try again.
+    client.post("/ssl-success", data=paid(late))
+    assert bill_status(late) == "Refund Due"
+    assert stock_of(product_id) == 1
+
+
+def test_concurrent_reservations_never_oversell(client):
+    product_id = stock_product(5)
+    db = TestingSessionLocal()
+    product = db.get(models.Product, product_id)
+    customer = db.scalar(select(models.User).filter_by(username="buyer"))
+    db.close()
+
+    async def checkout():
+        async with TestingAsyncSessionLocal() as session:
+            order = models.Order(user_id=customer.user_id, status="Pending")
+            session.add(order)
+            await session.flush()
+            try:
+                await reserve_stock(
+                    session, order.order_id, {product_id: product}, {product_id: 1}
+                )
+            except HTTPException:
+                return False
+            await session.commit()
+            return True
+
+    async def rush():
+        return await asyncio.gather(*(checkout() for _ in range(12)))
+
+    assert sum(asyncio.run(rush())) == 5
+    assert stock_of(product_id) == 0
@@ -0,0 +1,157 @@
+from sqlalchemy import select
+
+from app import models
+from app.ai.routers import search
+from app.ai.utils import product_index, query_parser
+from app.ai.utils.product_index import ProductDoc, ProductIndex
+from app.ai.utils.pg_search import (
+    fulltext_search,
+    fuzzy_search,
+    keyword_terms,
+    to_tsquery_text,
+)
+from tests.conftest import TestingSessionLocal
+
+
+def test_tsquery_text_escapes_operators():
+    terms = keyword_terms(["Jamdani saree"], {"Jamdani saree": ["sari's"]})
+    assert to_tsquery_text(terms) == "('jamdani':* & 'saree':*) | ('sari':* & 's':*)"
+    assert to_tsquery_text(["&|!"]) == ""
+
+
+def test_search_runs_in_database(db_session):
+    artisan = models.User(username="maker", email="maker@example.com", role="artisan")
+    db_session.add(artisan)
+    db_session.flush()
+    brand = models.Brand(user_id=artisan.user_id, brand_name="Tant Ghor")
+    db_session.add(brand)
+    db_session.flush()
+
+    def product(name, category, description=None):
+        return models.Product(
+            brand_id=brand.brand_id,
+            product_name=name,
+            category=category,
+            description=description,
+            product_pic=[],
+            product_video=[],
+            price=1000,
+            approved=True,
+        )
+
+    in_name = product("Jamdani saree", "saree")
+    in_description = product("Festive wrap", "clothing", "Hand woven jamdani")
+    misspelt = product("Nakshi kantha", "quilt")
+    unrelated = product("Clay pot", "pottery")
+    db_session.add_all([in_name, in_description, misspelt, unrelated])
+    db_session.flush()
+
+    query = select(models.Product).filter(models.Product.approved == True)
+    found = db_session.scalars(fulltext_search(query, ["jamdani"])).all()
+    # The name carries more weight than the description.
+    assert found == [in_name, in_description]
+    found = db_session.scalars(fulltext_search(query, ["jamdani"], limit=1)).all()
+    assert found == [in_name]
+    first = db_session.execute(fulltext_search(query, ["jamdani"], limit=1)).one()
+    after = (first.score, first.Product.product_id)
+    found = db_session.scalars(fulltext_search(query, ["jamdani"], after=after)).all()
+    assert found == [in_description]
+
+    assert db_session.scalars(fulltext_search(query, ["nakshi kanta"])).all() == []
+    found = db_session.scalars(fuzzy_search(query, ["nakshi kanta"])).all()
+    assert found == [misspelt]
+
+    assert db_session.scalars(fulltext_search(query, [])).all() == []
+    assert db_session.scalars(fuzzy_search(query, [])).all() == []
+
+
+def add_jamdani_products():
+    db = TestingSessionLocal()
+    artisan = models.User(username="maker", email="maker@example.com", role="artisan")
+    db.add(artisan)
+    db.flush()
+    brand = models.Brand(user_id=artisan.user_id, brand_name="Tant Ghor")
+    db.add(brand)
+    db.flush()
+    db.add_all(
+        models.Product(
+            brand_id=brand.brand_id,
+            product_name=name,
+            category="saree",
+            description="hand woven jamdani",
+            product_pic=[],
+            product_video=[],
+            price=1000,
+            approved=True,
+        )
+        for name in ["Jamdani saree"] * 3 + ["Festive wrap", "Silk stole"]
+    )
+    db.commit()
+    db.close()
+
+
+def walk_pages(client, q, limit):
+    """Every (score, product_id) hit of ``q`` by following next_cursor, and
+    how many pages that took."""
+    hits, cursor, pages = [], None, 0
+    while True:
+        pages += 1
+        params = {"q": q, "limit": limit, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/search/", params=params).json()
+        assert len(page["products"]) == page["count"] <= limit
+        hits += [(p["score"], p["product_id"]) for p in page["products"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return hits, pages
+
+
+def no_llm_search(monkeypatch):
+    async def no_llm(query):
+        raise AssertionError(f"LLM called for {query!r}")
+
+    monkeypatch.setattr(search, "cached_keywords", no_llm)
+    monkeypatch.setattr(query_parser, "_vocabulary", None)
+
+
+def test_search_pages_by_cursor(client, monkeypatch):
+    """Walking next_cursor returns every match once, best first."""
+    add_jamdani_products()
+    no_llm_search(monkeypatch)
+
+    def timed(stage):
+        return search.stage_time[stage].snapshot()["count"]
+
+    before = {stage: timed(stage) for stage in search.SEARCH_STAGES}
+    hits, pages = walk_pages(client, "jamdani", 2)
+
+    assert len(hits) == 5
+    assert hits == sorted(hits, key=lambda hit: (-hit[0], hit[1]))
+    # Postgres matches while fetching; nothing went to the LLM.
+    assert {stage: timed(stage) - before[stage] for stage in before} == {
+        "llm": 0,
+        "fetch": pages,
+        "match": 0,
+        "serialize": pages,
+    }
+    params = {"q": "jamdani", "cursor": "not-a-cursor"}
+    assert client.get("/search/", params=params).status_code == 400
+
+
+def test_stale_index_entries_do_not_end_the_pages(client, monkeypatch):
+    """Ids the in-memory index still holds but the database no longer
+    returns are ranked past, not counted as the end of the matches."""
+    index = ProductIndex()
+    # Like the real Jamdani sarees, so it ties with them and comes first by id.
+    stale = ProductDoc.from_row(
+        "Jamdani saree", "saree", "hand woven jamdani", 1, 1000, True
+    )
+    index.add(0, stale)
+    monkeypatch.setattr(product_index, "index", index)
+    monkeypatch.setattr(search, "SEARCH_BACKEND", "memory")
+    add_jamdani_products()  # committed, so the index picks them up
+    no_llm_search(monkeypatch)
+
+    hits, pages = walk_pages(client, "jamdani", 2)
+    assert len(hits) == 5
+    assert all(product_id > 0 for _, product_id in hits)
+    assert hits == sorted(hits, key=lambda hit: (-hit[0], hit[1]))
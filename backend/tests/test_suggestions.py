@@ -0,0 +1,118 @@
+import random
+
+from app import models
+from app.ai.utils import suggestions
+from app.ai.utils.normalization import normalize
+from app.ai.utils.suggestions import Suggestions, prefix_keys
+from tests.conftest import TestingSessionLocal
+
+ROWS = [
+    # product_id, name, category, brand_id, approved, brand_name, units sold
+    (1, "Jamdani saree", "Saree", 1, True, "Tant Ghor", 0),
+    (2, "Silk jamdani saree", "Saree", 1, True, "Tant Ghor", 5),
+    (3, "Jute basket", "Basket", 2, True, "Jute Works", 1),
+    (4, "Jamdani orna", "Orna", 2, False, "Jute Works", 50),
+]
+
+
+def texts(found):
+    return [suggestion["text"] for suggestion in found]
+
+
+def test_suggestions_rank_by_popularity():
+    index = Suggestions.from_rows(ROWS)
+    assert texts(index.suggest("jam")) == ["Silk jamdani saree", "Jamdani saree"]
+    # Word starts match too; the category counts both its sarees.
+    assert texts(index.suggest("SA")) == [
+        "Saree",
+        "Silk jamdani saree",
+        "Jamdani saree",
+    ]
+    assert index.suggest("tant") == [{"text": "Tant Ghor", "kind": "brand"}]
+    assert index.suggest("jute", limit=1) == [{"text": "Jute Works", "kind": "brand"}]
+    assert index.suggest("") == [] and index.suggest("zzz") == []
+
+    index.set_product(3, "Jamdani basket", "Basket", 2, True)  # new text
+    assert texts(index.suggest("jamdani b")) == ["Jamdani basket"]
+    assert "Jute basket" not in texts(index.suggest("ju"))
+    index.remove_product(2)
+    assert texts(index.suggest("silk")) == []
+    index.set_brand(1, "Nakshi Ghor")
+    assert texts(index.suggest("ghor")) == ["Nakshi Ghor"]
+
+    # Past the key length, the rest of the prefix is checked on the text.
+    index.set_product(5, "Hand woven nakshi kantha quilt, red border", "Quilt", 2, 1)
+    long_prefix = "woven nakshi kantha quilt, red bor"
+    assert texts(index.suggest(long_prefix)) == [
+        "Hand woven nakshi kantha quilt, red border"
+    ]
+    assert index.suggest(long_prefix + "x") == []
+
+
+def brute_force(index, prefix, limit):
+    prefix = normalize(prefix)
+    live = [
+        entry
+        for entry, text in enumerate(index.texts)
+        if index.weights[entry] > 0
+        and any(key.startswith(prefix) for key in prefix_keys(normalize(text)))
+    ]
+    live.sort(key=lambda entry: (-index.weights[entry], index.texts[entry]))
+    return [index.texts[entry] for entry in live[:limit]]
+
+
+def test_suggestions_match_a_full_scan_through_updates():
+    rng = random.Random(3)
+    words = "jamdani saree silk jute basket nakshi kantha clay pot brass".split()
+
+    def name():
+        return " ".join(rng.choices(words, k=3))
+
+    rows = [
+        (i, name(), rng.choice(words), i % 7, rng.random() > 0.1, f"brand {i % 7}", 0)
+        for i in range(3000)
+    ]
+    index = Suggestions.from_rows(rows)
+    for step in range(300):
+        product_id = rng.randrange(3200)
+        if step % 5 == 0:
+            index.remove_product(product_id)
+        else:
+            index.set_product(product_id, name(), rng.choice(words), 1, True)
+        if step % 50 == 0:
+            index.set_brand(rng.randrange(7), f"brand {rng.choice(words)}")
+    for prefix in ["j", "jamdani s", "sa", "kantha clay", "brand", "pot b", "x"]:
+        assert texts(index.suggest(prefix, 10)) == brute_force(index, prefix, 10)
+
+
+def test_suggest_endpoint(client, monkeypatch):
+    monkeypatch.setattr(suggestions, "_suggestions", None)
+    db = TestingSessionLocal()
+    artisan = models.User(username="maker", email="maker@example.com", role="artisan")
+    db.add(artisan)
+    db.flush()
+    brand = models.Brand(user_id=artisan.user_id, brand_name="Tant Ghor")
+    db.add(brand)
+    db.flush()
+    db.add(
+        models.Product(
+            brand_id=brand.brand_id,
+            product_name="Jamdani saree",
+            category="saree",
+            product_pic=[],
+            product_video=[],
+            price=1000,
+            approved=True,
+        )
+    )
+    db.commit()
+    db.close()
+
+    response = client.get("/search/suggest", params={"q": "jamd"})
+    assert response.status_code == 200
+    assert response.json()["suggestions"] == [
+        {"text": "Jamdani saree", "kind": "product"}
+    ]
+    params = {"q": "jamd", "limit": 50}
+    assert client.get("/search/suggest", params=params).status_code == 422
+    assert client.get("/search/suggest", params={"q": ""}).status_code == 422
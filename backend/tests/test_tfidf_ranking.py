@@ -0,0 +1,80 @@
+from collections import namedtuple
+
+from app import models
+from app.ai.routers import search
+from app.ai.utils import tfidf_ranking
+from app.ai.utils.product_index import load_query
+from app.ai.utils.query_parser import ParsedQuery
+from app.ai.utils.tfidf_ranking import TfidfRanking
+from tests.conftest import TestingSessionLocal
+
+Row = namedtuple(
+    "Row",
+    "product_id product_name category description brand_id price approved brand_name",
+)
+
+
+def row(product_id, name, category="saree", description=None, price=1000, **kw):
+    fields = dict(brand_id=1, approved=True, brand_name="Tant Ghor")
+    fields.update(kw)
+    return Row(product_id, name, category, description, price=price, **fields)
+
+
+def test_rank_scores_filters_and_limits():
+    ranking = TfidfRanking(
+        [
+            row(1, "Jamdani saree", description="handwoven jamdani"),
+            row(2, "Silk saree", description="jamdani border"),
+            row(3, "Clay pot", category="pottery", price=300, brand_name="Kumar"),
+            row(4, "Jamdani saree", approved=False),
+        ]
+    )
+    assert len(ranking) == 3
+
+    ranked = ranking.rank(["jamdani saree"])
+    assert [product_id for product_id, _ in ranked] == [1, 2]
+    assert 1 >= ranked[0][1] > ranked[1][1] > 0
+    assert ranking.rank(["jamdani saree"], limit=1) == ranked[:1]
+    assert ranking.rank(["saree", "pot"], category="Pottery")[0][0] == 3
+    assert [p for p, _ in ranking.rank(["saree pot"], price_range=[0, 500])] == [3]
+    assert [p for p, _ in ranking.rank(["saree pot"], brand="tant")] == [1, 2]
+    assert ranking.rank(["muslin"]) == []
+    assert TfidfRanking([]).rank(["jamdani"]) == []
+
+
+def test_search_returns_scores(client, clean_tables, monkeypatch):
+    db = TestingSessionLocal()
+    artisan = models.User(username="maker", email="maker@example.com", role="artisan")
+    db.add(artisan)
+    db.flush()
+    brand = models.Brand(user_id=artisan.user_id, brand_name="Tant Ghor", logo="")
+    db.add(brand)
+    db.flush()
+    for name in ("Jamdani saree", "Silk saree", "Jamdani dupatta"):
+        db.add(
+            models.Product(
+                brand_id=brand.brand_id,
+                product_name=name,
+                category="saree",
+                product_pic=[],
+                product_video=[],
+                price=1500,
+                approved=True,
+            )
+        )
+    db.commit()
+    ranking = TfidfRanking(db.execute(load_query()).all())
+    db.close()
+
+    async def local_parse(query):
+        return ParsedQuery(["jamdani", "saree"], None, None, None, 1.0).as_filters()
+
+    monkeypatch.setattr(search, "SEARCH_BACKEND", "tfidf")
+    monkeypatch.setattr(search, "cached_keywords", local_parse)
+    monkeypatch.setattr(tfidf_ranking, "ranking", ranking)
+
+    response = client.get("/search/", params={"q": "jamdani saree", "limit": 2})
+    assert response.status_code == 200
+    products = response.json()["products"]
+    assert [p["name"] for p in products] == ["Jamdani saree", "Jamdani dupatta"]
+    assert products[0]["score"] > products[1]["score"] > 0
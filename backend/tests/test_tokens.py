@@ -0,0 +1,67 @@
+import pytest
+
+from app import models, utils
+from tests.conftest import TestingSessionLocal
+from tests.test_principals import count_queries
+
+
+@pytest.fixture
+def stateless(monkeypatch):
+    monkeypatch.setattr(utils, "STATELESS_TOKENS", True)
+
+
+def seed_user(role="customer"):
+    db = TestingSessionLocal()
+    user = models.User(username="buyer", email="buyer@example.com", role=role)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    token = utils.create_user_token(user)
+    db.close()
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_claims_authorize_without_a_user_query(client, stateless):
+    auth = seed_user()
+    # The first request loads the token version, later ones hit the cache.
+    client.get("/orders/me", headers=auth)
+    response, queries = count_queries(client, "get", "/orders/me", auth)
+    assert response.status_code == 404
+    assert queries == 1  # the orders query itself
+
+
+def test_role_change_revokes_stateless_tokens(client, stateless):
+    auth = seed_user()
+    response = client.put("/become-artisan", headers=auth)
+    assert response.status_code == 200
+    assert client.get("/orders/me", headers=auth).json()["detail"] == (
+        utils.TOKEN_REVOKED
+    )
+
+    fresh = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = client.put("/become-artisan", headers=fresh)
+    assert response.json()["detail"] == "You are already an artisan"
+
+
+def test_logout_revokes_stateless_tokens(client, stateless):
+    auth = seed_user()
+    assert client.post("/logout", headers=auth).status_code == 200
+    response = client.get("/profile", headers=auth)
+    assert response.status_code == 401
+    assert response.json()["detail"] == utils.TOKEN_REVOKED
+
+
+def test_admin_role_comes_from_the_claims(client, stateless):
+    auth = seed_user(role="admin")
+    response, queries = count_queries(client, "get", "/admin/users", auth)
+    assert response.status_code == 200
+    # The token version and the page; no user lookup.
+    assert queries == 2
+
+
+def test_tokens_without_claims_still_work(client):
+    auth = seed_user()
+    assert client.get("/orders/me", headers=auth).status_code == 404
+    assert client.get("/profile", headers=auth).json()["email"] == (
+        "buyer@example.com"
+    )